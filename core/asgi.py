@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Em produção é servido pelo gunicorn com workers do uvicorn (ver render.yaml),
+para que as views assíncronas (painel-terapeuta-async/ e painel-paciente-async/)
+corram no event loop sem ocupar uma thread por pedido.
 """
 
 import os
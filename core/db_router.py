@@ -0,0 +1,36 @@
+"""
+Encaminhamento das apps para as bases de dados configuradas em DATABASES.
+
+As tabelas da app 'ia' (conversas, embeddings, pesquisa, arquivo) ficam no
+alias 'ia' quando IA_DATABASE_URL está definido; caso contrário tudo continua
+em 'default'. As relações entre 'ia' e 'usuarios' são guardadas por id, sem
+chaves estrangeiras na base de dados (db_constraint=False), e as consultas que
+cruzam as duas bases materializam as listas de ids antes de filtrar.
+"""
+from django.conf import settings
+
+APPS_IA = {'ia'}
+
+
+def alias_ia():
+    return 'ia' if 'ia' in settings.DATABASES else 'default'
+
+
+class RoteadorIA:
+    def _alias(self, model):
+        return alias_ia() if model._meta.app_label in APPS_IA else 'default'
+
+    def db_for_read(self, model, **hints):
+        return self._alias(model)
+
+    def db_for_write(self, model, **hints):
+        return self._alias(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Conversa.usuario e EstadoRiscoPaciente.usuario apontam para a outra base por id
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label in APPS_IA:
+            return db == alias_ia()
+        return db == 'default'
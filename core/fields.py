@@ -0,0 +1,109 @@
+"""
+Campos de modelo partilhados entre as apps.
+"""
+import zlib
+
+from django.db import models
+
+# Primeiro byte de cada valor guardado: indica como o resto foi codificado.
+# Os formatos e os dicionários são permanentes: um dicionário novo tem de
+# receber um byte novo, nunca substituir um existente.
+SEM_COMPRESSAO = 0
+ZLIB_DICIONARIO_V1 = 1
+
+# Dicionário de pré-carga do zlib com o vocabulário frequente dos textos da
+# plataforma (conversas com a IA, mensagens, relatórios e notas de sessão).
+# O zlib dá prioridade ao fim do dicionário: as sequências mais frequentes ficam
+# no fim. Para propor um dicionário treinado sobre os dados reais, use
+# benchmark_compressao --mostrar-dicionario e registe-o como um formato novo.
+DICIONARIO_V1 = ' '.join([
+    "acompanhamento psicológico", "técnicas de respiração", "exercício de relaxamento",
+    "rede de apoio", "autoestima", "autocuidado", "terapia cognitivo-comportamental",
+    "pensamentos automáticos", "crise de pânico", "ataque de ansiedade", "insónia", "insônia",
+    "dificuldade para dormir", "não consigo dormir", "falta de sono", "pesadelos",
+    "relacionamento", "namorado", "namorada", "marido", "esposa", "minha mãe", "meu pai",
+    "família", "trabalho", "faculdade", "escola", "emprego", "chefe", "amigos",
+    "sessão", "próxima sessão", "evolução do paciente", "queixa principal",
+    "humor deprimido", "tristeza", "angústia", "medo", "raiva", "culpa", "vergonha",
+    "solidão", "cansaço", "desânimo", "preocupação", "nervoso", "ansiosa", "ansioso",
+    "estou me sentindo", "me sinto", "eu sinto", "não sei", "não consigo", "parece que",
+    "às vezes", "todos os dias", "ultimamente", "muito tempo", "de novo", "mais uma vez",
+    "Obrigado por compartilhar", "Obrigada por compartilhar", "é compreensível que",
+    "é normal sentir", "você não está sozinho", "você não está sozinha",
+    "procure ajuda profissional", "converse com o seu terapeuta", "converse com seu terapeuta",
+    "Como você está se sentindo", "o que você sente", "Você gostaria de", "Que tal tentar",
+    "pode ajudar", "pode ser útil", "respire fundo", "um passo de cada vez", "cuidar de si",
+    "cuidar de você", "seus sentimentos", "suas emoções", "seus pensamentos", "sua saúde mental",
+    "Estou aqui para", "estou aqui para ouvir", "Entendo que", "Sinto muito que",
+    "ansiedade", "você", "para", "porque", "quando", "muito", "também", "ainda", "sobre",
+    "mais", "isso", "como", "está", "estou", "com", "que", "não", "uma", "por", "de ", "a ",
+    "o ", "e ", "é ",
+]).encode('utf-8')
+
+_DICIONARIOS = {ZLIB_DICIONARIO_V1: DICIONARIO_V1}
+
+
+def comprimir(texto, limiar=128, nivel=6):
+    """Codifica um texto com o prefixo de formato; textos curtos ficam sem compressão."""
+    dados = texto.encode('utf-8')
+    if len(dados) >= limiar:
+        compressor = zlib.compressobj(nivel, zlib.DEFLATED, -15, zdict=DICIONARIO_V1)
+        comprimido = compressor.compress(dados) + compressor.flush()
+        if len(comprimido) < len(dados):
+            return bytes([ZLIB_DICIONARIO_V1]) + comprimido
+    return bytes([SEM_COMPRESSAO]) + dados
+
+
+def descomprimir(dados):
+    dados = bytes(dados)  # O PostgreSQL devolve memoryview
+    if not dados:
+        return ''
+    formato, corpo = dados[0], dados[1:]
+    if formato == SEM_COMPRESSAO:
+        return corpo.decode('utf-8')
+    if formato in _DICIONARIOS:
+        return zlib.decompressobj(-15, zdict=_DICIONARIOS[formato]).decompress(corpo).decode('utf-8')
+    raise ValueError(f"Formato de texto comprimido desconhecido: {formato}.")
+
+
+class CampoTextoComprimido(models.TextField):
+    """
+    TextField guardado numa coluna binária, comprimido com zlib e um
+    dicionário pré-treinado quando o texto tem pelo menos 'limiar' bytes.
+
+    Em Python, nos formulários e nos serializers o valor continua a ser uma
+    string. A descompressão acontece ao ler a coluna; as consultas que não
+    mostram o texto devem usar .only()/.defer() para não o carregar.
+    Os filtros de texto (icontains, etc.) não funcionam sobre a coluna
+    comprimida: use a pesquisa de texto integral (ia/busca.py).
+    """
+
+    def __init__(self, *args, limiar=128, **kwargs):
+        self.limiar = limiar
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.limiar != 128:
+            kwargs['limiar'] = self.limiar
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return descomprimir(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return descomprimir(value)
+        return super().to_python(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return None
+        return connection.Database.Binary(comprimir(value, self.limiar))
@@ -0,0 +1,69 @@
+"""
+Utilitários partilhados pelas migrações de dados.
+
+As conversões de tabelas grandes são feitas em lotes de chaves primárias,
+cada um na sua própria transação, para não bloquear a tabela durante toda
+a migração. Use-os em migrações com atomic = False.
+"""
+from django.db import transaction
+
+
+def atualizar_em_lotes(modelo, lote=10000, filtro=None, **atualizacoes):
+    """
+    Executa modelo.objects.filter(...).update(**atualizacoes) por intervalos
+    de chave primária de tamanho 'lote'. Devolve o número de linhas alteradas.
+    Pode ser interrompido e executado de novo se 'filtro' excluir as linhas
+    já convertidas.
+    """
+    manager = modelo._base_manager
+    consulta = manager.filter(**(filtro or {}))
+    limites = consulta.order_by('pk').values_list('pk', flat=True)
+    primeiro = limites.first()
+    if primeiro is None:
+        return 0
+    ultimo = consulta.order_by('-pk').values_list('pk', flat=True).first()
+
+    total = 0
+    inicio = primeiro
+    while inicio <= ultimo:
+        with transaction.atomic(using=manager.db):
+            total += consulta.filter(pk__gte=inicio, pk__lt=inicio + lote).update(**atualizacoes)
+        inicio += lote
+    return total
+
+
+
+def processar_em_lotes(consulta, funcao, lote=1000):
+    """
+    Percorre 'consulta' (um values_list cuja primeira coluna é a chave primária)
+    por ordem de pk e chama funcao(linhas) para cada lote de 'lote' linhas.
+    Cada lote é lido com select_for_update e processado na sua própria transação.
+    Devolve o número de linhas processadas.
+    """
+    consulta = consulta.order_by('pk')
+    total = 0
+    ultimo = None
+    while True:
+        pagina = consulta if ultimo is None else consulta.filter(pk__gt=ultimo)
+        with transaction.atomic(using=consulta.db):
+            linhas = list(pagina.select_for_update()[:lote])
+            if not linhas:
+                break
+            funcao(linhas)
+        total += len(linhas)
+        ultimo = linhas[-1][0]
+    return total
+
+
+def copiar_coluna_em_lotes(modelo, origem, destino, lote=1000):
+    """
+    Copia o valor de 'origem' para 'destino' nas linhas em que 'destino' ainda é
+    nulo, gravando através do campo de destino (que pode converter o valor).
+    Pode ser interrompido e executado de novo.
+    """
+    manager = modelo._base_manager
+
+    def copiar(linhas):
+        manager.bulk_update([modelo(pk=pk, **{destino: valor}) for pk, valor in linhas], [destino])
+
+    return processar_em_lotes(manager.filter(**{f'{destino}__isnull': True}).values_list('pk', origem), copiar, lote)
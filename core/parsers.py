@@ -0,0 +1,41 @@
+"""
+Parser JSON da API com orjson.
+
+Aceita o mesmo que o JSONParser do DRF e devolve os mesmos valores. Um corpo
+que o orjson recuse (JSON inválido, NaN/Infinity, números fora do double) volta
+a ser lido pelo JSONParser do DRF, que dá a resposta de sempre: o valor ou o
+mesmo ParseError. Vão diretamente para o JSONParser do DRF os corpos noutra
+codificação que não UTF-8 e os que têm 19 ou mais algarismos seguidos, porque
+o orjson lê os inteiros fora dos 64 bits como float e o json da biblioteca
+padrão mantém-nos exatos.
+"""
+import codecs
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Procurar 19 zeros depois de trocar todos os algarismos por '0' é bem mais rápido que uma regex \d{19}
+ALGARISMOS_PARA_ZERO = bytes.maketrans(b'123456789', b'000000000')
+INTEIRO_LONGO = b'0' * 19
+
+
+class JSONRapidoParser(JSONParser):
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        corpo = stream.read()
+        if INTEIRO_LONGO in corpo.translate(ALGARISMOS_PARA_ZERO):
+            return super().parse(io.BytesIO(corpo), media_type, parser_context)
+        try:
+            return orjson.loads(corpo)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(corpo), media_type, parser_context)
@@ -0,0 +1,42 @@
+"""
+Renderer JSON da API com orjson.
+
+O resultado é o do JSONRenderer do DRF (compacto, UTF-8, U+2028/U+2029
+escapados, datas ISO 8601 com 'Z' para UTC). Os tipos que o orjson não
+conhece (timedelta, Decimal, textos traduzíveis lazy, bytes, querysets) passam
+pelo JSONEncoder do DRF, com a mesma representação de sempre.
+
+Única diferença: floats muito grandes ou muito pequenos saem sem '+' e sem
+zeros no expoente (1e16 em vez de 1e+16, 0.00005 em vez de 5e-05), com o
+mesmo valor.
+
+Sem o orjson instalado, com indentação pedida (Accept: application/json;
+indent=4) ou se o orjson recusar os dados (inteiros com mais de 64 bits), a
+resposta é gerada pelo JSONRenderer do DRF.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = encoders.JSONEncoder()
+
+
+class JSONRapidoRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None
+            or self.ensure_ascii or not self.compact or self.encoder_class is not encoders.JSONEncoder
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            corpo = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Como o DRF: separadores de linha e de parágrafo escapados, por segurança em <script>
+        return corpo.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,69 @@
+"""
+Serializers partilhados entre as apps.
+"""
+from rest_framework import serializers
+
+
+PARAMETROS_DE_CAMPOS = ('fields', 'exclude', 'expand')
+
+
+def campos_pedidos(query_params):
+    """fields/exclude/expand pedidos na query string, como frozensets (só os presentes)."""
+    return {
+        parametro: frozenset(filter(None, query_params[parametro].split(',')))
+        for parametro in PARAMETROS_DE_CAMPOS
+        if parametro in query_params
+    }
+
+
+def _topo(caminhos):
+    return {caminho.split('.', 1)[0] for caminho in caminhos}
+
+
+def _dentro(caminhos, nome):
+    """Os caminhos 'nome.x.y' de um conjunto, sem o prefixo 'nome.'."""
+    return frozenset(caminho.split('.', 1)[1] for caminho in caminhos if caminho.startswith(f'{nome}.'))
+
+
+class CamposDinamicosMixin:
+    """
+    Serializer com os campos escolhidos por quem o cria (na API, pelos
+    parâmetros ?fields=, ?exclude= e ?expand=, separados por vírgulas):
+
+        fields   só estes campos; 'paciente.nome_completo' escolhe dentro de um objeto aninhado
+        exclude  sem estes campos, também com caminhos como 'paciente.historico_medico'
+        expand   quando indicado (mesmo vazio), só os objetos aninhados listados vêm completos
+                 e os outros vêm como id; 'paciente.terapeuta' expande dentro do paciente
+
+    Sem nenhum dos três, o serializer fica como está declarado. Um nome que não
+    seja um campo do serializer dá ValidationError.
+    """
+
+    def __init__(self, *args, fields=None, exclude=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None or exclude is not None or expand is not None:
+            self.restringir_campos(fields, exclude, expand)
+
+    def restringir_campos(self, fields=None, exclude=None, expand=None):
+        campos = self.fields
+        desconhecidos = _topo(set(fields or ()) | set(exclude or ()) | set(expand or ())) - set(campos)
+        if desconhecidos:
+            raise serializers.ValidationError({'detail': f"Campos desconhecidos: {', '.join(sorted(desconhecidos))}."})
+
+        for nome in list(campos):
+            if (fields is not None and nome not in _topo(fields)) or (exclude is not None and nome in exclude):
+                campos.pop(nome)
+
+        for nome, campo in list(campos.items()):
+            if not isinstance(campo, serializers.Serializer):
+                continue
+            if expand is not None and nome not in _topo(expand):
+                opcoes = {'source': campo.source} if campo.source != nome else {}
+                campos[nome] = serializers.PrimaryKeyRelatedField(read_only=True, **opcoes)
+                continue
+            # 'paciente' em fields traz o objeto inteiro; só 'paciente.x' escolhe dentro dele
+            sub_fields = _dentro(fields, nome) if fields is not None and nome not in fields else None
+            sub_exclude = _dentro(exclude, nome) if exclude is not None else None
+            sub_expand = _dentro(expand, nome) if expand is not None else None
+            if isinstance(campo, CamposDinamicosMixin) and (sub_fields or sub_exclude or sub_expand is not None):
+                campo.restringir_campos(sub_fields, sub_exclude or None, sub_expand)
@@ -132,6 +132,35 @@ DATABASES = {
     )
 }
 
+# Base de dados própria para as tabelas da app 'ia' (conversas com a IA), opcional.
+# Com IA_DATABASE_URL definido, execute também 'python manage.py migrate --database=ia'.
+IA_DATABASE_URL = os.getenv('IA_DATABASE_URL')
+if IA_DATABASE_URL:
+    DATABASES['ia'] = dj_database_url.parse(
+        IA_DATABASE_URL,
+        conn_max_age=600,
+        ssl_require=not DEBUG and not IA_DATABASE_URL.startswith('sqlite'),
+    )
+DATABASE_ROUTERS = ['core.db_router.RoteadorIA']
+
+# --- Cache ---
+# Em produção, defina REDIS_URL para que o cache seja partilhado entre os workers do gunicorn.
+# Sem REDIS_URL, cada processo usa o seu próprio cache em memória.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # --- Validadores de Senha ---
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -225,6 +254,9 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
 ]
 
+# Cabeçalhos de resposta que o frontend pode ler (paginação por cursor)
+CORS_EXPOSE_HEADERS = ['X-Proximo-Cursor', 'Link', 'Content-Disposition', 'X-Cache']
+
 CORS_ALLOW_METHODS = [
     'DELETE', 'GET', 'OPTIONS', 'PATCH', 'POST', 'PUT',
 ]
@@ -236,6 +268,16 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # JSON com orjson, no mesmo formato do DRF (ver core/renderers.py e core/parsers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.JSONRapidoRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.JSONRapidoParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -250,6 +292,28 @@ AUTHENTICATION_BACKENDS = [
 
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 
+# Conversas com mais de IA_RETENCAO_MESES meses completos são movidas para o
+# arquivo comprimido pelo comando 'arquivar_conversas' (ver ia/arquivo.py).
+IA_RETENCAO_MESES = int(os.getenv('IA_RETENCAO_MESES', '12'))
+
+# Resumos semanais das conversas, gerados todas as noites pelo comando
+# 'resumir_conversas' (ver ia/resumos.py).
+IA_RESUMO_MODELO = os.getenv('IA_RESUMO_MODELO', 'openai/gpt-4o-mini')
+IA_RESUMO_ORCAMENTO_TOKENS = int(os.getenv('IA_RESUMO_ORCAMENTO_TOKENS', '6000'))
+# Preço do modelo em USD por milhão de tokens, só para o custo estimado de cada execução
+IA_RESUMO_CUSTO_ENTRADA = float(os.getenv('IA_RESUMO_CUSTO_ENTRADA', '0.15'))
+IA_RESUMO_CUSTO_SAIDA = float(os.getenv('IA_RESUMO_CUSTO_SAIDA', '0.60'))
+
+# Painéis assíncronos (/api/usuarios/painel-*-async/): consultas independentes de um
+# pedido em simultâneo, no máximo PAINEL_CONSULTAS_CONCORRENTES de cada vez, em
+# PAINEL_THREADS threads partilhadas pelo processo (cada uma com a sua ligação).
+PAINEL_CONSULTAS_CONCORRENTES = int(os.getenv('PAINEL_CONSULTAS_CONCORRENTES', '4'))
+PAINEL_THREADS = int(os.getenv('PAINEL_THREADS', '8'))
+
+# Listas dos ViewSets de usuarios montadas a partir de .values_list() em vez do
+# serializer (usuarios/leitura_rapida.py); o JSON é o mesmo nos dois casos.
+LEITURA_RAPIDA_LISTAS = os.getenv('LEITURA_RAPIDA_LISTAS', 'True').lower() == 'true'
+
 if not DEBUG:
     # Estas linhas de log só serão ativadas se DEBUG for False (ou seja, em produção)
     logger.info(f"DEBUG (final): {DEBUG}")
@@ -1,4 +1,5 @@
 from django.contrib import admin
-from .models import Conversa
+from .models import Conversa, EstadoRiscoPaciente
 
 admin.site.register(Conversa)  # Registra o modelo para ser gerido pelo admin do Django
+admin.site.register(EstadoRiscoPaciente)
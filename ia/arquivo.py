@@ -0,0 +1,133 @@
+"""
+Arquivo frio das conversas antigas.
+
+A tabela Conversa guarda apenas os últimos IA_RETENCAO_MESES meses completos.
+O comando arquivar_conversas move as conversas mais antigas, em lotes, para
+ArquivoConversas: uma linha por paciente e por mês com as conversas em NDJSON
+comprimido (gzip). Cada lote é acrescentado ao arquivo e removido da tabela na
+mesma transação, por isso o comando pode ser interrompido e executado de novo.
+
+As leituras do arquivo são opcionais (parâmetro incluir_arquivo do histórico
+e da exportação) e carregam um arquivo mensal de cada vez.
+"""
+import gzip
+import heapq
+import json
+from datetime import datetime, time
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import Conversa, ArquivoConversas
+
+CAMPOS = (
+    'id', 'usuario_id', 'data_conversa', 'sentimento', 'categoria_sentimento',
+    'intensidade_sentimento', 'mensagem_usuario', 'resposta_ia',
+)
+
+
+def _fuso():
+    return ZoneInfo(settings.TIME_ZONE)
+
+
+def mes_de(data):
+    """Primeiro dia do mês de uma data/hora, no fuso horário do projeto."""
+    return data.astimezone(_fuso()).date().replace(day=1)
+
+
+def corte_de_retencao(meses=None, agora=None):
+    """Início do mês mais antigo que continua na tabela Conversa."""
+    meses = settings.IA_RETENCAO_MESES if meses is None else meses
+    hoje = (agora or timezone.now()).astimezone(_fuso()).date()
+    indice = hoje.year * 12 + hoje.month - 1 - meses
+    return datetime.combine(hoje.replace(year=indice // 12, month=indice % 12 + 1, day=1), time.min, tzinfo=_fuso())
+
+
+def _comprimir(registos):
+    linhas = []
+    for registo in registos:
+        # isoformat() mantém os microssegundos, usados pelos cursores do histórico
+        linhas.append(json.dumps({**registo, 'data_conversa': registo['data_conversa'].isoformat()}, ensure_ascii=False))
+    return gzip.compress(('\n'.join(linhas) + '\n').encode('utf-8'))
+
+
+def ler(dados):
+    """Registos (dicionários com CAMPOS) de um arquivo, por ordem de id."""
+    for linha in gzip.decompress(bytes(dados)).decode('utf-8').splitlines():
+        registo = json.loads(linha)
+        registo['data_conversa'] = datetime.fromisoformat(registo['data_conversa'])
+        yield registo
+
+
+def arquivar(usuario_id, mes, registos):
+    """
+    Acrescenta os registos ao arquivo do paciente nesse mês e remove as
+    respetivas Conversas da tabela, numa só transação.
+    """
+    with transaction.atomic(using=router.db_for_write(ArquivoConversas)):
+        arquivo = ArquivoConversas.objects.select_for_update().filter(usuario_id=usuario_id, mes=mes).first()
+        todos = sorted([*(ler(arquivo.dados) if arquivo else ()), *registos], key=lambda r: r['id'])
+        if arquivo is None:
+            arquivo = ArquivoConversas(usuario_id=usuario_id, mes=mes)
+        arquivo.dados = _comprimir(todos)
+        arquivo.total = len(todos)
+        arquivo.primeiro_id = todos[0]['id']
+        arquivo.ultimo_id = todos[-1]['id']
+        arquivo.save()
+        Conversa.objects.filter(pk__in=[r['id'] for r in registos]).delete()
+
+
+def _dados(arquivo_id):
+    return ArquivoConversas.objects.filter(pk=arquivo_id).values_list('dados', flat=True).get()
+
+
+def conversas_do_usuario(usuario_id, desde=None, ate=None):
+    """
+    Conversas arquivadas de um paciente como instâncias de Conversa (não
+    gravadas), da mais recente para a mais antiga, mês a mês. 'desde' e 'ate'
+    limitam os meses lidos; o filtro exato por data fica a cargo de quem chama.
+    """
+    arquivos = ArquivoConversas.objects.filter(usuario_id=usuario_id)
+    if desde:
+        arquivos = arquivos.filter(mes__gte=mes_de(desde))
+    if ate:
+        arquivos = arquivos.filter(mes__lte=mes_de(ate))
+    for arquivo_id in arquivos.order_by('-mes').values_list('pk', flat=True):
+        registos = sorted(ler(_dados(arquivo_id)), key=lambda r: (r['data_conversa'], r['id']), reverse=True)
+        for registo in registos:
+            yield Conversa(**registo)
+
+
+def registos_por_id(usuario_ids, apos_id=0):
+    """
+    Registos arquivados dos pacientes por ordem crescente de id. Os arquivos
+    são abertos por ordem de primeiro_id e intercalados num heap, por isso só
+    estão em memória os arquivos cujos intervalos de ids se sobrepõem.
+    """
+    pendentes = (
+        ArquivoConversas.objects
+        .filter(usuario_id__in=usuario_ids, ultimo_id__gt=apos_id)
+        .order_by('primeiro_id')
+        .values_list('pk', 'primeiro_id')
+        .iterator()
+    )
+    proximo = next(pendentes, None)
+    abertos = []  # heap de (id do próximo registo, ordem, registo, restantes)
+    ordem = 0
+    while abertos or proximo:
+        while proximo and (not abertos or proximo[1] <= abertos[0][0]):
+            restantes = (r for r in ler(_dados(proximo[0])) if r['id'] > apos_id)
+            registo = next(restantes, None)
+            if registo:
+                heapq.heappush(abertos, (registo['id'], ordem, registo, restantes))
+                ordem += 1
+            proximo = next(pendentes, None)
+        if not abertos:
+            continue
+        _, ordem_atual, registo, restantes = heapq.heappop(abertos)
+        yield registo
+        seguinte = next(restantes, None)
+        if seguinte:
+            heapq.heappush(abertos, (seguinte['id'], ordem_atual, seguinte, restantes))
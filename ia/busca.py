@@ -0,0 +1,219 @@
+"""
+Pesquisa de texto integral unificada sobre Conversa, Mensagem e Relatorio.
+
+Cada registo pesquisável tem uma linha em DocumentoBusca com o texto
+normalizado (minúsculas, sem acentos), mantida em dia pelos sinais de
+gravação/remoção (ia/signals.py). Sobre essa coluna existe um índice de
+texto real, criado na migração conforme a base de dados:
+
+* PostgreSQL: índice GIN sobre to_tsvector('portuguese', texto);
+* SQLite: tabela virtual FTS5 'ia_documentobusca_fts' sincronizada por triggers.
+
+Noutras bases de dados a pesquisa recorre a icontains (sem índice).
+"""
+import re
+import unicodedata
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from usuarios.models import Mensagem, Relatorio, Paciente
+from .models import Conversa, DocumentoBusca
+
+CONFIGURACAO_PG = 'portuguese'
+TABELA_FTS = 'ia_documentobusca_fts'
+TAMANHO_TRECHO = 160
+
+_PALAVRA = re.compile(r"\w+", re.UNICODE)
+
+
+def normalizar(texto):
+    """Minúsculas e sem acentos, para pesquisas insensíveis a acentuação."""
+    texto = unicodedata.normalize('NFKD', (texto or '').lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+# --- Indexação ---
+
+def _documento_conversa(conversa):
+    return {
+        'paciente_id': conversa.usuario_id,
+        'remetente_id': None,
+        'destinatario_id': None,
+        'texto': normalizar(conversa.mensagem_usuario),
+        'data': conversa.data_conversa,
+    }
+
+
+def _documento_mensagem(mensagem):
+    return {
+        'paciente_id': None,
+        'remetente_id': mensagem.remetente_id,
+        'destinatario_id': mensagem.destinatario_id,
+        'texto': normalizar(f"{mensagem.assunto}\n{mensagem.conteudo}"),
+        'data': mensagem.data_envio,
+    }
+
+
+def _documento_relatorio(relatorio):
+    return {
+        'paciente_id': relatorio.paciente_id,
+        'remetente_id': relatorio.terapeuta_id,  # O autor do relatório
+        'destinatario_id': None,
+        'texto': normalizar(f"{relatorio.titulo}\n{relatorio.conteudo}"),
+        'data': relatorio.data_criacao,
+    }
+
+
+FONTES = {
+    'conversa': (Conversa, _documento_conversa),
+    'mensagem': (Mensagem, _documento_mensagem),
+    'relatorio': (Relatorio, _documento_relatorio),
+}
+TIPO_DO_MODELO = {modelo: tipo for tipo, (modelo, _) in FONTES.items()}
+
+
+def pesquisaveis(tipo):
+    """Registos de um tipo que entram na pesquisa (os rascunhos de relatório não entram)."""
+    modelo = FONTES[tipo][0]
+    return modelo.objects.filter(rascunho=False) if tipo == 'relatorio' else modelo.objects.all()
+
+
+def indexar(objeto):
+    """Cria ou atualiza o documento de pesquisa de um objeto."""
+    tipo = TIPO_DO_MODELO[type(objeto)]
+    if tipo == 'relatorio' and objeto.rascunho:
+        # Um resumo automático só fica pesquisável quando o terapeuta o publica
+        remover(objeto)
+        return
+    DocumentoBusca.objects.update_or_create(
+        tipo=tipo, objeto_id=objeto.pk, defaults=FONTES[tipo][1](objeto)
+    )
+
+
+def remover(objeto):
+    DocumentoBusca.objects.filter(tipo=TIPO_DO_MODELO[type(objeto)], objeto_id=objeto.pk).delete()
+
+
+# --- Pesquisa ---
+
+def _ambito(user):
+    """Filtro dos documentos que o utilizador pode ver."""
+    if user.is_superuser and user.tipo not in ('terapeuta', 'paciente'):
+        return Q()
+    participante = Q(remetente_id=user.pk) | Q(destinatario_id=user.pk)
+    if user.tipo == 'terapeuta':
+        carteira = list(Paciente.objects.visiveis_para(user).values_list('pk', flat=True))
+        return participante | Q(tipo__in=['conversa', 'relatorio'], paciente_id__in=carteira)
+    if user.tipo == 'paciente':
+        return participante | Q(tipo__in=['conversa', 'relatorio'], paciente_id=user.pk)
+    return Q(pk__in=[])
+
+
+def _consulta_fts5(termos):
+    # Cada termo entre aspas (sem operadores FTS5); o último aceita prefixos
+    return ' '.join(f'"{t}"' for t in termos[:-1]) + f' "{termos[-1]}"*'
+
+
+def pesquisar(user, consulta, tipos=None, limite=20):
+    """
+    Devolve os documentos visíveis para o utilizador que correspondem à
+    consulta, ordenados por relevância, com um trecho do texto original.
+    """
+    termos = _PALAVRA.findall(normalizar(consulta))
+    if not termos:
+        return []
+
+    documentos = DocumentoBusca.objects.filter(_ambito(user))
+    if tipos:
+        documentos = documentos.filter(tipo__in=tipos)
+
+    vendor = connections[documentos.db].vendor
+    if vendor == 'postgresql':
+        # Importado aqui: o módulo exige o driver do PostgreSQL
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vetor = SearchVector('texto', config=CONFIGURACAO_PG)
+        pesquisa = SearchQuery(' '.join(termos), config=CONFIGURACAO_PG, search_type='websearch')
+        documentos = (
+            documentos.annotate(documento=vetor)
+            .filter(documento=pesquisa)
+            .annotate(relevancia=SearchRank(vetor, pesquisa))
+            .order_by('-relevancia', '-data')
+        )
+    elif vendor == 'sqlite':
+        match = _consulta_fts5(termos)
+        documentos = (
+            documentos
+            .filter(pk__in=RawSQL(f"SELECT rowid FROM {TABELA_FTS} WHERE {TABELA_FTS} MATCH %s", [match]))
+            # bm25 é menor para os documentos mais relevantes
+            .annotate(relevancia=RawSQL(
+                f"(SELECT -bm25({TABELA_FTS}) FROM {TABELA_FTS} WHERE {TABELA_FTS} MATCH %s AND rowid = ia_documentobusca.id)",
+                [match],
+            ))
+            .order_by('-relevancia', '-data')
+        )
+    else:
+        for termo in termos:
+            documentos = documentos.filter(texto__icontains=termo)
+        documentos = documentos.order_by('-data')
+
+    resultados = list(
+        documentos.values('tipo', 'objeto_id', 'paciente_id', 'data', *(['relevancia'] if vendor in ('postgresql', 'sqlite') else []))[:limite]
+    )
+    _anexar_trechos(resultados, termos)
+    return resultados
+
+
+def _textos_originais(resultados):
+    """Carrega (título, texto) originais apenas dos resultados da página: uma consulta por tipo."""
+    ids = {}
+    for r in resultados:
+        ids.setdefault(r['tipo'], []).append(r['objeto_id'])
+    textos = {}
+    if 'conversa' in ids:
+        for pk, texto in Conversa.objects.filter(pk__in=ids['conversa']).values_list('pk', 'mensagem_usuario'):
+            textos[('conversa', pk)] = ('', texto)
+    if 'mensagem' in ids:
+        for pk, assunto, texto in Mensagem.objects.filter(pk__in=ids['mensagem']).values_list('pk', 'assunto', 'conteudo'):
+            textos[('mensagem', pk)] = (assunto, texto)
+    if 'relatorio' in ids:
+        for pk, titulo, texto in Relatorio.objects.filter(pk__in=ids['relatorio']).values_list('pk', 'titulo', 'conteudo'):
+            textos[('relatorio', pk)] = (titulo, texto)
+    return textos
+
+
+def trecho(texto, termos, tamanho=TAMANHO_TRECHO):
+    """Trecho do texto original em torno da primeira ocorrência de um dos termos, com <mark>."""
+    # Normaliza carácter a carácter para manter a correspondência de posições com o original
+    normalizado, posicoes = [], []
+    for i, c in enumerate(texto):
+        for n in normalizar(c):
+            normalizado.append(n)
+            posicoes.append(i)
+    normalizado = ''.join(normalizado)
+
+    padrao = re.compile('|'.join(re.escape(t) for t in sorted(termos, key=len, reverse=True)))
+    ocorrencias = [(posicoes[m.start()], posicoes[m.end() - 1] + 1) for m in padrao.finditer(normalizado)]
+    if not ocorrencias:
+        return texto[:tamanho] + ('…' if len(texto) > tamanho else '')
+
+    inicio = max(0, ocorrencias[0][0] - tamanho // 3)
+    fim = min(len(texto), inicio + tamanho)
+    partes, cursor = [], inicio
+    for a, b in ocorrencias:
+        if a < inicio or b > fim:
+            continue
+        partes += [texto[cursor:a], '<mark>', texto[a:b], '</mark>']
+        cursor = b
+    partes.append(texto[cursor:fim])
+    return ('…' if inicio > 0 else '') + ''.join(partes) + ('…' if fim < len(texto) else '')
+
+
+def _anexar_trechos(resultados, termos):
+    textos = _textos_originais(resultados)
+    for r in resultados:
+        titulo, texto = textos.get((r['tipo'], r['objeto_id']), ('', ''))
+        r['titulo'] = titulo
+        r['trecho'] = trecho(texto or '', termos)
@@ -0,0 +1,61 @@
+from django.core import exceptions
+from django.db import models
+
+
+class CampoCodificado(models.PositiveSmallIntegerField):
+    """
+    Guarda um valor de um vocabulário fechado como um código inteiro pequeno.
+
+    Na base de dados a coluna é um smallint (índice do valor em 'rotulos');
+    em Python, nos filtros do ORM e na API o valor continua a ser a string
+    original, por isso Conversa.objects.filter(sentimento='Negativo') e os
+    serializers funcionam sem alterações.
+
+    Os códigos são posicionais: novos rótulos só podem ser acrescentados
+    no fim de 'rotulos', nunca reordenados ou removidos.
+    """
+
+    def __init__(self, *args, rotulos=(), **kwargs):
+        self.rotulos = tuple(rotulos)
+        self._codigos = {rotulo: codigo for codigo, rotulo in enumerate(self.rotulos)}
+        kwargs.setdefault('choices', [(rotulo, rotulo) for rotulo in self.rotulos])
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['rotulos'] = self.rotulos
+        if kwargs.get('choices') == [(rotulo, rotulo) for rotulo in self.rotulos]:
+            del kwargs['choices']
+        return name, path, args, kwargs
+
+    @property
+    def validators(self):
+        # Os validadores de intervalo de IntegerField não se aplicam: o valor em Python é a string
+        return [*self.default_validators, *self._validators]
+
+    def codigo(self, valor):
+        """Código inteiro de um rótulo (ValueError se não pertencer ao vocabulário)."""
+        try:
+            return self._codigos[valor]
+        except KeyError:
+            raise ValueError(f"'{valor}' não é um valor válido para {self.name}; valores: {', '.join(self.rotulos)}.")
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self.rotulos[value]
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        try:
+            return self.rotulos[int(value)]
+        except (TypeError, ValueError, IndexError):
+            raise exceptions.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value}
+            )
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        return self.codigo(value)
@@ -0,0 +1,42 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from ia import arquivo
+from ia.models import Conversa
+
+
+class Command(BaseCommand):
+    help = (
+        "Move as conversas com mais de IA_RETENCAO_MESES meses completos para o arquivo "
+        "comprimido (ArquivoConversas). Pode ser interrompido e executado de novo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, help="Meses completos mantidos na tabela (padrão: IA_RETENCAO_MESES).")
+        parser.add_argument('--lote', type=int, default=5000, help="Conversas lidas por lote.")
+
+    def handle(self, *args, **options):
+        corte = arquivo.corte_de_retencao(options['meses'])
+        self.stdout.write(f"A arquivar as conversas anteriores a {corte:%d/%m/%Y}...")
+
+        total = 0
+        while True:
+            lote = list(
+                Conversa.objects
+                .filter(data_conversa__lt=corte)
+                .order_by('pk')
+                .values(*arquivo.CAMPOS)[:options['lote']]
+            )
+            if not lote:
+                break
+            grupos = groupby(
+                sorted(lote, key=lambda r: (r['usuario_id'], arquivo.mes_de(r['data_conversa']), r['id'])),
+                key=lambda r: (r['usuario_id'], arquivo.mes_de(r['data_conversa'])),
+            )
+            for (usuario_id, mes), registos in grupos:
+                arquivo.arquivar(usuario_id, mes, list(registos))
+            total += len(lote)
+            self.stdout.write(f"{total} conversas arquivadas (até ao id {lote[-1]['id']})...")
+
+        self.stdout.write(self.style.SUCCESS(f"Concluído: {total} conversas arquivadas."))
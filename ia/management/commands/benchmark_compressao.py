@@ -0,0 +1,107 @@
+import time
+import zlib
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.fields import DICIONARIO_V1, comprimir, descomprimir
+from ia.models import Conversa
+from usuarios.models import Sessao, Mensagem, Relatorio
+
+COLUNAS = (
+    (Conversa, 'mensagem_usuario'),
+    (Conversa, 'resposta_ia'),
+    (Mensagem, 'conteudo'),
+    (Relatorio, 'conteudo'),
+    (Sessao, 'observacoes'),
+)
+
+
+def treinar_dicionario(textos, tamanho=8192, max_palavras=4):
+    """
+    Dicionário zlib a partir de uma amostra: as sequências de 1 a max_palavras
+    palavras que mais bytes poupam (frequência x comprimento), as mais
+    frequentes no fim.
+    """
+    contagem = Counter()
+    for texto in textos:
+        palavras = texto.split()
+        for n in range(1, max_palavras + 1):
+            for i in range(len(palavras) - n + 1):
+                contagem[' '.join(palavras[i:i + n])] += 1
+    candidatos = sorted(
+        (s for s, f in contagem.items() if f > 1),
+        key=lambda s: contagem[s] * len(s.encode('utf-8')),
+        reverse=True,
+    )
+    escolhidos, total = [], 0
+    for sequencia in candidatos:
+        tamanho_seq = len(sequencia.encode('utf-8')) + 1
+        if total + tamanho_seq > tamanho:
+            break
+        escolhidos.append(sequencia)
+        total += tamanho_seq
+    escolhidos.sort(key=lambda s: contagem[s])
+    return ' '.join(escolhidos).encode('utf-8')
+
+
+def _zlib(texto, zdict=None):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15, **({'zdict': zdict} if zdict else {}))
+    return compressor.compress(texto.encode('utf-8')) + compressor.flush()
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede, sobre uma amostra dos textos guardados, o espaço poupado e o custo de CPU "
+        "da compressão (zlib sem dicionário, com o dicionário DICIONARIO_V1 e com um "
+        "dicionário treinado na própria amostra)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--amostra', type=int, default=5000, help="Textos lidos de cada coluna.")
+        parser.add_argument('--mostrar-dicionario', action='store_true', help="Mostra o dicionário treinado na amostra.")
+
+    def handle(self, *args, **options):
+        textos = []
+        for modelo, campo in COLUNAS:
+            textos += [
+                t for t in modelo.objects.order_by('-pk').values_list(campo, flat=True)[:options['amostra']] if t
+            ]
+        if not textos:
+            raise CommandError("Não há textos para medir.")
+
+        # O dicionário é treinado com metade da amostra e medido na outra metade
+        treino, teste = textos[::2], textos[1::2] or textos
+        treinado = treinar_dicionario(treino)
+        original = sum(len(t.encode('utf-8')) for t in teste)
+
+        self.stdout.write(f"Textos medidos: {len(teste):,} ({original / 2**20:.2f} MiB)")
+        variantes = (
+            ('zlib', lambda t: _zlib(t)),
+            ('zlib + DICIONARIO_V1', lambda t: _zlib(t, DICIONARIO_V1)),
+            ('zlib + dicionário treinado', lambda t: _zlib(t, treinado)),
+            ('CampoTextoComprimido', comprimir),
+        )
+        for nome, funcao in variantes:
+            inicio = time.perf_counter()
+            comprimidos = [funcao(t) for t in teste]
+            tempo = time.perf_counter() - inicio
+            tamanho = sum(len(c) for c in comprimidos)
+            self.stdout.write(
+                f"{nome}: {tamanho / 2**20:.2f} MiB ({100 * (1 - tamanho / original):.0f}% menor), "
+                f"compressão {original / 2**20 / tempo:.0f} MiB/s"
+            )
+
+        comprimidos = [comprimir(t) for t in teste]
+        inicio = time.perf_counter()
+        for dados in comprimidos:
+            descomprimir(dados)
+        tempo = time.perf_counter() - inicio
+        self.stdout.write(
+            f"Descompressão: {original / 2**20 / tempo:.0f} MiB/s "
+            f"({tempo / len(comprimidos) * 1e6:.1f} µs por texto)"
+        )
+
+        if options['mostrar_dicionario']:
+            self.stdout.write(f"\nDicionário treinado ({len(treinado)} bytes):")
+            self.stdout.write(repr(treinado.decode('utf-8')))
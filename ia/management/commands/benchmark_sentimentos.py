@@ -0,0 +1,112 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ia.models import SENTIMENTOS, CATEGORIAS_SENTIMENTO, INTENSIDADES
+
+TABELA_TEXTO = 'bench_conversa_texto'
+TABELA_CODIGO = 'bench_conversa_codigo'
+
+
+def _caso(expressao, valores, como_texto):
+    """CASE que escolhe um valor do vocabulário (ou o seu código) a partir de um inteiro."""
+    ramos = ' '.join(
+        f"WHEN {i} THEN " + (f"'{valor}'" if como_texto else str(i))
+        for i, valor in enumerate(valores)
+    )
+    # '%%' porque o SQL é executado com parâmetros
+    return f"CASE ({expressao}) %% {len(valores)} {ramos} END"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara tamanho em disco e tempo de consulta das colunas de sentimento "
+        "em texto (esquema antigo) e em códigos smallint (esquema atual), "
+        "em duas tabelas temporárias com o mesmo número de linhas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=1_000_000, help="Linhas em cada tabela de teste.")
+        parser.add_argument('--repeticoes', type=int, default=5, help="Execuções de cada consulta.")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError("Benchmark disponível apenas para PostgreSQL e SQLite.")
+
+        linhas = options['linhas']
+        try:
+            with connection.cursor() as cursor:
+                for tabela, como_texto in ((TABELA_TEXTO, True), (TABELA_CODIGO, False)):
+                    self._criar(cursor, tabela, como_texto, linhas)
+
+                resultados = {}
+                for tabela, como_texto in ((TABELA_TEXTO, True), (TABELA_CODIGO, False)):
+                    negativo = "'Negativo'" if como_texto else str(SENTIMENTOS.index('Negativo'))
+                    consultas = {
+                        'distribuição por sentimento': f"SELECT sentimento, COUNT(*) FROM {tabela} GROUP BY sentimento",
+                        'negativas de um utilizador': f"SELECT COUNT(*) FROM {tabela} WHERE usuario_id = 42 AND sentimento = {negativo}",
+                    }
+                    resultados[tabela] = {
+                        'tamanho': self._tamanho(cursor, tabela),
+                        'tempos': {nome: self._medir(cursor, sql, options['repeticoes']) for nome, sql in consultas.items()},
+                    }
+        finally:
+            with connection.cursor() as cursor:
+                for tabela in (TABELA_TEXTO, TABELA_CODIGO):
+                    cursor.execute(f"DROP TABLE IF EXISTS {tabela}")
+
+        texto, codigo = resultados[TABELA_TEXTO], resultados[TABELA_CODIGO]
+        self.stdout.write(f"Linhas por tabela: {linhas:,} ({connection.vendor})")
+        self.stdout.write(
+            f"Tamanho (tabela + índices): texto {texto['tamanho'] / 2**20:.1f} MiB, "
+            f"códigos {codigo['tamanho'] / 2**20:.1f} MiB "
+            f"({100 * (1 - codigo['tamanho'] / texto['tamanho']):.0f}% menor)"
+        )
+        for nome in texto['tempos']:
+            self.stdout.write(
+                f"{nome}: texto {texto['tempos'][nome] * 1000:.3f} ms, códigos {codigo['tempos'][nome] * 1000:.3f} ms"
+            )
+
+    def _criar(self, cursor, tabela, como_texto, linhas):
+        tipo = 'varchar(50)' if como_texto else 'smallint'
+        cursor.execute(f"DROP TABLE IF EXISTS {tabela}")
+        cursor.execute(
+            f"CREATE TABLE {tabela} (id integer PRIMARY KEY, usuario_id integer NOT NULL, "
+            f"sentimento {tipo} NOT NULL, categoria_sentimento {tipo} NOT NULL, intensidade_sentimento {tipo} NOT NULL)"
+        )
+        colunas = (
+            f"i, i %% 1000, {_caso('i', SENTIMENTOS, como_texto)}, "
+            f"{_caso('i / 7', CATEGORIAS_SENTIMENTO, como_texto)}, {_caso('i / 3', INTENSIDADES, como_texto)}"
+        )
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"INSERT INTO {tabela} SELECT {colunas} FROM generate_series(1, %s) AS i", [linhas])
+        else:
+            cursor.execute(
+                f"INSERT INTO {tabela} WITH RECURSIVE s(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM s WHERE i < %s) "
+                f"SELECT {colunas} FROM s",
+                [linhas],
+            )
+        cursor.execute(f"CREATE INDEX {tabela}_usuario_sentimento ON {tabela} (usuario_id, sentimento)")
+        cursor.execute(f"ANALYZE {tabela}")
+
+    def _tamanho(self, cursor, tabela):
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_total_relation_size(%s)", [tabela])
+        else:
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name IN (%s, %s)",
+                [tabela, f"{tabela}_usuario_sentimento"],
+            )
+        return cursor.fetchone()[0]
+
+    def _medir(self, cursor, sql, repeticoes):
+        cursor.execute(sql)  # Aquece a cache antes de medir
+        cursor.fetchall()
+        melhor = float('inf')
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            cursor.execute(sql)
+            cursor.fetchall()
+            melhor = min(melhor, time.perf_counter() - inicio)
+        return melhor
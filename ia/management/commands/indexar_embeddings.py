@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from ia.models import Conversa, EmbeddingConversa
+from ia.vetores import calcular_embedding, quantizar
+
+
+class Command(BaseCommand):
+    help = "Calcula os embeddings das conversas que ainda não os têm (pesquisa de conversas semelhantes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Conversas processadas por lote.")
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        ultimo_id = 0
+        total = 0
+        while True:
+            conversas = list(
+                Conversa.objects
+                .filter(pk__gt=ultimo_id, embedding__isnull=True)
+                .order_by('pk')
+                .values_list('pk', 'usuario_id', 'mensagem_usuario')[:lote]
+            )
+            if not conversas:
+                break
+            novos = []
+            for pk, usuario_id, mensagem in conversas:
+                vetor, escala = quantizar(calcular_embedding(mensagem))
+                novos.append(EmbeddingConversa(conversa_id=pk, usuario_id=usuario_id, vetor=vetor, escala=escala))
+            EmbeddingConversa.objects.bulk_create(novos, ignore_conflicts=True)
+            ultimo_id = conversas[-1][0]
+            total += len(novos)
+            self.stdout.write(f"{total} embeddings calculados (até à conversa {ultimo_id})...")
+
+        self.stdout.write(self.style.SUCCESS(f"Concluído: {total} embeddings calculados."))
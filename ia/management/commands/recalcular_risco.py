@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from ia.models import Conversa, EstadoRiscoPaciente
+from ia.risco import atualizar_estado
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói o estado do detetor de risco a partir do histórico de conversas. "
+        "Útil após a primeira implantação ou depois de alterar RISCO_CONFIG. Não cria notificações."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', type=int, help="Recalcula apenas o utilizador com este ID.")
+        parser.add_argument('--lote', type=int, default=2000, help="Tamanho do lote de leitura.")
+
+    def handle(self, *args, **options):
+        conversas = Conversa.objects.order_by('usuario_id', 'data_conversa', 'id')
+        if options['usuario']:
+            conversas = conversas.filter(usuario_id=options['usuario'])
+
+        estados = []
+        estado = None
+        for usuario_id, sentimento, intensidade, data in conversas.values_list(
+            'usuario_id', 'sentimento', 'intensidade_sentimento', 'data_conversa'
+        ).iterator(chunk_size=options['lote']):
+            if estado is None or estado.usuario_id != usuario_id:
+                estado = EstadoRiscoPaciente(usuario_id=usuario_id)
+                estados.append(estado)
+            motivos = atualizar_estado(estado, sentimento, intensidade)
+            if motivos and not estado.em_alerta:
+                estado.ultimo_alerta_em = data
+            estado.em_alerta = bool(motivos)
+            estado.ultima_conversa_em, estado.ultimo_sentimento = data, sentimento
+
+        if options['usuario']:
+            EstadoRiscoPaciente.objects.filter(usuario_id=options['usuario']).delete()
+        else:
+            EstadoRiscoPaciente.objects.all().delete()
+        EstadoRiscoPaciente.objects.bulk_create(estados, batch_size=options['lote'])
+
+        em_alerta = sum(1 for e in estados if e.em_alerta)
+        self.stdout.write(self.style.SUCCESS(
+            f"Estado de risco recalculado para {len(estados)} utilizador(es); {em_alerta} em alerta."
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from ia import busca
+from ia.models import DocumentoBusca
+
+
+class Command(BaseCommand):
+    help = "Recria os documentos da pesquisa de texto (conversas, mensagens e relatórios) a partir dos registos originais."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Registos processados por lote.")
+        parser.add_argument('--tipo', choices=list(busca.FONTES), help="Reindexa apenas um tipo de registo.")
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        tipos = [options['tipo']] if options['tipo'] else list(busca.FONTES)
+        campos = ['paciente_id', 'remetente_id', 'destinatario_id', 'texto', 'data']
+
+        for tipo in tipos:
+            documento = busca.FONTES[tipo][1]
+            ultimo_id = 0
+            total = 0
+            while True:
+                objetos = list(busca.pesquisaveis(tipo).filter(pk__gt=ultimo_id).order_by('pk')[:lote])
+                if not objetos:
+                    break
+                DocumentoBusca.objects.bulk_create(
+                    [DocumentoBusca(tipo=tipo, objeto_id=o.pk, **documento(o)) for o in objetos],
+                    update_conflicts=True,
+                    unique_fields=['tipo', 'objeto_id'],
+                    update_fields=campos,
+                )
+                ultimo_id = objetos[-1].pk
+                total += len(objetos)
+                self.stdout.write(f"{tipo}: {total} documentos indexados (até ao id {ultimo_id})...")
+
+            # Documentos cujo registo original já não existe
+            removidos, _ = (
+                DocumentoBusca.objects.filter(tipo=tipo)
+                .exclude(objeto_id__in=list(busca.pesquisaveis(tipo).values_list('pk', flat=True)))
+                .delete()
+            )
+            self.stdout.write(self.style.SUCCESS(f"{tipo}: {total} documentos indexados, {removidos} removidos."))
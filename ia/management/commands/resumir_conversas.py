@@ -0,0 +1,79 @@
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ia import openrouter, resumos
+
+
+class Command(BaseCommand):
+    help = (
+        "Resume a última semana de conversas com a IA de cada paciente ativo com conversas novas "
+        "e guarda o resumo como rascunho de relatório para o terapeuta. Pode ser interrompido "
+        "e executado de novo: os pacientes já resumidos são ignorados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=7, help="Dias de conversas incluídos em cada resumo.")
+        parser.add_argument('--concorrencia', type=int, default=4, help="Pedidos simultâneos ao modelo.")
+        parser.add_argument('--orcamento-tokens', type=int, help="Tokens de conversa por pedido (padrão: IA_RESUMO_ORCAMENTO_TOKENS).")
+        parser.add_argument('--tentativas', type=int, default=3, help="Tentativas por pedido nos erros temporários.")
+        parser.add_argument('--modelo', help="Modelo do OpenRouter (padrão: IA_RESUMO_MODELO).")
+        parser.add_argument('--limite', type=int, help="Número máximo de pacientes resumidos nesta execução.")
+
+    def handle(self, *args, **options):
+        if not openrouter.API_KEY:
+            raise CommandError("OPENROUTER_API_KEY não configurada.")
+        orcamento = options['orcamento_tokens'] or settings.IA_RESUMO_ORCAMENTO_TOKENS
+        if orcamento < 4 * resumos.TOKENS_POR_RESUMO:
+            raise CommandError(f"O orçamento de tokens deve ser pelo menos {4 * resumos.TOKENS_POR_RESUMO}.")
+        concorrencia = max(1, options['concorrencia'])
+
+        inicio = time.monotonic()
+        desde = timezone.now() - timedelta(days=options['dias'])
+        pendentes = islice(resumos.pacientes_pendentes(desde), options['limite'])
+        totais = Counter()
+
+        # Os pedidos ao modelo correm nas threads; as leituras e escritas na base de dados
+        # ficam nesta thread. No máximo 2 x concorrencia históricos estão em memória.
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            em_curso = {}
+            for paciente, ultima in pendentes:
+                blocos = resumos.blocos_do_paciente(paciente.pk, desde, ultima, orcamento)
+                futuro = executor.submit(resumos.resumir, blocos, orcamento, options['modelo'], options['tentativas'])
+                em_curso[futuro] = (paciente, ultima)
+                if len(em_curso) >= 2 * concorrencia:
+                    self._recolher(em_curso, desde, totais)
+            while em_curso:
+                self._recolher(em_curso, desde, totais)
+
+        duracao = time.monotonic() - inicio
+        self.stdout.write(
+            f"{totais['resumidos']} pacientes resumidos, {totais['falhas']} falhas, em {duracao:.1f}s "
+            f"({60 * totais['resumidos'] / duracao if duracao else 0:.1f} pacientes/min)."
+        )
+        self.stdout.write(
+            f"{totais['chamadas']} pedidos ao modelo, {totais['tokens_entrada']:,} tokens de entrada, "
+            f"{totais['tokens_saida']:,} de saída; custo estimado: US$ {resumos.custo_estimado(totais):.4f}."
+        )
+        if totais['falhas']:
+            raise CommandError(f"{totais['falhas']} pacientes ficaram por resumir; execute o comando de novo.")
+
+    def _recolher(self, em_curso, desde, totais):
+        concluidos, _ = wait(em_curso, return_when=FIRST_COMPLETED)
+        for futuro in concluidos:
+            paciente, ultima = em_curso.pop(futuro)
+            try:
+                texto, uso = futuro.result()
+            except openrouter.ErroOpenRouter as erro:
+                totais['falhas'] += 1
+                self.stderr.write(f"Paciente {paciente.pk}: {erro}")
+                continue
+            resumos.guardar_rascunho(paciente, ultima, desde, texto)
+            totais.update(uso)
+            totais['resumidos'] += 1
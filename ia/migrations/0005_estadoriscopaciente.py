@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-19 04:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0004_alter_conversa_options_alter_conversa_usuario'),
+        ('usuarios', '0009_alter_notificacao_usuario_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoRiscoPaciente',
+            fields=[
+                ('usuario', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estado_risco', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_conversas', models.PositiveIntegerField(default=0)),
+                ('janela_alta', models.PositiveIntegerField(default=0)),
+                ('humor_ewma', models.FloatField(default=0.0)),
+                ('media_base', models.FloatField(default=0.0)),
+                ('variancia_base', models.FloatField(default=0.0)),
+                ('em_alerta', models.BooleanField(default=False)),
+                ('ultimo_alerta_em', models.DateTimeField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Estado de Risco do Paciente',
+                'verbose_name_plural': 'Estados de Risco dos Pacientes',
+            },
+        ),
+    ]
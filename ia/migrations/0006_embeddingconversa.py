@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-19 04:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0005_estadoriscopaciente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingConversa',
+            fields=[
+                ('conversa', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='embedding', serialize=False, to='ia.conversa')),
+                ('usuario_id', models.PositiveBigIntegerField(db_index=True)),
+                ('vetor', models.BinaryField()),
+                ('escala', models.FloatField()),
+            ],
+            options={
+                'verbose_name': 'Embedding de Conversa',
+                'verbose_name_plural': 'Embeddings de Conversas',
+            },
+        ),
+    ]
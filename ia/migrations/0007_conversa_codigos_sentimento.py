@@ -0,0 +1,68 @@
+# Conversão online das colunas de sentimento de texto para códigos smallint (passo 1 de 2).
+#
+# Acrescenta colunas *_codigo e preenche-as em lotes de chaves primárias, cada lote
+# na sua própria transação (atomic = False), para que a tabela nunca fique bloqueada
+# durante a conversão de milhões de linhas. Pode ser reexecutada: só converte linhas
+# com código ainda nulo. Valores fora do vocabulário ficam com o código 0
+# ('Neutro', 'Geral', 'Baixa').
+
+from django.db import migrations
+from django.db.models import Case, Value, When
+
+import ia.fields
+from core.migracoes import atualizar_em_lotes
+
+# Cópia dos vocabulários de ia/models.py no momento desta migração
+SENTIMENTOS = ('Neutro', 'Positivo', 'Negativo', 'Raiva', 'Medo', 'Surpresa', 'Nojo')
+CATEGORIAS_SENTIMENTO = ('Geral', 'Bem-estar', 'Emocional', 'Conflito', 'Insegurança', 'Reação', 'Aversão')
+INTENSIDADES = ('Baixa', 'Média', 'Alta')
+
+CAMPOS = (
+    ('sentimento', SENTIMENTOS),
+    ('categoria_sentimento', CATEGORIAS_SENTIMENTO),
+    ('intensidade_sentimento', INTENSIDADES),
+)
+
+
+def _para_codigo(campo, rotulos):
+    return Case(
+        *[When(**{campo: rotulo}, then=Value(codigo)) for codigo, rotulo in enumerate(rotulos)],
+        default=Value(0),
+    )
+
+
+def converter(apps, schema_editor):
+    Conversa = apps.get_model('ia', 'Conversa')
+    atualizar_em_lotes(
+        Conversa,
+        filtro={'sentimento_codigo__isnull': True},
+        **{f'{campo}_codigo': _para_codigo(campo, rotulos) for campo, rotulos in CAMPOS}
+    )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('ia', '0006_embeddingconversa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversa',
+            name='sentimento_codigo',
+            field=ia.fields.CampoCodificado(null=True, rotulos=SENTIMENTOS),
+        ),
+        migrations.AddField(
+            model_name='conversa',
+            name='categoria_sentimento_codigo',
+            field=ia.fields.CampoCodificado(null=True, rotulos=CATEGORIAS_SENTIMENTO),
+        ),
+        migrations.AddField(
+            model_name='conversa',
+            name='intensidade_sentimento_codigo',
+            field=ia.fields.CampoCodificado(null=True, rotulos=INTENSIDADES),
+        ),
+        migrations.RunPython(converter, migrations.RunPython.noop),
+    ]
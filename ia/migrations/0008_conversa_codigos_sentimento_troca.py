@@ -0,0 +1,47 @@
+# Conversão das colunas de sentimento para códigos smallint (passo 2 de 2).
+#
+# Converte as linhas criadas depois do passo 1, remove as colunas de texto e
+# dá às colunas de código o nome original. Corre numa única transação curta.
+
+from importlib import import_module
+
+from django.db import migrations
+
+import ia.fields
+
+_passo1 = import_module('ia.migrations.0007_conversa_codigos_sentimento')
+SENTIMENTOS = _passo1.SENTIMENTOS
+CATEGORIAS_SENTIMENTO = _passo1.CATEGORIAS_SENTIMENTO
+INTENSIDADES = _passo1.INTENSIDADES
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0007_conversa_codigos_sentimento'),
+    ]
+
+    operations = [
+        migrations.RunPython(_passo1.converter, migrations.RunPython.noop),
+        migrations.RemoveField(model_name='conversa', name='sentimento'),
+        migrations.RemoveField(model_name='conversa', name='categoria_sentimento'),
+        migrations.RemoveField(model_name='conversa', name='intensidade_sentimento'),
+        migrations.RenameField(model_name='conversa', old_name='sentimento_codigo', new_name='sentimento'),
+        migrations.RenameField(model_name='conversa', old_name='categoria_sentimento_codigo', new_name='categoria_sentimento'),
+        migrations.RenameField(model_name='conversa', old_name='intensidade_sentimento_codigo', new_name='intensidade_sentimento'),
+        migrations.AlterField(
+            model_name='conversa',
+            name='sentimento',
+            field=ia.fields.CampoCodificado(rotulos=SENTIMENTOS),
+        ),
+        migrations.AlterField(
+            model_name='conversa',
+            name='categoria_sentimento',
+            field=ia.fields.CampoCodificado(rotulos=CATEGORIAS_SENTIMENTO),
+        ),
+        migrations.AlterField(
+            model_name='conversa',
+            name='intensidade_sentimento',
+            field=ia.fields.CampoCodificado(rotulos=INTENSIDADES),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-19 05:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0008_conversa_codigos_sentimento_troca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversa',
+            index=models.Index(fields=['usuario', '-data_conversa', '-id'], name='conversa_usuario_data_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.1 on 2026-10-19 05:04
+
+from django.db import migrations, models
+
+TABELA = 'ia_documentobusca'
+TABELA_FTS = 'ia_documentobusca_fts'
+
+SQL_SQLITE = [
+    f"""CREATE VIRTUAL TABLE {TABELA_FTS} USING fts5(
+        texto, content='{TABELA}', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER {TABELA}_ai AFTER INSERT ON {TABELA} BEGIN
+        INSERT INTO {TABELA_FTS}(rowid, texto) VALUES (new.id, new.texto);
+    END""",
+    f"""CREATE TRIGGER {TABELA}_ad AFTER DELETE ON {TABELA} BEGIN
+        INSERT INTO {TABELA_FTS}({TABELA_FTS}, rowid, texto) VALUES ('delete', old.id, old.texto);
+    END""",
+    f"""CREATE TRIGGER {TABELA}_au AFTER UPDATE ON {TABELA} BEGIN
+        INSERT INTO {TABELA_FTS}({TABELA_FTS}, rowid, texto) VALUES ('delete', old.id, old.texto);
+        INSERT INTO {TABELA_FTS}(rowid, texto) VALUES (new.id, new.texto);
+    END""",
+]
+SQL_SQLITE_REVERSO = [
+    f"DROP TRIGGER IF EXISTS {TABELA}_ai",
+    f"DROP TRIGGER IF EXISTS {TABELA}_ad",
+    f"DROP TRIGGER IF EXISTS {TABELA}_au",
+    f"DROP TABLE IF EXISTS {TABELA_FTS}",
+]
+SQL_POSTGRES = [
+    f"CREATE INDEX {TABELA}_texto_gin ON {TABELA} USING gin (to_tsvector('portuguese'::regconfig, COALESCE(texto, '')))",
+]
+SQL_POSTGRES_REVERSO = [f"DROP INDEX IF EXISTS {TABELA}_texto_gin"]
+
+
+def _executar(schema_editor, por_vendor):
+    for sql in por_vendor.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def criar_indice_texto(apps, schema_editor):
+    _executar(schema_editor, {'sqlite': SQL_SQLITE, 'postgresql': SQL_POSTGRES})
+
+
+def remover_indice_texto(apps, schema_editor):
+    _executar(schema_editor, {'sqlite': SQL_SQLITE_REVERSO, 'postgresql': SQL_POSTGRES_REVERSO})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0009_conversa_conversa_usuario_data_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('conversa', 'Conversa'), ('mensagem', 'Mensagem'), ('relatorio', 'Relatório')], max_length=10)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('paciente_id', models.PositiveBigIntegerField(blank=True, db_index=True, null=True)),
+                ('remetente_id', models.PositiveBigIntegerField(blank=True, db_index=True, null=True)),
+                ('destinatario_id', models.PositiveBigIntegerField(blank=True, db_index=True, null=True)),
+                ('texto', models.TextField()),
+                ('data', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Documento de Pesquisa',
+                'verbose_name_plural': 'Documentos de Pesquisa',
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='documentobusca_tipo_objeto_unico')],
+            },
+        ),
+        migrations.RunPython(criar_indice_texto, remover_indice_texto),
+    ]
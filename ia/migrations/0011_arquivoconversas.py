@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-19 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0010_documentobusca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArquivoConversas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('usuario_id', models.PositiveBigIntegerField()),
+                ('mes', models.DateField(help_text='Primeiro dia do mês, no fuso horário de TIME_ZONE.')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('primeiro_id', models.PositiveBigIntegerField()),
+                ('ultimo_id', models.PositiveBigIntegerField()),
+                ('dados', models.BinaryField()),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Arquivo de Conversas',
+                'verbose_name_plural': 'Arquivos de Conversas',
+                'constraints': [models.UniqueConstraint(fields=('usuario_id', 'mes'), name='arquivoconversas_usuario_mes_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Compressão dos textos de Conversa (passo 1 de 2).
+#
+# Acrescenta colunas binárias *_comprimido e preenche-as em lotes de chaves
+# primárias, cada lote na sua própria transação (atomic = False). Pode ser
+# reexecutada: só copia as linhas com a coluna nova ainda nula. Alterações a
+# linhas já copiadas enquanto a migração corre não são levadas para a coluna
+# nova; execute-a num período de pouco tráfego.
+
+from django.db import migrations
+
+import core.fields
+from core.migracoes import copiar_coluna_em_lotes
+
+CAMPOS = ('mensagem_usuario', 'resposta_ia')
+
+
+def copiar(apps, schema_editor):
+    Conversa = apps.get_model('ia', 'Conversa')
+    for campo in CAMPOS:
+        copiar_coluna_em_lotes(Conversa, campo, f'{campo}_comprimido')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('ia', '0011_arquivoconversas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversa',
+            name='mensagem_usuario_comprimido',
+            field=core.fields.CampoTextoComprimido(null=True),
+        ),
+        migrations.AddField(
+            model_name='conversa',
+            name='resposta_ia_comprimido',
+            field=core.fields.CampoTextoComprimido(null=True),
+        ),
+        migrations.RunPython(copiar, migrations.RunPython.noop),
+    ]
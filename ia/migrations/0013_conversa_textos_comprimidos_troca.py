@@ -0,0 +1,37 @@
+# Compressão dos textos de Conversa (passo 2 de 2).
+#
+# Copia as linhas criadas depois do passo 1, remove as colunas de texto e dá
+# às colunas comprimidas o nome original.
+
+from importlib import import_module
+
+from django.db import migrations
+
+import core.fields
+
+_passo1 = import_module('ia.migrations.0012_conversa_textos_comprimidos')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0012_conversa_textos_comprimidos'),
+    ]
+
+    operations = [
+        migrations.RunPython(_passo1.copiar, migrations.RunPython.noop),
+        migrations.RemoveField(model_name='conversa', name='mensagem_usuario'),
+        migrations.RemoveField(model_name='conversa', name='resposta_ia'),
+        migrations.RenameField(model_name='conversa', old_name='mensagem_usuario_comprimido', new_name='mensagem_usuario'),
+        migrations.RenameField(model_name='conversa', old_name='resposta_ia_comprimido', new_name='resposta_ia'),
+        migrations.AlterField(
+            model_name='conversa',
+            name='mensagem_usuario',
+            field=core.fields.CampoTextoComprimido(),
+        ),
+        migrations.AlterField(
+            model_name='conversa',
+            name='resposta_ia',
+            field=core.fields.CampoTextoComprimido(),
+        ),
+    ]
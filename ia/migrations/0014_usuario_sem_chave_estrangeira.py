@@ -0,0 +1,48 @@
+# Generated by Django 5.1 on 2026-10-19 05:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remover_chaves_estrangeiras(apps, schema_editor):
+    """
+    As migrações 0003-0005 já não criam estas chaves estrangeiras, mas as bases
+    criadas antes delas ainda as têm. Só o PostgreSQL as remove sem reconstruir
+    a tabela; no SQLite (desenvolvimento) ficam, sem efeito sobre o router.
+    """
+    conexao = schema_editor.connection
+    if conexao.vendor != 'postgresql':
+        return
+    tabela_usuario = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    for nome_modelo in ('Conversa', 'EstadoRiscoPaciente'):
+        tabela = apps.get_model('ia', nome_modelo)._meta.db_table
+        with conexao.cursor() as cursor:
+            restricoes = conexao.introspection.get_constraints(cursor, tabela)
+        for nome, restricao in restricoes.items():
+            if restricao['foreign_key'] and restricao['foreign_key'][0] == tabela_usuario:
+                schema_editor.execute(
+                    f"ALTER TABLE {schema_editor.quote_name(tabela)} DROP CONSTRAINT {schema_editor.quote_name(nome)}"
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0013_conversa_textos_comprimidos_troca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversa',
+            name='usuario',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='conversas_ia', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='estadoriscopaciente',
+            name='usuario',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='estado_risco', serialize=False, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(remover_chaves_estrangeiras, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-19 05:28
+
+import ia.fields
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_ultima_conversa(apps, schema_editor):
+    # Os pacientes sem estado de risco ficam para o comando recalcular_risco
+    Conversa = apps.get_model('ia', 'Conversa')
+    EstadoRiscoPaciente = apps.get_model('ia', 'EstadoRiscoPaciente')
+    ultima = Conversa.objects.filter(usuario_id=OuterRef('usuario_id')).order_by('-data_conversa', '-id')
+    EstadoRiscoPaciente.objects.update(
+        ultima_conversa_em=Subquery(ultima.values('data_conversa')[:1]),
+        ultimo_sentimento=Subquery(ultima.values('sentimento')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0014_usuario_sem_chave_estrangeira'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estadoriscopaciente',
+            name='ultima_conversa_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='estadoriscopaciente',
+            name='ultimo_sentimento',
+            field=ia.fields.CampoCodificado(blank=True, null=True, rotulos=('Neutro', 'Positivo', 'Negativo', 'Raiva', 'Medo', 'Surpresa', 'Nojo')),
+        ),
+        migrations.AddIndex(
+            model_name='estadoriscopaciente',
+            index=models.Index(fields=['-ultima_conversa_em'], name='estado_ultima_conversa_idx'),
+        ),
+        migrations.RunPython(preencher_ultima_conversa, migrations.RunPython.noop),
+    ]
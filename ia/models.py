@@ -1,28 +1,161 @@
 from django.db import models
 from usuarios.models import Usuario # Importar o modelo Usuario do app usuarios
+from core.fields import CampoTextoComprimido
+from .fields import CampoCodificado
+
+# Vocabulários do detetor de sentimento (ver detectar_sentimento_manual em ia/views.py).
+# A posição de cada valor é o código guardado na base de dados: acrescente apenas no fim.
+SENTIMENTOS = ('Neutro', 'Positivo', 'Negativo', 'Raiva', 'Medo', 'Surpresa', 'Nojo')
+CATEGORIAS_SENTIMENTO = ('Geral', 'Bem-estar', 'Emocional', 'Conflito', 'Insegurança', 'Reação', 'Aversão')
+INTENSIDADES = ('Baixa', 'Média', 'Alta')
+
 
 class Conversa(models.Model):
-    # Foreign Key para o modelo Usuario, com um related_name único
+    # Foreign Key para o modelo Usuario, com um related_name único.
+    # Sem restrição na base de dados: a app 'ia' pode estar noutra base (core/db_router.py);
+    # as conversas de um utilizador apagado são removidas em ia/signals.py.
     usuario = models.ForeignKey(
         Usuario,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name='conversas_ia' # Nome único para o acesso reverso
     )
-    mensagem_usuario = models.TextField()
-    resposta_ia = models.TextField()
-    sentimento = models.CharField(max_length=20)
-    categoria_sentimento = models.CharField(max_length=50)
-    intensidade_sentimento = models.CharField(max_length=20)
+    # Textos comprimidos na base de dados (core/fields.py)
+    mensagem_usuario = CampoTextoComprimido()
+    resposta_ia = CampoTextoComprimido()
+    # Guardados como códigos smallint; em Python e na API continuam a ser strings
+    sentimento = CampoCodificado(rotulos=SENTIMENTOS)
+    categoria_sentimento = CampoCodificado(rotulos=CATEGORIAS_SENTIMENTO)
+    intensidade_sentimento = CampoCodificado(rotulos=INTENSIDADES)
     data_conversa = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name = "Conversa IA"
         verbose_name_plural = "Conversas IA"
         ordering = ['-data_conversa']
+        indexes = [
+            # Paginação por cursor do histórico: cada página é um intervalo deste índice
+            models.Index(fields=['usuario', '-data_conversa', '-id'], name='conversa_usuario_data_idx'),
+        ]
 
     def __str__(self):
         return f"Conversa de {self.usuario.email} em {self.data_conversa.strftime('%d/%m/%Y %H:%M')}"
 
-# Você pode ter outros modelos aqui no seu app 'ia'
-# class OutroModeloIA(models.Model):
-#     pass
+
+class EstadoRiscoPaciente(models.Model):
+    """
+    Estado incremental do detetor de risco de um paciente (ver ia/risco.py).
+    Cada nova Conversa atualiza esta linha em O(1), sem reler o histórico.
+    """
+    usuario = models.OneToOneField(
+        Usuario,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        related_name='estado_risco'
+    )
+    total_conversas = models.PositiveIntegerField(default=0)
+    # Máscara de bits das últimas conversas: bit 1 = Negativo/Medo/Raiva com intensidade "Alta"
+    janela_alta = models.PositiveIntegerField(default=0)
+    # Média móvel exponencial (curta) da pontuação de humor
+    humor_ewma = models.FloatField(default=0.0)
+    # Linha de base do próprio paciente (média e variância exponenciais, longas)
+    media_base = models.FloatField(default=0.0)
+    variancia_base = models.FloatField(default=0.0)
+    em_alerta = models.BooleanField(default=False)
+    ultimo_alerta_em = models.DateTimeField(null=True, blank=True)
+    # Última conversa do paciente: lista de pacientes ativos do painel do terapeuta sem ler Conversa
+    ultima_conversa_em = models.DateTimeField(null=True, blank=True)
+    ultimo_sentimento = CampoCodificado(rotulos=SENTIMENTOS, null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Estado de Risco do Paciente"
+        verbose_name_plural = "Estados de Risco dos Pacientes"
+        indexes = [
+            models.Index(fields=['-ultima_conversa_em'], name='estado_ultima_conversa_idx'),
+        ]
+
+    def __str__(self):
+        return f"Estado de risco de {self.usuario_id} ({'em alerta' if self.em_alerta else 'estável'})"
+
+
+class EmbeddingConversa(models.Model):
+    """
+    Embedding local de Conversa.mensagem_usuario (ver ia/vetores.py),
+    guardado quantizado em int8 (DIMENSAO bytes) com a respetiva escala.
+    """
+    conversa = models.OneToOneField(
+        Conversa,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='embedding'
+    )
+    # Cópia do autor da conversa para filtrar por permissões sem junções
+    usuario_id = models.PositiveBigIntegerField(db_index=True)
+    vetor = models.BinaryField()
+    escala = models.FloatField()
+
+    class Meta:
+        verbose_name = "Embedding de Conversa"
+        verbose_name_plural = "Embeddings de Conversas"
+
+    def __str__(self):
+        return f"Embedding da conversa {self.conversa_id}"
+
+
+class DocumentoBusca(models.Model):
+    """
+    Texto normalizado de um registo pesquisável (Conversa, Mensagem ou Relatorio)
+    para a pesquisa de texto integral (ver ia/busca.py). Os índices de texto
+    (GIN no PostgreSQL, FTS5 no SQLite) são criados na migração.
+    """
+    TIPO_CHOICES = [
+        ('conversa', 'Conversa'),
+        ('mensagem', 'Mensagem'),
+        ('relatorio', 'Relatório'),
+    ]
+
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    objeto_id = models.PositiveBigIntegerField()
+    # IDs usados para restringir os resultados às permissões de quem pesquisa
+    paciente_id = models.PositiveBigIntegerField(null=True, blank=True, db_index=True)
+    remetente_id = models.PositiveBigIntegerField(null=True, blank=True, db_index=True)
+    destinatario_id = models.PositiveBigIntegerField(null=True, blank=True, db_index=True)
+    texto = models.TextField()
+    data = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Documento de Pesquisa"
+        verbose_name_plural = "Documentos de Pesquisa"
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id'], name='documentobusca_tipo_objeto_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.objeto_id}"
+
+
+class ArquivoConversas(models.Model):
+    """
+    Conversas de um paciente num mês, retiradas da tabela Conversa pelo comando
+    arquivar_conversas e guardadas como NDJSON comprimido em gzip (ver ia/arquivo.py).
+    """
+    usuario_id = models.PositiveBigIntegerField()
+    mes = models.DateField(help_text="Primeiro dia do mês, no fuso horário de TIME_ZONE.")
+    total = models.PositiveIntegerField(default=0)
+    # Intervalo de ids das conversas arquivadas, para ler os arquivos por ordem de id
+    primeiro_id = models.PositiveBigIntegerField()
+    ultimo_id = models.PositiveBigIntegerField()
+    dados = models.BinaryField()
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Arquivo de Conversas"
+        verbose_name_plural = "Arquivos de Conversas"
+        constraints = [
+            models.UniqueConstraint(fields=['usuario_id', 'mes'], name='arquivoconversas_usuario_mes_unico'),
+        ]
+
+    def __str__(self):
+        return f"Conversas de {self.usuario_id} em {self.mes:%m/%Y} ({self.total})"
@@ -5,23 +5,69 @@ import os # Importa o módulo os para acessar variáveis de ambiente
 # A variável de ambiente OPENROUTER_API_KEY DEVE estar configurada no Render!
 API_KEY = os.getenv('OPENROUTER_API_KEY')
 
-def gerar_resposta_openrouter(mensagem):
-    # Verifica se a chave da API está configurada
-    if not API_KEY:
-        print("⚠️ AVISO: OPENROUTER_API_KEY não configurada! Usando resposta de fallback.")
-        return fallback_resposta(mensagem)
+URL = "https://openrouter.ai/api/v1/chat/completions"
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
 
+def _cabecalhos():
     # ✅ CORREÇÃO: HTTP-Referer deve ser o domínio real do seu frontend no Netlify
     # Use o domínio HTTPS do Netlify.
-    headers = {
+    return {
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type": "application/json",
         "HTTP-Referer": "https://mindcareia.netlify.app",  # ✅ CORREÇÃO AQUI!
         "X-Title": "Assistente Terapeuta",
     }
 
+
+class ErroOpenRouter(Exception):
+    """Falha de um pedido ao OpenRouter; 'temporario' indica se vale a pena repetir."""
+
+    def __init__(self, mensagem, temporario=False):
+        super().__init__(mensagem)
+        self.temporario = temporario
+
+
+def chamar_openrouter(mensagens, modelo="openai/gpt-4o", max_tokens=300, temperature=0.7, timeout=60):
+    """
+    Pedido ao OpenRouter para os trabalhos em lote: em vez de recorrer ao
+    fallback, levanta ErroOpenRouter. Devolve (texto, uso), em que uso é o
+    dicionário 'usage' da resposta (prompt_tokens, completion_tokens).
+    """
+    if not API_KEY:
+        raise ErroOpenRouter("OPENROUTER_API_KEY não configurada.")
+    payload = {"model": modelo, "messages": mensagens, "temperature": temperature, "max_tokens": max_tokens}
+    try:
+        response = requests.post(URL, headers=_cabecalhos(), json=payload, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        raise ErroOpenRouter(f"Erro de conexão com a IA: {e}", temporario=True) from e
+
+    # Limite de pedidos (429) e erros do servidor são temporários; os restantes 4xx não
+    if response.status_code == 429 or response.status_code >= 500:
+        raise ErroOpenRouter(f"HTTP {response.status_code}: {response.text[:200]}", temporario=True)
+    if not response.ok:
+        raise ErroOpenRouter(f"HTTP {response.status_code}: {response.text[:200]}")
+
+    try:
+        data = response.json()
+    except ValueError as e:
+        # Corpo que não é JSON (página de erro de um proxy, resposta cortada)
+        raise ErroOpenRouter(f"Resposta da IA não é JSON: {response.text[:200]}", temporario=True) from e
+    try:
+        texto = data["choices"][0]["message"]["content"].strip()
+    except (KeyError, IndexError, TypeError, AttributeError):
+        raise ErroOpenRouter(f"Resposta inesperada da IA: {str(data)[:200]}", temporario=True)
+    return texto, data.get("usage") or {}
+
+
+def gerar_resposta_openrouter(mensagem):
+    # Verifica se a chave da API está configurada
+    if not API_KEY:
+        print("⚠️ AVISO: OPENROUTER_API_KEY não configurada! Usando resposta de fallback.")
+        return fallback_resposta(mensagem)
+
+    url = URL
+    headers = _cabecalhos()
+
     payload = {
         "model": "openai/gpt-4o",
         "messages": [
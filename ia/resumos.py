@@ -0,0 +1,177 @@
+"""
+Resumos semanais das conversas com a IA para o terapeuta.
+
+O comando resumir_conversas (executado todas as noites) percorre os pacientes
+ativos com conversas novas na última semana, divide o histórico de cada um em
+blocos que cabem num orçamento de tokens e pede ao modelo um resumo por bloco;
+com mais de um bloco, os resumos parciais são depois combinados. O resultado
+fica num Relatorio em rascunho, que o terapeuta revê antes de o publicar.
+
+Cada rascunho guarda em conversas_ate o id da última conversa resumida, na
+mesma escrita que o texto. Por isso o comando é incremental (um paciente sem
+conversas depois desse id é ignorado) e pode ser interrompido e executado de
+novo sem repetir os pacientes já resumidos.
+"""
+import random
+import time
+from collections import Counter
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from usuarios.models import Paciente, Relatorio
+from . import openrouter
+from .models import Conversa
+
+CARACTERES_POR_TOKEN = 4  # Estimativa para português; o uso real vem na resposta da API
+TOKENS_POR_RESUMO = 500   # max_tokens de cada resumo (parcial ou final)
+
+PROMPT_RESUMO = (
+    "Você é um assistente de um psicoterapeuta. Recebe excertos das conversas de um paciente "
+    "com um assistente virtual durante a última semana. Escreva em português um resumo clínico "
+    "objetivo para o terapeuta: temas recorrentes, evolução do humor, acontecimentos relevantes, "
+    "sinais de risco e pontos a explorar na próxima sessão. Não invente informação."
+)
+PROMPT_COMBINAR = (
+    "Você é um assistente de um psicoterapeuta. Recebe resumos de partes consecutivas das "
+    "conversas de um paciente durante a última semana. Combine-os num único resumo clínico "
+    "objetivo, em português, sem repetir informação nem acrescentar nada que não esteja nos resumos."
+)
+
+
+def estimar_tokens(texto):
+    return len(texto) // CARACTERES_POR_TOKEN + 1
+
+
+def dividir(textos, orcamento):
+    """
+    Agrupa textos consecutivos em blocos de até 'orcamento' tokens estimados.
+    Um texto maior do que o orçamento é cortado.
+    """
+    blocos, bloco, total = [], [], 0
+    for texto in textos:
+        texto = texto[:orcamento * CARACTERES_POR_TOKEN]
+        tokens = estimar_tokens(texto)
+        if bloco and total + tokens > orcamento:
+            blocos.append('\n\n'.join(bloco))
+            bloco, total = [], 0
+        bloco.append(texto)
+        total += tokens
+    if bloco:
+        blocos.append('\n\n'.join(bloco))
+    return blocos
+
+
+def pacientes_pendentes(desde):
+    """
+    Gera (paciente, id da última conversa) dos pacientes ativos (com terapeuta
+    e utilizador ativo) que têm conversas desde 'desde' ainda não resumidas.
+    """
+    pacientes = Paciente.objects.in_bulk(list(Paciente.objects.ativos().values_list('pk', flat=True)))
+    resumidas = dict(
+        Relatorio.objects
+        .filter(paciente_id__in=list(pacientes), conversas_ate__isnull=False)
+        .order_by()
+        .values('paciente_id')
+        .annotate(ate=Max('conversas_ate'))
+        .values_list('paciente_id', 'ate')
+    )
+    ultimas = (
+        Conversa.objects
+        .filter(usuario_id__in=list(pacientes), data_conversa__gte=desde)
+        .order_by()
+        .values('usuario_id')
+        .annotate(ultima=Max('id'))
+        .values_list('usuario_id', 'ultima')
+    )
+    for usuario_id, ultima in sorted(ultimas):
+        if ultima > resumidas.get(usuario_id, 0):
+            yield pacientes[usuario_id], ultima
+
+
+def blocos_do_paciente(paciente_id, desde, ate_id, orcamento):
+    """Histórico do paciente entre 'desde' e a conversa 'ate_id', em blocos de texto."""
+    fuso = ZoneInfo(settings.TIME_ZONE)
+    conversas = (
+        Conversa.objects
+        .filter(usuario_id=paciente_id, data_conversa__gte=desde, pk__lte=ate_id)
+        .order_by('data_conversa', 'id')
+        .only('data_conversa', 'mensagem_usuario', 'resposta_ia')
+    )
+    return dividir(
+        (
+            f"[{c.data_conversa.astimezone(fuso):%d/%m %H:%M}] Paciente: {c.mensagem_usuario}\nIA: {c.resposta_ia}"
+            for c in conversas.iterator()
+        ),
+        orcamento,
+    )
+
+
+def chamar_com_tentativas(mensagens, tentativas=3, espera=2.0, **opcoes):
+    """chamar_openrouter com novas tentativas (espera exponencial) nos erros temporários."""
+    for tentativa in range(1, tentativas + 1):
+        try:
+            return openrouter.chamar_openrouter(mensagens, **opcoes)
+        except openrouter.ErroOpenRouter as erro:
+            if not erro.temporario or tentativa == tentativas:
+                raise
+            time.sleep(espera * 2 ** (tentativa - 1) * random.uniform(0.5, 1.5))
+
+
+def resumir(blocos, orcamento, modelo=None, tentativas=3):
+    """
+    Resumo de um histórico já dividido em blocos. Devolve (texto, uso), em que
+    uso conta as chamadas e os tokens de entrada e de saída.
+    Corre nas threads do comando: não acede à base de dados.
+    """
+    uso = Counter()
+
+    def chamar(prompt, texto):
+        resposta, uso_chamada = chamar_com_tentativas(
+            [{"role": "system", "content": prompt}, {"role": "user", "content": texto}],
+            tentativas=tentativas,
+            modelo=modelo or settings.IA_RESUMO_MODELO,
+            max_tokens=TOKENS_POR_RESUMO,
+            temperature=0.3,
+        )
+        uso['chamadas'] += 1
+        uso['tokens_entrada'] += uso_chamada.get('prompt_tokens', 0)
+        uso['tokens_saida'] += uso_chamada.get('completion_tokens', 0)
+        return resposta
+
+    parciais = [chamar(PROMPT_RESUMO, bloco) for bloco in blocos]
+    while len(parciais) > 1:
+        parciais = [chamar(PROMPT_COMBINAR, bloco) for bloco in dividir(parciais, orcamento)]
+    return parciais[0], uso
+
+
+def guardar_rascunho(paciente, conversas_ate, desde, texto):
+    """
+    Grava o resumo como rascunho do terapeuta do paciente. Um resumo automático
+    anterior ainda em rascunho é substituído, para não acumular rascunhos por rever.
+    """
+    titulo = f"Resumo semanal das conversas com a IA ({timezone.localtime(desde):%d/%m} a {timezone.localdate():%d/%m})"
+    anterior = (
+        Relatorio.objects
+        .filter(paciente=paciente, rascunho=True, conversas_ate__isnull=False)
+        .order_by('-data_criacao')
+        .first()
+    )
+    if anterior:
+        anterior.titulo, anterior.conteudo, anterior.conversas_ate = titulo, texto, conversas_ate
+        anterior.save(update_fields=['titulo', 'conteudo', 'conversas_ate'])
+        return anterior
+    return Relatorio.objects.create(
+        terapeuta_id=paciente.terapeuta_id, paciente=paciente, titulo=titulo,
+        conteudo=texto, rascunho=True, conversas_ate=conversas_ate,
+    )
+
+
+def custo_estimado(uso):
+    """Custo em USD de um uso, com os preços por milhão de tokens das settings."""
+    return (
+        uso['tokens_entrada'] * settings.IA_RESUMO_CUSTO_ENTRADA
+        + uso['tokens_saida'] * settings.IA_RESUMO_CUSTO_SAIDA
+    ) / 1_000_000
@@ -0,0 +1,139 @@
+"""
+Detetor de risco incremental (streaming) para as conversas com a IA.
+
+A cada nova Conversa o estado do paciente (EstadoRiscoPaciente) é atualizado
+em O(1): uma janela deslizante em bits das conversas negativas de intensidade
+"Alta", uma média móvel exponencial do humor e uma linha de base (média e
+variância exponenciais) do próprio paciente, usada para calcular um z-score.
+Quando um limiar é ultrapassado é criada uma Notificacao do tipo 'alerta'
+para o terapeuta do paciente.
+"""
+import math
+
+from django.conf import settings
+from django.db import router, transaction
+
+from usuarios.models import Paciente, Notificacao
+from .models import EstadoRiscoPaciente
+
+# Pontuação de humor de cada sentimento (ver detectar_sentimento_manual em ia/views.py)
+PONTUACAO_SENTIMENTO = {
+    "Positivo": 1.0,
+    "Surpresa": 0.0,
+    "Neutro": 0.0,
+    "Nojo": -0.5,
+    "Negativo": -1.0,
+    "Medo": -1.0,
+    "Raiva": -1.0,
+}
+
+# Peso aplicado à pontuação conforme a intensidade detetada
+PESO_INTENSIDADE = {
+    "Baixa": 0.5,
+    "Média": 0.75,
+    "Alta": 1.0,
+}
+
+SENTIMENTOS_DE_RISCO = ("Negativo", "Medo", "Raiva")
+
+# Parâmetros do detetor (podem ser ajustados em settings.RISCO_CONFIG)
+_CONFIG_PADRAO = {
+    'JANELA': 10,               # Nº de conversas consideradas na contagem deslizante
+    'LIMIAR_CONTAGEM': 3,       # Conversas de risco na janela que disparam o alerta
+    'ALFA_HUMOR': 0.3,          # Suavização da média móvel curta
+    'ALFA_BASE': 0.05,          # Suavização da linha de base do paciente
+    'LIMIAR_Z': -2.0,           # z-score a partir do qual o humor é considerado anómalo
+    'MINIMO_CONVERSAS_Z': 10,   # Conversas necessárias antes de confiar na linha de base
+}
+
+
+def _config(chave):
+    return getattr(settings, 'RISCO_CONFIG', {}).get(chave, _CONFIG_PADRAO[chave])
+
+
+def pontuacao_humor(sentimento, intensidade):
+    """Converte sentimento + intensidade numa pontuação de humor em [-1, 1]."""
+    return PONTUACAO_SENTIMENTO.get(sentimento, 0.0) * PESO_INTENSIDADE.get(intensidade, 0.5)
+
+
+def atualizar_estado(estado, sentimento, intensidade):
+    """
+    Aplica uma conversa ao estado (sem gravar) e devolve a lista de motivos
+    de alerta ativos. Não faz qualquer consulta à base de dados.
+    """
+    janela = _config('JANELA')
+    mascara = (1 << janela) - 1
+
+    conversa_de_risco = sentimento in SENTIMENTOS_DE_RISCO and intensidade == "Alta"
+    estado.janela_alta = ((estado.janela_alta << 1) | int(conversa_de_risco)) & mascara
+
+    x = pontuacao_humor(sentimento, intensidade)
+    if estado.total_conversas == 0:
+        estado.humor_ewma = x
+        estado.media_base = x
+        estado.variancia_base = 0.0
+    else:
+        alfa_humor = _config('ALFA_HUMOR')
+        estado.humor_ewma += alfa_humor * (x - estado.humor_ewma)
+
+    # O z-score compara o humor recente com a linha de base *anterior* à conversa atual
+    z = None
+    if estado.total_conversas >= _config('MINIMO_CONVERSAS_Z') and estado.variancia_base > 1e-6:
+        z = (estado.humor_ewma - estado.media_base) / math.sqrt(estado.variancia_base)
+
+    if estado.total_conversas > 0:
+        alfa_base = _config('ALFA_BASE')
+        diferenca = x - estado.media_base
+        incremento = alfa_base * diferenca
+        estado.media_base += incremento
+        estado.variancia_base = (1 - alfa_base) * (estado.variancia_base + diferenca * incremento)
+
+    estado.total_conversas += 1
+
+    motivos = []
+    contagem = bin(estado.janela_alta).count("1")
+    if contagem >= _config('LIMIAR_CONTAGEM'):
+        motivos.append(f"{contagem} conversas negativas de intensidade alta nas últimas {janela}")
+    if z is not None and z <= _config('LIMIAR_Z'):
+        motivos.append(f"humor recente muito abaixo da linha de base do paciente (z = {z:.1f})")
+    return motivos
+
+
+def registrar_conversa(conversa, notificar=True):
+    """
+    Atualiza o estado de risco do autor da conversa e, quando o paciente
+    passa a estar em alerta, cria uma notificação para o seu terapeuta.
+    """
+    with transaction.atomic(using=router.db_for_write(EstadoRiscoPaciente)):
+        estado, _ = EstadoRiscoPaciente.objects.select_for_update().get_or_create(
+            usuario_id=conversa.usuario_id
+        )
+        motivos = atualizar_estado(estado, conversa.sentimento, conversa.intensidade_sentimento)
+
+        novo_alerta = bool(motivos) and not estado.em_alerta
+        estado.em_alerta = bool(motivos)
+        if novo_alerta:
+            estado.ultimo_alerta_em = conversa.data_conversa
+        if estado.ultima_conversa_em is None or conversa.data_conversa >= estado.ultima_conversa_em:
+            estado.ultima_conversa_em = conversa.data_conversa
+            estado.ultimo_sentimento = conversa.sentimento
+        estado.save()
+
+    if novo_alerta and notificar:
+        _notificar_terapeuta(conversa.usuario_id, motivos)
+    return estado
+
+
+def _notificar_terapeuta(usuario_id, motivos):
+    paciente = Paciente.objects.filter(usuario_id=usuario_id).values('pk', 'nome_completo', 'terapeuta_id').first()
+    if not paciente or not paciente['terapeuta_id']:
+        return None
+
+    return Notificacao.objects.create(
+        usuario_id=paciente['terapeuta_id'],
+        tipo='alerta',
+        assunto=f"Alerta de risco: {paciente['nome_completo']}",
+        conteudo=f"O paciente {paciente['nome_completo']} apresenta sinais de risco: " + "; ".join(motivos) + ".",
+        link=f"/pacientes/{paciente['pk']}",
+        lida=False,
+    )
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from core.serializers import CamposDinamicosMixin
 from .models import Conversa # Importa o modelo Conversa do próprio app 'ia'
 from usuarios.models import Usuario # Importa o modelo Usuario do app 'usuarios'
 # from usuarios.serializers import UsuarioSerializer as BaseUsuarioSerializer # ✅ Melhor prática: importar se já existe
@@ -7,7 +8,7 @@ from usuarios.models import Usuario # Importa o modelo Usuario do app 'usuarios'
 # é melhor importá-lo de lá para evitar duplicação e manter um único ponto de verdade.
 # Por exemplo: from usuarios.serializers import UsuarioSerializer
 # Para este contexto, mantemos a definição local para clareza.
-class UsuarioSerializer(serializers.ModelSerializer):
+class UsuarioSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     idade = serializers.ReadOnlyField()
 
     class Meta:
@@ -21,7 +22,7 @@ class UsuarioSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'criado_em', 'atualizado_em', 'idade']
 
 
-class ConversaSerializer(serializers.ModelSerializer):
+class ConversaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Conversa.
     Lida com a serialização de interações de conversa entre o utilizador e a IA.
@@ -0,0 +1,47 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from usuarios.models import Usuario, Mensagem, Relatorio
+from .models import Conversa, EstadoRiscoPaciente, ArquivoConversas
+from . import busca, risco, vetores
+
+
+@receiver(post_save, sender=Conversa)
+def atualizar_risco_apos_conversa(sender, instance, created, raw=False, **kwargs):
+    """Alimenta o detetor de risco com cada nova conversa (ignora fixtures)."""
+    if created and not raw:
+        risco.registrar_conversa(instance)
+
+
+@receiver(post_save, sender=Conversa)
+def indexar_embedding_apos_conversa(sender, instance, created, raw=False, **kwargs):
+    """Mantém o índice de conversas semelhantes atualizado incrementalmente."""
+    if created and not raw:
+        vetores.indexar_conversa(instance)
+
+
+@receiver(post_save, sender=Conversa)
+@receiver(post_save, sender=Mensagem)
+@receiver(post_save, sender=Relatorio)
+def indexar_documento_busca(sender, instance, raw=False, **kwargs):
+    """Mantém o documento de pesquisa de texto em dia com o registo original."""
+    if not raw:
+        busca.indexar(instance)
+
+
+@receiver(post_delete, sender=Conversa)
+@receiver(post_delete, sender=Mensagem)
+@receiver(post_delete, sender=Relatorio)
+def remover_documento_busca(sender, instance, **kwargs):
+    busca.remover(instance)
+
+
+@receiver(pre_delete, sender=Usuario)
+def remover_dados_ia_do_usuario(sender, instance, **kwargs):
+    """
+    Substitui o CASCADE: as tabelas da app 'ia' podem estar noutra base de
+    dados (core/db_router.py) e referem o utilizador apenas pelo id.
+    """
+    Conversa.objects.filter(usuario_id=instance.pk).delete()
+    EstadoRiscoPaciente.objects.filter(usuario_id=instance.pk).delete()
+    ArquivoConversas.objects.filter(usuario_id=instance.pk).delete()
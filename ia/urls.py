@@ -1,10 +1,14 @@
 # ia/urls.py
 from django.urls import path
-from .views import responder, historico_api # Importa as views de API do app 'ia'
+from .views import responder, historico_api, tendencia_sentimento_api, mapa_calor_api, conversas_similares_api, busca_api # Importa as views de API do app 'ia'
 
 app_name = 'ia'
 
 urlpatterns = [
     path('responder/', responder, name='responder'),
     path('historico/api/', historico_api, name='historico_api'),
+    path('pacientes/<int:paciente_id>/tendencia/', tendencia_sentimento_api, name='tendencia_sentimento'),
+    path('mapa-calor/', mapa_calor_api, name='mapa_calor'),
+    path('conversas/semelhantes/', conversas_similares_api, name='conversas_similares'),
+    path('busca/', busca_api, name='busca'),
 ]
@@ -0,0 +1,276 @@
+"""
+Pesquisa de conversas semelhantes com embeddings locais e um índice NumPy.
+
+Os embeddings são calculados localmente (sem chamadas externas) por
+"feature hashing" de palavras e trigramas de caracteres, o que tolera
+variações morfológicas ("insónia", "insone", "dormir mal" vs "não durmo").
+Cada vetor é normalizado e guardado quantizado em int8 com uma escala float32
+(EmbeddingConversa). Em memória, cada âmbito de permissões (terapeuta) tem o
+seu IndiceVetorial: força bruta para carteiras pequenas e um índice
+particionado (IVF, k-means) para carteiras grandes, atualizado
+incrementalmente com as conversas novas. As conversas apagadas ou arquivadas
+(o embedding sai com a Conversa) saem do índice na utilização seguinte, e o
+k-means é treinado numa thread à parte, fora do pedido que passa o limiar.
+"""
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+DIMENSAO = 256
+LIMIAR_PARTICAO = 20000      # A partir deste nº de vetores o índice passa a ser particionado
+SONDAS_PADRAO = 8            # Nº de partições visitadas numa pesquisa no índice particionado
+MAX_INDICES_EM_MEMORIA = 32  # Índices por processo (LRU)
+LOTE_ATRASADOS = 1000        # Ids por consulta ao carregar embeddings gravados fora de ordem
+
+_PALAVRA = re.compile(r"\w+", re.UNICODE)
+
+
+def _normalizar_texto(texto):
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def _hash(token):
+    digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def calcular_embedding(texto):
+    """Embedding float32 normalizado (norma L2 = 1) de um texto."""
+    vetor = np.zeros(DIMENSAO, dtype=np.float32)
+    for palavra in _PALAVRA.findall(_normalizar_texto(texto or '')):
+        tokens = [f"w:{palavra}"]
+        marcada = f"#{palavra}#"
+        tokens += [f"c:{marcada[i:i + 3]}" for i in range(len(marcada) - 2)]
+        for token in tokens:
+            h = _hash(token)
+            # O bit de sinal reduz colisões destrutivas entre tokens
+            vetor[h % DIMENSAO] += 1.0 if (h >> 63) & 1 else -1.0
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma > 0 else vetor
+
+
+def quantizar(vetor):
+    """Converte um vetor float32 em (bytes int8, escala)."""
+    escala = float(np.abs(vetor).max()) / 127.0 or 1.0
+    return np.round(vetor / escala).astype(np.int8).tobytes(), escala
+
+
+def desquantizar(dados, escala):
+    return np.frombuffer(dados, dtype=np.int8).astype(np.float32) * escala
+
+
+def _matriz(vetores, escalas):
+    return vetores.astype(np.float32) * escalas[:, None]
+
+
+def _atribuir(centroides, vetores, escalas):
+    return np.argmax(_matriz(vetores, escalas) @ centroides.T, axis=1).astype(np.int32)
+
+
+def _top_k(pontuacoes, k):
+    if len(pontuacoes) <= k:
+        return np.argsort(-pontuacoes)
+    candidatos = np.argpartition(-pontuacoes, k)[:k]
+    return candidatos[np.argsort(-pontuacoes[candidatos])]
+
+
+class IndiceVetorial:
+    """
+    Índice de produto interno sobre vetores int8 quantizados.
+    Abaixo de LIMIAR_PARTICAO pesquisa por força bruta; acima disso treina
+    centróides por k-means e pesquisa apenas as partições mais próximas.
+
+    Os dados (ids, vetores, escalas, centróides, partição) formam um só tuplo,
+    trocado de uma vez a cada alteração: buscar() lê sempre um estado coerente
+    sem bloquear. As alterações são feitas com o lock do índice (indice_para).
+    """
+
+    def __init__(self):
+        self._estado = (
+            np.empty(0, dtype=np.int64), np.empty((0, DIMENSAO), dtype=np.int8),
+            np.empty(0, dtype=np.float32), None, None,
+        )
+        self.ultimo_id = 0
+        self._tamanho_no_treino = 0
+        self._treino = None
+
+    ids = property(lambda self: self._estado[0])
+    vetores = property(lambda self: self._estado[1])
+    escalas = property(lambda self: self._estado[2])
+    centroides = property(lambda self: self._estado[3])
+    particao = property(lambda self: self._estado[4])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def adicionar(self, ids, vetores, escalas):
+        """Acrescenta vetores já quantizados."""
+        if not len(ids):
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        vetores = np.asarray(vetores, dtype=np.int8).reshape(-1, DIMENSAO)
+        escalas = np.asarray(escalas, dtype=np.float32)
+
+        atuais_ids, atuais_vetores, atuais_escalas, centroides, particao = self._estado
+        if centroides is not None:
+            particao = np.concatenate([particao, _atribuir(centroides, vetores, escalas)])
+        self._estado = (
+            np.concatenate([atuais_ids, ids]), np.concatenate([atuais_vetores, vetores]),
+            np.concatenate([atuais_escalas, escalas]), centroides, particao,
+        )
+        self.ultimo_id = max(self.ultimo_id, int(ids.max()))
+
+    def remover(self, ids):
+        """Retira do índice os vetores destes ids (conversas apagadas ou arquivadas)."""
+        atuais_ids, vetores, escalas, centroides, particao = self._estado
+        manter = ~np.isin(atuais_ids, np.asarray(list(ids), dtype=np.int64))
+        if manter.all():
+            return
+        self._estado = (
+            atuais_ids[manter], vetores[manter], escalas[manter], centroides,
+            particao[manter] if particao is not None else None,
+        )
+
+    def precisa_de_treino(self):
+        return len(self) >= LIMIAR_PARTICAO and len(self) >= 2 * self._tamanho_no_treino
+
+    def treinar_em_segundo_plano(self, lock):
+        """
+        Treina as partições numa thread à parte (uma de cada vez); até acabar,
+        as pesquisas continuam por força bruta ou pelas partições anteriores.
+        """
+        if self._treino is not None and self._treino.is_alive():
+            return
+        self._treino = threading.Thread(target=self._treinar, args=(lock,), daemon=True, name='treino-indice-vetorial')
+        self._treino.start()
+
+    def aguardar_treino(self, timeout=None):
+        if self._treino is not None:
+            self._treino.join(timeout)
+
+    def _treinar(self, lock, iteracoes=10, amostra=50000):
+        """k-means esférico sobre uma amostra; define as partições do índice."""
+        _, vetores, escalas, _, _ = self._estado
+        n_particoes = int(np.sqrt(len(vetores)))
+        gerador = np.random.default_rng(0)
+        indices = gerador.choice(len(vetores), size=min(amostra, len(vetores)), replace=False)
+        dados = _matriz(vetores[indices], escalas[indices])
+
+        centroides = dados[gerador.choice(len(dados), size=n_particoes, replace=False)]
+        for _ in range(iteracoes):
+            atribuicao = np.argmax(dados @ centroides.T, axis=1)
+            for c in range(n_particoes):
+                membros = dados[atribuicao == c]
+                if len(membros):
+                    centroide = membros.sum(axis=0)
+                    norma = np.linalg.norm(centroide)
+                    centroides[c] = centroide / norma if norma > 0 else centroide
+        centroides = centroides.astype(np.float32)
+
+        with lock:
+            # Atribui também os vetores acrescentados ou removidos durante o treino
+            ids, vetores, escalas, _, _ = self._estado
+            self._estado = (ids, vetores, escalas, centroides, _atribuir(centroides, vetores, escalas))
+            self._tamanho_no_treino = len(ids)
+
+    def buscar(self, consulta, k=10, sondas=SONDAS_PADRAO, excluir=None):
+        """Devolve [(id, similaridade)] dos k vetores mais próximos da consulta."""
+        ids, vetores, escalas, centroides, particao = self._estado
+        if not len(ids):
+            return []
+        if centroides is not None:
+            melhores = _top_k(centroides @ consulta, sondas)
+            candidatos = np.flatnonzero(np.isin(particao, melhores))
+        else:
+            candidatos = np.arange(len(ids))
+        if excluir is not None:
+            candidatos = candidatos[ids[candidatos] != excluir]
+
+        pontuacoes = (vetores[candidatos].astype(np.float32) @ consulta) * escalas[candidatos]
+        ordem = _top_k(pontuacoes, k)
+        return [(int(ids[candidatos[i]]), float(pontuacoes[i])) for i in ordem]
+
+
+class _CacheIndices:
+    """Índices em memória por âmbito (terapeuta), com despejo LRU."""
+
+    def __init__(self, maximo=MAX_INDICES_EM_MEMORIA):
+        self.maximo = maximo
+        self._indices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave, usuario_ids):
+        with self._lock:
+            entrada = self._indices.get(chave)
+            if entrada is None or entrada[0] != usuario_ids:
+                entrada = (usuario_ids, IndiceVetorial(), threading.Lock())
+                self._indices[chave] = entrada
+            self._indices.move_to_end(chave)
+            while len(self._indices) > self.maximo:
+                self._indices.popitem(last=False)
+            return entrada[1], entrada[2]
+
+
+_cache_indices = _CacheIndices()
+
+
+def _carregar(indice, embeddings):
+    """Acrescenta ao índice os embeddings de uma consulta."""
+    ids, vetores, escalas = [], [], []
+    linhas = embeddings.order_by('conversa_id').values_list('conversa_id', 'vetor', 'escala')
+    for conversa_id, vetor, escala in linhas.iterator(chunk_size=5000):
+        ids.append(conversa_id)
+        vetores.append(np.frombuffer(bytes(vetor), dtype=np.int8))
+        escalas.append(escala)
+    if ids:
+        indice.adicionar(ids, np.stack(vetores), escalas)
+
+
+def indice_para(chave, usuario_ids):
+    """
+    Devolve o índice do âmbito 'chave' (restrito a usuario_ids), carregando
+    apenas os embeddings criados desde a última utilização, os gravados
+    entretanto para conversas mais antigas (indexar_embeddings, commits fora de
+    ordem) e retirando os das conversas apagadas ou arquivadas entretanto
+    (noutro processo, também).
+    """
+    from django.db.models import Count, Sum
+
+    from .models import EmbeddingConversa
+
+    usuario_ids = frozenset(usuario_ids)
+    indice, lock = _cache_indices.obter(chave, usuario_ids)
+    with lock:
+        embeddings = EmbeddingConversa.objects.filter(usuario_id__in=list(usuario_ids))
+        if len(indice):
+            # Até ultimo_id o índice tem de ter os mesmos ids que a base; o número e a
+            # soma dos ids, numa só consulta, mudam com remoções e com embeddings atrasados
+            ate_ultimo = embeddings.filter(conversa_id__lte=indice.ultimo_id)
+            base = ate_ultimo.aggregate(total=Count('conversa_id'), soma=Sum('conversa_id'))
+            if (base['total'], base['soma'] or 0) != (len(indice), int(indice.ids.sum())):
+                existentes = set(ate_ultimo.values_list('conversa_id', flat=True))
+                indexados = set(indice.ids.tolist())
+                indice.remover(indexados - existentes)
+                atrasados = sorted(existentes - indexados)
+                for inicio in range(0, len(atrasados), LOTE_ATRASADOS):
+                    _carregar(indice, embeddings.filter(conversa_id__in=atrasados[inicio:inicio + LOTE_ATRASADOS]))
+        _carregar(indice, embeddings.filter(conversa_id__gt=indice.ultimo_id))
+        if indice.precisa_de_treino():
+            indice.treinar_em_segundo_plano(lock)
+    return indice
+
+
+def indexar_conversa(conversa):
+    """Calcula e guarda o embedding de uma conversa."""
+    from .models import EmbeddingConversa
+
+    vetor, escala = quantizar(calcular_embedding(conversa.mensagem_usuario))
+    EmbeddingConversa.objects.update_or_create(
+        conversa_id=conversa.pk,
+        defaults={'usuario_id': conversa.usuario_id, 'vetor': vetor, 'escala': escala},
+    )
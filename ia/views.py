@@ -1,16 +1,29 @@
+import base64
+import binascii
 import json
-from django.db.models import Q # Adicionado para filtros complexos (se necessário)
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Count, Avg, Case, When, Value, FloatField, ExpressionWrapper # Q adicionado para filtros complexos
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 
+from core.serializers import campos_pedidos
 from .models import Conversa # Importa o modelo Conversa
 from .serializers import ConversaSerializer # Importa o serializer ConversaSerializer
 from .openrouter import gerar_resposta_openrouter # Importa a função de resposta da IA
+from .risco import PONTUACAO_SENTIMENTO, PESO_INTENSIDADE
+from . import arquivo, busca, vetores
 
 # Importa o modelo Usuario do app 'usuarios' para vincular conversas
-from usuarios.models import Usuario
+from usuarios.models import Usuario, Paciente
+from usuarios import leitura_rapida, normalizado, paineis
 
 
 # === FUNÇÕES AUXILIARES ===
@@ -112,16 +125,436 @@ def responder(request):
         return Response({"erro": f"Erro ao processar: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+HISTORICO_LIMITE_PADRAO = 50
+HISTORICO_LIMITE_MAXIMO = 200
+
+
+def _codificar_cursor(data, id_):
+    """Cursor opaco (data_conversa, id) da última conversa de uma página."""
+    return base64.urlsafe_b64encode(f"{data.isoformat()}|{id_}".encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    data, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(data), int(id_)
+
+
+def _lista_do_vocabulario(request, parametro, campo):
+    """Lê um filtro separado por vírgulas e valida-o contra o vocabulário do campo."""
+    valores = [v.strip() for v in request.GET.get(parametro, '').split(',') if v.strip()]
+    rotulos = Conversa._meta.get_field(campo).rotulos
+    invalidos = [v for v in valores if v not in rotulos]
+    if invalidos:
+        raise ValueError(f"Valor inválido para '{parametro}': {', '.join(invalidos)}. Valores possíveis: {', '.join(rotulos)}.")
+    return valores
+
+
+def _corresponde(conversa, filtros):
+    """Aplica em Python os filtros do histórico (campo__in, data_conversa__gte/__lt) a uma conversa arquivada."""
+    for chave, valor in filtros.items():
+        campo, operador = chave.rsplit('__', 1)
+        atual = getattr(conversa, campo)
+        if operador == 'in' and atual not in valor:
+            return False
+        if operador == 'gte' and atual < valor:
+            return False
+        if operador == 'lt' and atual >= valor:
+            return False
+    return True
+
+
+def _mesclar_arquivo(pagina, usuario_id, limite, filtros, cursor):
+    """
+    Junta à página do histórico as conversas arquivadas que ficam entre o cursor
+    e a última linha da página. Só são lidos os arquivos dos meses nesse intervalo.
+    """
+    desde = pagina[limite].data_conversa if len(pagina) > limite else filtros.get('data_conversa__gte')
+    ate = cursor[0] if cursor else filtros.get('data_conversa__lt')
+    arquivadas = []
+    for conversa in arquivo.conversas_do_usuario(usuario_id, desde=desde, ate=ate):
+        if cursor and (conversa.data_conversa, conversa.id) >= cursor:
+            continue
+        if _corresponde(conversa, filtros):
+            arquivadas.append(conversa)
+            if len(arquivadas) > limite:
+                break
+    return sorted(pagina + arquivadas, key=lambda c: (c.data_conversa, c.id), reverse=True)[:limite + 1]
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def historico_api(request):
     """
-    API REST que retorna o histórico de conversas com a IA do utilizador logado.
-    Retorna as últimas 50 conversas.
+    API REST que retorna o histórico de conversas com a IA do utilizador logado,
+    da mais recente para a mais antiga, com paginação por cursor (keyset).
+
+    Parâmetros opcionais: limite (padrão 50, máximo 200), cursor (devolvido no
+    cabeçalho X-Proximo-Cursor da página anterior), sentimento, intensidade e
+    categoria (valores separados por vírgulas), inicio e fim (YYYY-MM-DD),
+    incluir_arquivo=1 (inclui as conversas já movidas para o arquivo, ver ia/arquivo.py)
+    formato=normalizado (utilizador em 'included', ver usuarios/normalizado.py) e
+    fields, exclude e expand (ver core/serializers.py).
+    Cada página é uma leitura de um intervalo do índice (usuario, -data_conversa, -id),
+    por isso custa o mesmo na primeira página e na milésima.
     """
+    try:
+        limite = max(1, min(int(request.GET.get('limite', HISTORICO_LIMITE_PADRAO)), HISTORICO_LIMITE_MAXIMO))
+        filtros = {}
+        for parametro, campo in (('sentimento', 'sentimento'), ('intensidade', 'intensidade_sentimento'), ('categoria', 'categoria_sentimento')):
+            valores = _lista_do_vocabulario(request, parametro, campo)
+            if valores:
+                filtros[f'{campo}__in'] = valores
+        fuso = ZoneInfo(settings.TIME_ZONE)
+        if request.GET.get('inicio'):
+            filtros['data_conversa__gte'] = datetime.combine(date.fromisoformat(request.GET['inicio']), time.min, tzinfo=fuso)
+        if request.GET.get('fim'):
+            filtros['data_conversa__lt'] = datetime.combine(date.fromisoformat(request.GET['fim']) + timedelta(days=1), time.min, tzinfo=fuso)
+        cursor = _decodificar_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+        incluir_arquivo = request.GET.get('incluir_arquivo') in ('1', 'true')
+        formato = normalizado.formato_pedido(request)
+        campos = campos_pedidos(request.query_params)
+        if formato == 'normalizado':
+            campos = normalizado.com_ids(campos, ConversaSerializer)
+    except (ValueError, UnicodeDecodeError, binascii.Error) as e:
+        return Response({'detail': f'Parâmetros inválidos: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
     # Filtra as conversas APENAS do utilizador logado
-    historico = Conversa.objects.filter(usuario=request.user).order_by('-data_conversa')[:50]
+    historico = Conversa.objects.filter(usuario_id=request.user.pk, **filtros)
+    if campos:
+        # Só as colunas dos campos pedidos; o utilizador é o do pedido e não é lido
+        plano = leitura_rapida.compilar(ConversaSerializer, **campos)
+        historico = historico.only('data_conversa', *{coluna.split('__')[0] for coluna in plano.colunas})
+    if cursor:
+        data_cursor, id_cursor = cursor
+        # A condição em data_conversa delimita o intervalo do índice; o desempate por id é um filtro
+        historico = historico.filter(
+            Q(data_conversa__lte=data_cursor) & (Q(data_conversa__lt=data_cursor) | Q(id__lt=id_cursor))
+        )
+    pagina = list(historico.order_by('-data_conversa', '-id')[:limite + 1])
+    if incluir_arquivo:
+        pagina = _mesclar_arquivo(pagina, request.user.pk, limite, filtros, cursor)
+
+    tem_mais = len(pagina) > limite
+    pagina = pagina[:limite]
+    for conversa in pagina:
+        conversa.usuario = request.user # Evita uma consulta por linha ao serializar o utilizador
 
     # Serializa o queryset de conversas usando o ConversaSerializer
-    serializer = ConversaSerializer(historico, many=True)
-    return Response(serializer.data)
+    serializer = ConversaSerializer(pagina, many=True, **campos)
+    if formato == 'normalizado':
+        response = Response(normalizado.corpo(serializer.data, serializer.child))
+    else:
+        response = Response(serializer.data)
+    if tem_mais:
+        proximo = _codificar_cursor(pagina[-1].data_conversa, pagina[-1].id)
+        parametros = request.GET.copy()
+        parametros['cursor'] = proximo
+        response['X-Proximo-Cursor'] = proximo
+        response['Link'] = f'<{request.build_absolute_uri(request.path)}?{parametros.urlencode()}>; rel="next"'
+    return response
+
+
+# === TENDÊNCIA DE SENTIMENTO ===
+
+# Granularidades suportadas, da mais fina para a mais grossa: (função de truncagem, dias aproximados por ponto)
+GRANULARIDADES = {
+    'dia': (TruncDay, 1),
+    'semana': (TruncWeek, 7),
+    'mes': (TruncMonth, 30),
+}
+PONTOS_PADRAO = 60
+PONTOS_MAXIMO = 500
+TENDENCIA_CACHE_SEGUNDOS = 300
+
+
+def _escolher_granularidade(inicio, fim, pedida, pontos):
+    """
+    Devolve a granularidade pedida ou, se produzir mais pontos que o alvo,
+    a granularidade mais fina que respeita o alvo (downsampling automático).
+    """
+    dias = (fim - inicio).days + 1
+    nomes = list(GRANULARIDADES)
+    inicio_busca = 0 if pedida == 'auto' else nomes.index(pedida)
+    for nome in nomes[inicio_busca:]:
+        if dias / GRANULARIDADES[nome][1] <= pontos:
+            return nome
+    return nomes[-1]
+
+
+def _expressao_pontuacao():
+    """Pontuação de humor por conversa (sentimento × intensidade), calculada na base de dados."""
+    sentimento = Case(
+        *[When(sentimento=nome, then=Value(valor)) for nome, valor in PONTUACAO_SENTIMENTO.items()],
+        default=Value(0.0), output_field=FloatField()
+    )
+    intensidade = Case(
+        *[When(intensidade_sentimento=nome, then=Value(peso)) for nome, peso in PESO_INTENSIDADE.items()],
+        default=Value(0.5), output_field=FloatField()
+    )
+    return ExpressionWrapper(sentimento * intensidade, output_field=FloatField())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def tendencia_sentimento_api(request, paciente_id):
+    """
+    Série temporal de sentimento de um paciente para gráficos de humor.
+    Parâmetros (query string): inicio e fim (YYYY-MM-DD, padrão: últimos 90 dias),
+    granularidade ('dia', 'semana', 'mes' ou 'auto') e pontos (nº máximo de pontos).
+    A agregação por período é feita na base de dados, no fuso America/Sao_Paulo.
+    """
+    if not Paciente.objects.visiveis_para(request.user).filter(pk=paciente_id).exists():
+        return Response({'detail': 'Paciente não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+
+    # O dia da clínica (TIME_ZONE), não o do servidor
+    hoje = timezone.localdate()
+    try:
+        fim = date.fromisoformat(request.GET['fim']) if request.GET.get('fim') else hoje
+        inicio = date.fromisoformat(request.GET['inicio']) if request.GET.get('inicio') else fim - timedelta(days=89)
+        pontos = min(int(request.GET.get('pontos', PONTOS_PADRAO)), PONTOS_MAXIMO)
+    except ValueError:
+        return Response({'detail': 'Parâmetros inválidos. Use datas no formato YYYY-MM-DD e um número de pontos inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    granularidade_pedida = request.GET.get('granularidade', 'auto')
+    if granularidade_pedida != 'auto' and granularidade_pedida not in GRANULARIDADES:
+        return Response({'detail': "Granularidade inválida. Use 'dia', 'semana', 'mes' ou 'auto'."}, status=status.HTTP_400_BAD_REQUEST)
+    if inicio > fim or pontos < 1:
+        return Response({'detail': 'Intervalo de datas ou número de pontos inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    granularidade = _escolher_granularidade(inicio, fim, granularidade_pedida, pontos)
+
+    # A versão do paciente muda com cada conversa guardada (sinais de usuarios/signals.py)
+    versao = paineis.versao(paciente_id)
+    chave_cache = f"ia:tendencia:{paciente_id}:{inicio.isoformat()}:{fim.isoformat()}:{granularidade}:{versao}"
+    dados = cache.get(chave_cache)
+    if dados is None:
+        fuso = ZoneInfo(settings.TIME_ZONE)
+        funcao_truncagem = GRANULARIDADES[granularidade][0]
+
+        # Intervalo semiaberto em datetimes para que o índice em data_conversa seja usado
+        linhas = (
+            Conversa.objects
+            .filter(
+                usuario_id=paciente_id,
+                data_conversa__gte=datetime.combine(inicio, time.min, tzinfo=fuso),
+                data_conversa__lt=datetime.combine(fim + timedelta(days=1), time.min, tzinfo=fuso),
+            )
+            .order_by()
+            .annotate(periodo=funcao_truncagem('data_conversa', tzinfo=fuso))
+            .values('periodo')
+            .annotate(
+                total=Count('id'),
+                pontuacao_media=Avg(_expressao_pontuacao()),
+                **{f'n_{i}': Count('id', filter=Q(sentimento=nome)) for i, nome in enumerate(PONTUACAO_SENTIMENTO)}
+            )
+            .order_by('periodo')
+        )
+
+        serie = []
+        for linha in linhas:
+            serie.append({
+                'periodo': linha['periodo'].date().isoformat(),
+                'total': linha['total'],
+                'pontuacaoMedia': round(linha['pontuacao_media'], 3) if linha['pontuacao_media'] is not None else None,
+                'contagens': {nome: linha[f'n_{i}'] for i, nome in enumerate(PONTUACAO_SENTIMENTO)},
+            })
+
+        dados = {
+            'paciente': paciente_id,
+            'inicio': inicio.isoformat(),
+            'fim': fim.isoformat(),
+            'granularidade': granularidade,
+            'serie': serie,
+        }
+        # Intervalos totalmente no passado já não mudam; os que incluem hoje expiram depressa
+        timeout = 24 * 3600 if fim < hoje else TENDENCIA_CACHE_SEGUNDOS
+        cache.set(chave_cache, dados, timeout)
+
+    return Response(dados)
+
+
+# === MAPA DE CALOR DA CARTEIRA DE PACIENTES ===
+
+SEMANAS_PADRAO = 12
+SEMANAS_MAXIMO = 52
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def mapa_calor_api(request):
+    """
+    Mapa de calor paciente × semana com o sentimento dominante e o peso médio
+    da intensidade de cada célula, para toda a carteira do terapeuta autenticado.
+    Tudo é calculado numa única consulta agrupada. A resposta é baseada em
+    listas paralelas: 'dominante[i][j]' é o índice em 'sentimentos' (ou -1 sem
+    conversas) do paciente 'pacientes[i]' na semana 'semanas[j]';
+    'pesoIntensidade[i][j]' é a média dos pesos de PESO_INTENSIDADE (0.5 Baixa,
+    0.75 Média, 1.0 Alta), ou None sem conversas. As semanas começam à
+    segunda-feira e a última é a de hoje, no fuso da clínica.
+    Parâmetro opcional: semanas (padrão 12, máximo 52).
+    """
+    user = request.user
+    if user.tipo != 'terapeuta' and not user.is_superuser:
+        return Response({'detail': 'Acesso negado. Apenas terapeutas e administradores podem aceder a este mapa.'}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        n_semanas = max(1, min(int(request.GET.get('semanas', SEMANAS_PADRAO)), SEMANAS_MAXIMO))
+    except ValueError:
+        return Response({'detail': 'O parâmetro semanas deve ser um número inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    pacientes = list(
+        Paciente.objects.visiveis_para(user).order_by('nome_completo').values_list('pk', 'nome_completo')
+    )
+    ids = [pk for pk, _ in pacientes]
+
+    fuso = ZoneInfo(settings.TIME_ZONE)
+    hoje = timezone.localdate()
+    primeira_semana = hoje - timedelta(days=hoje.weekday()) - timedelta(weeks=n_semanas - 1)
+    semanas = [primeira_semana + timedelta(weeks=j) for j in range(n_semanas)]
+
+    sentimentos = list(PONTUACAO_SENTIMENTO)
+    indice_paciente = {pk: i for i, pk in enumerate(ids)}
+    indice_semana = {semana: j for j, semana in enumerate(semanas)}
+    indice_sentimento = {nome: k for k, nome in enumerate(sentimentos)}
+
+    # contagens[i][j][k]: conversas do paciente i, na semana j, com o sentimento k
+    contagens = [[[0] * len(sentimentos) for _ in semanas] for _ in ids]
+    soma_intensidade = [[0.0] * n_semanas for _ in ids]
+
+    peso_intensidade = Case(
+        *[When(intensidade_sentimento=nome, then=Value(peso)) for nome, peso in PESO_INTENSIDADE.items()],
+        default=Value(0.5), output_field=FloatField()
+    )
+    linhas = (
+        Conversa.objects
+        .filter(usuario_id__in=ids, data_conversa__gte=datetime.combine(primeira_semana, time.min, tzinfo=fuso))
+        .order_by()
+        .annotate(semana=TruncWeek('data_conversa', tzinfo=fuso))
+        .values('usuario_id', 'semana', 'sentimento')
+        .annotate(n=Count('id'), intensidade=Avg(peso_intensidade))
+    ) if ids else []
+
+    for linha in linhas:
+        i = indice_paciente[linha['usuario_id']]
+        j = indice_semana.get(linha['semana'].date())
+        k = indice_sentimento.get(linha['sentimento'])
+        if j is None or k is None:
+            continue
+        contagens[i][j][k] += linha['n']
+        soma_intensidade[i][j] += linha['intensidade'] * linha['n']
+
+    dominante, peso_medio, total = [], [], []
+    for i in range(len(ids)):
+        linha_dominante, linha_peso, linha_total = [], [], []
+        for j in range(n_semanas):
+            celula = contagens[i][j]
+            n = sum(celula)
+            if n == 0:
+                linha_dominante.append(-1)
+                linha_peso.append(None)
+            else:
+                # Em caso de empate prevalece o sentimento com pior pontuação de humor
+                k = max(range(len(sentimentos)), key=lambda k: (celula[k], -PONTUACAO_SENTIMENTO[sentimentos[k]]))
+                linha_dominante.append(k)
+                linha_peso.append(round(soma_intensidade[i][j] / n, 2))
+            linha_total.append(n)
+        dominante.append(linha_dominante)
+        peso_medio.append(linha_peso)
+        total.append(linha_total)
+
+    return Response({
+        'pacientes': ids,
+        'nomes': [nome for _, nome in pacientes],
+        'semanas': [semana.isoformat() for semana in semanas],
+        'sentimentos': sentimentos,
+        'dominante': dominante,
+        'pesoIntensidade': peso_medio,
+        'total': total,
+    })
+
+
+# === CONVERSAS SEMELHANTES ===
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def conversas_similares_api(request):
+    """
+    Procura mensagens de pacientes semelhantes a um texto ('q') ou a uma
+    conversa existente ('conversa'), dentro da carteira do terapeuta.
+    Parâmetros opcionais: paciente (restringe a um paciente) e k (padrão 10, máximo 50).
+    """
+    user = request.user
+    if user.tipo != 'terapeuta' and not user.is_superuser:
+        return Response({'detail': 'Acesso negado. Apenas terapeutas e administradores podem pesquisar conversas.'}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        k = max(1, min(int(request.GET.get('k', 10)), 50))
+        paciente_id = int(request.GET['paciente']) if request.GET.get('paciente') else None
+        conversa_id = int(request.GET['conversa']) if request.GET.get('conversa') else None
+    except ValueError:
+        return Response({'detail': 'Os parâmetros k, paciente e conversa devem ser números inteiros.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    usuario_ids = set(Paciente.objects.visiveis_para(user).values_list('pk', flat=True))
+
+    if conversa_id is not None:
+        referencia = Conversa.objects.filter(pk=conversa_id, usuario_id__in=list(usuario_ids)).values_list('mensagem_usuario', flat=True).first()
+        if referencia is None:
+            return Response({'detail': 'Conversa não encontrada.'}, status=status.HTTP_404_NOT_FOUND)
+        texto = referencia
+    else:
+        texto = request.GET.get('q', '').strip()
+        if not texto:
+            return Response({'detail': "Indique o texto a pesquisar ('q') ou uma conversa de referência ('conversa')."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if paciente_id is not None:
+        if paciente_id not in usuario_ids:
+            return Response({'detail': 'Paciente não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+        chave, usuario_ids = f"paciente:{paciente_id}", {paciente_id}
+    else:
+        chave = f"terapeuta:{user.pk}"
+
+    indice = vetores.indice_para(chave, usuario_ids)
+    resultados = indice.buscar(vetores.calcular_embedding(texto), k=k, excluir=conversa_id)
+
+    similaridade = dict(resultados)
+    conversas = {
+        c['id']: c for c in Conversa.objects.filter(pk__in=list(similaridade), usuario_id__in=list(usuario_ids)).values(
+            'id', 'usuario_id', 'mensagem_usuario', 'sentimento', 'intensidade_sentimento', 'data_conversa'
+        )
+    }
+    dados = []
+    for id_, pontuacao in resultados:
+        conversa = conversas.get(id_)
+        if conversa:  # Conversas removidas entretanto são ignoradas
+            conversa['similaridade'] = round(pontuacao, 4)
+            dados.append(conversa)
+    return Response(dados)
+
+
+# === PESQUISA DE TEXTO ===
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def busca_api(request):
+    """
+    Pesquisa de texto integral em conversas, mensagens e relatórios visíveis
+    para o utilizador, ordenada por relevância.
+    Parâmetros: q (obrigatório), tipos (ex.: "conversa,relatorio") e limite (padrão 20, máximo 100).
+    """
+    consulta = request.GET.get('q', '').strip()
+    if not consulta:
+        return Response({'detail': "Indique o texto a pesquisar ('q')."}, status=status.HTTP_400_BAD_REQUEST)
+
+    tipos = [t for t in request.GET.get('tipos', '').split(',') if t]
+    invalidos = [t for t in tipos if t not in busca.FONTES]
+    if invalidos:
+        return Response(
+            {'detail': f"Tipos inválidos: {', '.join(invalidos)}. Valores permitidos: {', '.join(busca.FONTES)}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        limite = max(1, min(int(request.GET.get('limite', 20)), 100))
+    except ValueError:
+        return Response({'detail': 'O parâmetro limite deve ser um número inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(busca.pesquisar(request.user, consulta, tipos=tipos or None, limite=limite))
@@ -0,0 +1,116 @@
+"""
+GETs condicionais (ETag e Last-Modified) das leituras da API.
+
+O frontend volta a pedir o perfil, as listas e os painéis a cada navegação e
+quase sempre recebe os mesmos dados. Cada leitura calcula primeiro os seus
+validadores, sem serializar o corpo:
+
+    listas e detalhes   uma consulta com o número de linhas, o maior id e a data
+                        mais recente de alteração (atualizado_em ou, sem ele, a
+                        de criação) das linhas e de cada relação que a resposta
+                        inclui, com o número de relações preenchidas
+    perfil              o atualizado_em do utilizador do pedido, sem consultas
+    painéis             as versões do cache dos painéis (usuarios/paineis.py)
+
+A ETag junta esses valores ao utilizador, ao caminho com os parâmetros, ao
+formato da resposta e ao dia da clínica (a idade muda à meia-noite). O perfil
+e os painéis também levam Last-Modified; as listas e os detalhes não, porque
+apagar uma linha não faz avançar a data mais recente e um If-Modified-Since
+receberia um 304 desatualizado. Um pedido com If-None-Match (ou, onde há
+Last-Modified, If-Modified-Since) que corresponda recebe 304 sem corpo; os
+restantes recebem a resposta de sempre com os validadores. As respostas
+levam Cache-Control: private, no-cache, para o browser guardar e revalidar
+sempre e nenhum cache partilhado as guardar.
+"""
+import hashlib
+import time
+from datetime import datetime, time as hora, timezone as dt_timezone
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import paineis
+
+# Campo que muda quando uma linha muda, por ordem de preferência
+CAMPOS_DE_DATA = ('atualizado_em', 'data_criacao', 'data_envio')
+
+
+def campo_de_data(modelo):
+    nomes = {campo.name for campo in modelo._meta.concrete_fields}
+    return next((nome for nome in CAMPOS_DE_DATA if nome in nomes), None)
+
+
+def _modelo_em(modelo, caminho):
+    for parte in caminho.split('__'):
+        modelo = modelo._meta.get_field(parte).related_model
+    return modelo
+
+
+def validadores(queryset, relacoes=()):
+    """
+    (valores, None) de um queryset, numa só consulta. 'relacoes' são as
+    relações que a resposta inclui ('paciente', 'paciente__usuario'): uma
+    alteração num paciente aninhado também muda os validadores de uma lista de
+    sessões, e o número de relações preenchidas apanha um terapeuta apagado
+    (SET_NULL não muda o atualizado_em do paciente). As datas entram nos
+    valores (na ETag) mas não dão um Last-Modified: só o número de linhas e o
+    maior id notam uma linha apagada.
+    """
+    agregados = {'total': Count('pk'), 'maior_id': Max('pk')}
+    for i, caminho in enumerate(('', *relacoes)):
+        if caminho:
+            agregados[f'relacoes_{i}'] = Count(caminho)
+        campo = campo_de_data(_modelo_em(queryset.model, caminho) if caminho else queryset.model)
+        if campo:
+            agregados[f'data_{i}'] = Max(f'{caminho}__{campo}' if caminho else campo)
+    valores = queryset.order_by().aggregate(**agregados)
+    return tuple(valores.values()), None
+
+
+def validadores_do_painel(user):
+    """
+    Validadores de um painel: as versões do cache dos painéis, trocadas pelos
+    sinais, e a janela de paineis.CACHE_SEGUNDOS, que é quanto uma alteração
+    que não passa pelos sinais demora a chegar ao painel.
+    """
+    versoes = paineis.versoes(user)
+    janela = int(time.time()) // paineis.CACHE_SEGUNDOS
+    desde = max(max(versoes) / 1e9, janela * paineis.CACHE_SEGUNDOS)
+    return (*versoes, janela), datetime.fromtimestamp(desde, tz=dt_timezone.utc)
+
+
+def _etag(request, user, valores):
+    partes = (
+        user.pk, request.get_full_path(), getattr(request, 'accepted_media_type', None),
+        timezone.localdate().isoformat(), valores,
+    )
+    return f'W/"{hashlib.blake2b(repr(partes).encode(), digest_size=16).hexdigest()}"'
+
+
+def responder(request, validadores, gerar, user=None):
+    """
+    Resposta a um GET com os validadores (valores, última alteração): 304 se o
+    cliente já tem esta versão, senão a de gerar(), com ETag e Last-Modified
+    quando for 200. Sem última alteração (None) não há Last-Modified e o
+    If-Modified-Since é ignorado. Uma resposta servida do cache desatualizada (X-Cache:
+    STALE, nos painéis) não leva validadores. 'user' só é preciso nas views
+    assíncronas; nas outras é o request.user.
+    """
+    valores, ultima = validadores
+    etag = _etag(request, user if user is not None else request.user, valores)
+    if ultima is not None:
+        inicio_do_dia = timezone.make_aware(datetime.combine(timezone.localdate(), hora.min))
+        ultima = int(max(ultima, inicio_do_dia).timestamp())
+
+    resposta = get_conditional_response(request, etag=etag, last_modified=ultima)
+    if resposta is None:
+        resposta = gerar()
+        if resposta.status_code != 200 or resposta.get('X-Cache') == 'STALE':
+            return resposta
+    resposta['ETag'] = etag
+    if ultima is not None:
+        resposta['Last-Modified'] = http_date(ultima)
+    patch_cache_control(resposta, private=True, no_cache=True)
+    return resposta
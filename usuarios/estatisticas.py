@@ -0,0 +1,129 @@
+"""
+Estatísticas periódicas dos pacientes, sem chamadas ao modelo de linguagem.
+
+O comando calcular_estatisticas calcula, para um lote de pacientes de cada vez,
+uma consulta agrupada por tabela (Conversa, Sessao e Mensagem) e grava um
+instantâneo EstatisticasPaciente por paciente. O endpoint
+/api/pacientes/<id>/estatisticas/ devolve o instantâneo mais recente com uma
+única leitura indexada.
+
+Estrutura de EstatisticasPaciente.dados:
+
+    totalConversas            conversas com a IA no período
+    distribuicaoSentimentos   {sentimento: número de conversas}
+    tendenciaIntensidade      [{semana, conversas, intensidadeMedia}] por semana
+    sessoes                   {concluidas, canceladas, agendadas} no período
+    proximaSessao             data da próxima sessão agendada ou None
+    mensagensNaoLidas         {doPaciente, doTerapeuta}: ainda não lidas pelo outro
+"""
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db.models import Avg, Case, Count, FloatField, Min, Value, When
+from django.db.models.functions import TruncWeek
+
+from ia.models import Conversa, SENTIMENTOS
+from ia.risco import PESO_INTENSIDADE
+from .models import Sessao, Mensagem, EstatisticasPaciente
+
+
+def _vazio():
+    return {
+        'totalConversas': 0,
+        'distribuicaoSentimentos': {sentimento: 0 for sentimento in SENTIMENTOS},
+        'tendenciaIntensidade': [],
+        'sessoes': {'concluidas': 0, 'canceladas': 0, 'agendadas': 0},
+        'proximaSessao': None,
+        'mensagensNaoLidas': {'doPaciente': 0, 'doTerapeuta': 0},
+    }
+
+
+def calcular(pacientes, inicio, fim):
+    """
+    Estatísticas de vários pacientes no intervalo [inicio, fim), com uma
+    consulta agrupada por indicador. Devolve {paciente_id: dados}.
+    """
+    terapeutas = {p.pk: p.terapeuta_id for p in pacientes}
+    ids = list(terapeutas)
+    dados = {pk: _vazio() for pk in ids}
+    fuso = ZoneInfo(settings.TIME_ZONE)
+
+    conversas = Conversa.objects.filter(usuario_id__in=ids, data_conversa__gte=inicio, data_conversa__lt=fim).order_by()
+    for usuario_id, sentimento, n in (
+        conversas.values('usuario_id', 'sentimento').annotate(n=Count('id')).values_list('usuario_id', 'sentimento', 'n')
+    ):
+        dados[usuario_id]['distribuicaoSentimentos'][sentimento] = n
+        dados[usuario_id]['totalConversas'] += n
+
+    peso_intensidade = Case(
+        *[When(intensidade_sentimento=nome, then=Value(peso)) for nome, peso in PESO_INTENSIDADE.items()],
+        default=Value(0.5), output_field=FloatField()
+    )
+    semanas = (
+        conversas
+        .annotate(semana=TruncWeek('data_conversa', tzinfo=fuso))
+        .values('usuario_id', 'semana')
+        .annotate(n=Count('id'), intensidade=Avg(peso_intensidade))
+        .order_by('usuario_id', 'semana')
+    )
+    for linha in semanas:
+        dados[linha['usuario_id']]['tendenciaIntensidade'].append({
+            'semana': linha['semana'].date().isoformat(),
+            'conversas': linha['n'],
+            'intensidadeMedia': round(linha['intensidade'], 3),
+        })
+
+    chaves_status = {'concluida': 'concluidas', 'cancelada': 'canceladas', 'agendada': 'agendadas'}
+    for paciente_id, estado, n in (
+        Sessao.objects
+        .filter(paciente_id__in=ids, data__gte=inicio, data__lt=fim)
+        .order_by()
+        .values('paciente_id', 'status')
+        .annotate(n=Count('id'))
+        .values_list('paciente_id', 'status', 'n')
+    ):
+        dados[paciente_id]['sessoes'][chaves_status[estado]] = n
+
+    for paciente_id, proxima in (
+        Sessao.objects
+        .filter(paciente_id__in=ids, status='agendada', data__gte=fim)
+        .order_by()
+        .values('paciente_id')
+        .annotate(proxima=Min('data'))
+        .values_list('paciente_id', 'proxima')
+    ):
+        dados[paciente_id]['proximaSessao'] = proxima.isoformat()
+
+    # Mensagens não lidas entre cada paciente e o seu terapeuta, nos dois sentidos
+    for remetente_id, destinatario_id, n in (
+        Mensagem.objects
+        .filter(lida=False, remetente_id__in=ids)
+        .order_by()
+        .values('remetente_id', 'destinatario_id')
+        .annotate(n=Count('id'))
+        .values_list('remetente_id', 'destinatario_id', 'n')
+    ):
+        if terapeutas[remetente_id] == destinatario_id:
+            dados[remetente_id]['mensagensNaoLidas']['doPaciente'] = n
+    for destinatario_id, remetente_id, n in (
+        Mensagem.objects
+        .filter(lida=False, destinatario_id__in=ids)
+        .order_by()
+        .values('destinatario_id', 'remetente_id')
+        .annotate(n=Count('id'))
+        .values_list('destinatario_id', 'remetente_id', 'n')
+    ):
+        if terapeutas[destinatario_id] == remetente_id:
+            dados[destinatario_id]['mensagensNaoLidas']['doTerapeuta'] = n
+
+    return dados
+
+
+def gravar_instantaneos(pacientes, inicio, fim):
+    """Calcula e grava um instantâneo por paciente do lote; devolve quantos foram gravados."""
+    dados = calcular(pacientes, inicio, fim)
+    EstatisticasPaciente.objects.bulk_create([
+        EstatisticasPaciente(paciente_id=pk, periodo_inicio=inicio, periodo_fim=fim, dados=valores)
+        for pk, valores in dados.items()
+    ])
+    return len(dados)
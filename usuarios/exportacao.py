@@ -0,0 +1,200 @@
+"""
+Exportação em streaming do histórico clínico (Conversa, Sessao e Relatorio).
+
+As linhas são lidas com .iterator() em blocos e escritas à medida que são
+enviadas ao cliente (StreamingHttpResponse), por isso a memória usada por um
+worker não depende do tamanho da exportação. Cada tipo é percorrido por ordem
+de id e cada linha traz o seu cursor ("tipo:id"): para retomar uma exportação
+interrompida basta repetir o pedido com o cursor da última linha recebida.
+
+Sob ASGI (render.yaml) o Django lê um iterador síncrono inteiro para uma lista
+antes de enviar o primeiro byte; a view usa então gerar_exportacao_assincrona,
+que lê um bloco de cada vez na thread das consultas.
+"""
+import csv
+import heapq
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.db.models import QuerySet
+from rest_framework import renderers
+
+from ia import arquivo
+from ia.models import ArquivoConversas, Conversa
+from .models import Sessao, Relatorio
+
+TAMANHO_BLOCO = 2000       # Linhas lidas da base de dados de cada vez
+TAMANHO_ENVIO = 64 * 1024  # Bytes acumulados antes de cada envio ao cliente
+
+# tipo -> (modelo, campo com o id do paciente, colunas exportadas)
+FONTES = {
+    'conversa': (Conversa, 'usuario_id', (
+        'id', 'usuario_id', 'data_conversa', 'sentimento', 'categoria_sentimento',
+        'intensidade_sentimento', 'mensagem_usuario', 'resposta_ia',
+    )),
+    'sessao': (Sessao, 'paciente_id', (
+        'id', 'paciente_id', 'terapeuta_id', 'data', 'duracao', 'status', 'observacoes',
+    )),
+    'relatorio': (Relatorio, 'paciente_id', (
+        'id', 'paciente_id', 'terapeuta_id', 'data_criacao', 'titulo', 'conteudo',
+    )),
+}
+
+FORMATOS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+_codificador = DjangoJSONEncoder()
+
+
+class RenderizadorDireto(renderers.BaseRenderer):
+    """
+    Deixa passar na negociação de conteúdo do DRF os pedidos com Accept de
+    NDJSON ou CSV; a view devolve a resposta já formatada.
+    """
+    media_type = '*/*'
+    format = 'exportacao'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Só usado para respostas de erro (dicionários)
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def codificar_cursor(tipo, id_):
+    return f"{tipo}:{id_}"
+
+
+def decodificar_cursor(cursor):
+    """Devolve (tipo, id) de um cursor "tipo:id" (ValueError se for inválido)."""
+    tipo, _, id_ = cursor.partition(':')
+    if tipo not in FONTES:
+        raise ValueError(cursor)
+    return tipo, int(id_)
+
+
+def _ids_para(modelo, pacientes):
+    """
+    Os ids dos pacientes para filtrar 'modelo': a consulta de Paciente como
+    subconsulta, sem trazer a lista de ids para o Python (a de um administrador
+    tem todos os pacientes), ou a lista quando 'modelo' está noutra base de
+    dados (a app 'ia' separada, ver core/db_router.py).
+    """
+    if isinstance(pacientes, QuerySet) and router.db_for_read(modelo) != pacientes.db:
+        return list(pacientes.values_list('pk', flat=True))
+    return pacientes
+
+
+def _do_tipo(tipo, pacientes, apos_id):
+    modelo, campo_paciente, campos = FONTES[tipo]
+    consulta = (
+        modelo.objects
+        .filter(**{f'{campo_paciente}__in': _ids_para(modelo, pacientes)}, pk__gt=apos_id)
+        .order_by('pk')
+        .values_list(*campos)
+    )
+    if tipo == 'relatorio':
+        consulta = consulta.filter(rascunho=False)  # Resumos automáticos ainda por rever
+    for valores in consulta.iterator(chunk_size=TAMANHO_BLOCO):
+        yield dict(zip(campos, valores))
+
+
+def registos(tipos, pacientes, cursor=None, incluir_arquivo=False):
+    """
+    Gera (tipo, dicionário) de cada registo dos pacientes, tipo a tipo e por
+    ordem de id. 'pacientes' é uma lista de ids ou uma consulta de Paciente com
+    a coluna pk (Paciente.objects.values('pk')). Com incluir_arquivo, as
+    conversas arquivadas são intercaladas por id com as da tabela.
+    """
+    tipo_inicial, id_inicial = cursor or (tipos[0], 0)
+    for tipo in tipos[tipos.index(tipo_inicial):]:
+        apos_id = id_inicial if tipo == tipo_inicial else 0
+        linhas = _do_tipo(tipo, pacientes, apos_id)
+        if tipo == 'conversa' and incluir_arquivo:
+            arquivadas = arquivo.registos_por_id(_ids_para(ArquivoConversas, pacientes), apos_id)
+            linhas = heapq.merge(linhas, arquivadas, key=lambda r: r['id'])
+        for registo in linhas:
+            yield tipo, registo
+
+
+def _ndjson(linhas):
+    for tipo, registo in linhas:
+        yield json.dumps(
+            {'tipo': tipo, 'cursor': codificar_cursor(tipo, registo['id']), **registo},
+            cls=DjangoJSONEncoder, ensure_ascii=False,
+        ) + '\n'
+
+
+class _Eco:
+    """Pseudo-ficheiro para o csv.writer: devolve cada linha em vez de a guardar."""
+
+    def write(self, valor):
+        return valor
+
+
+def _valor_csv(valor):
+    if valor is None or isinstance(valor, (str, int, float)):
+        return valor
+    return _codificador.default(valor)  # Datas e durações em ISO 8601, como no NDJSON
+
+
+def _csv(linhas, tipo):
+    campos = FONTES[tipo][2]
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(['cursor', *campos])
+    for tipo, registo in linhas:
+        yield escritor.writerow([codificar_cursor(tipo, registo['id']), *(_valor_csv(registo[c]) for c in campos)])
+
+
+def _agrupar(partes, tamanho=TAMANHO_ENVIO):
+    """Junta as linhas em blocos de bytes de ~tamanho, para não enviar uma linha de cada vez."""
+    bloco, total = [], 0
+    for parte in partes:
+        dados = parte.encode('utf-8')
+        bloco.append(dados)
+        total += len(dados)
+        if total >= tamanho:
+            yield b''.join(bloco)
+            bloco, total = [], 0
+    if bloco:
+        yield b''.join(bloco)
+
+
+def _gzip(blocos):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    for bloco in blocos:
+        dados = compressor.compress(bloco)
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+def gerar_exportacao(tipos, pacientes, formato='ndjson', cursor=None, comprimir=False, incluir_arquivo=False):
+    """
+    Iterador de blocos de bytes com a exportação. O formato CSV aceita um
+    único tipo (as colunas dependem do tipo); o NDJSON aceita vários.
+    """
+    linhas = registos(tipos, pacientes, cursor, incluir_arquivo)
+    partes = _csv(linhas, tipos[0]) if formato == 'csv' else _ndjson(linhas)
+    blocos = _agrupar(partes)
+    return _gzip(blocos) if comprimir else blocos
+
+
+async def gerar_exportacao_assincrona(*args, **kwargs):
+    """
+    gerar_exportacao para o servidor ASGI: cada bloco é pedido ao iterador
+    síncrono com sync_to_async, sempre na mesma thread (a da ligação à base de
+    dados usada pelo .iterator()), e enviado antes de ler o seguinte.
+    """
+    blocos = gerar_exportacao(*args, **kwargs)
+    proximo = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (bloco := await proximo(blocos, None)) is not None:
+            yield bloco
+    finally:
+        # Cliente desligado a meio: fecha o cursor da consulta em curso
+        await sync_to_async(blocos.close, thread_sensitive=True)()
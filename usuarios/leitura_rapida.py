@@ -0,0 +1,246 @@
+"""
+Leitura rápida das listas da API: as linhas são montadas a partir de
+.values_list(), com conversores compilados uma vez a partir do serializer,
+sem instanciar modelos nem chamar to_representation campo a campo.
+
+O resultado é o mesmo do serializer, byte a byte depois de renderizado (ver
+LeituraRapidaTests). O que o compilador não sabe reproduzir (um campo de
+serializer novo, uma propriedade do modelo fora de CALCULADOS) faz compilar()
+levantar NaoSuportado em vez de divergir em silêncio.
+"""
+from datetime import date
+from functools import lru_cache
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
+from django.utils.duration import duration_string
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .models import Usuario, Paciente, Sessao
+
+
+class NaoSuportado(Exception):
+    """O serializer tem um campo que a leitura rápida não sabe reproduzir."""
+
+
+def _idade(nascimento):
+    if not nascimento:
+        return None
+    hoje = date.today()
+    return hoje.year - nascimento.year - ((hoje.month, hoje.day) < (nascimento.month, nascimento.day))
+
+
+# Atributos calculados no modelo: (modelo, atributo) -> (colunas de que dependem, função dos valores).
+# Têm de seguir as propriedades e métodos do modelo com o mesmo nome.
+CALCULADOS = {
+    (Usuario, 'idade'): (('data_nascimento',), _idade),
+    (Usuario, 'get_full_name'): (('first_name', 'last_name'), lambda nome, apelido: f"{nome} {apelido}".strip()),
+    (Paciente, 'idade'): (('data_nascimento', 'usuario__data_nascimento'), lambda proprio, do_usuario: _idade(proprio or do_usuario)),
+    (Sessao, 'duracao_timedelta'): (('duracao',), lambda duracao: duracao),
+}
+
+
+class _Colunas:
+    """Colunas pedidas ao values_list(), sem repetições."""
+
+    def __init__(self):
+        self.caminhos = []
+
+    def indice(self, caminho):
+        if caminho not in self.caminhos:
+            self.caminhos.append(caminho)
+        return self.caminhos.index(caminho)
+
+
+def _data_hora(campo):
+    if getattr(campo, 'format', api_settings.DATETIME_FORMAT) != ISO_8601 or not settings.USE_TZ:
+        return lambda contexto: campo.to_representation
+
+    def construir(contexto):
+        fuso = getattr(campo, 'timezone', None) or timezone.get_current_timezone()
+
+        def converter(valor):
+            texto = valor.astimezone(fuso).isoformat()
+            return texto[:-6] + 'Z' if texto.endswith('+00:00') else texto
+        return converter
+    return construir
+
+
+def _data(campo):
+    if getattr(campo, 'format', api_settings.DATE_FORMAT) != ISO_8601:
+        return lambda contexto: campo.to_representation
+    return lambda contexto: date.isoformat
+
+
+def _ficheiro(campo, campo_modelo):
+    if not getattr(campo, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+        return lambda contexto: lambda nome: nome or None
+
+    def construir(contexto):
+        request = contexto.get('request')
+
+        def converter(nome):
+            if not nome:
+                return None
+            url = campo_modelo.storage.url(nome)
+            return request.build_absolute_uri(url) if request is not None else url
+        return converter
+    return construir
+
+
+# to_representation do DRF que equivalem a uma conversão direta do valor da coluna
+DIRETOS = {
+    serializers.ReadOnlyField.to_representation: None,
+    serializers.CharField.to_representation: str,
+    serializers.IntegerField.to_representation: int,
+    serializers.BooleanField.to_representation: bool,
+    serializers.DurationField.to_representation: duration_string,
+}
+
+
+def _conversor(campo, campo_modelo):
+    """Fábrica (contexto -> conversor ou None) do valor de uma coluna para o campo."""
+    if isinstance(campo, serializers.PrimaryKeyRelatedField) and campo.pk_field is None:
+        return lambda contexto: None
+    if isinstance(campo, serializers.RelatedField):
+        raise NaoSuportado(campo.field_name)
+    if isinstance(campo, serializers.FileField):
+        return _ficheiro(campo, campo_modelo)
+    if isinstance(campo, serializers.DateTimeField):
+        return _data_hora(campo)
+    if isinstance(campo, serializers.DateField):
+        return _data(campo)
+    metodo = type(campo).to_representation
+    if metodo in DIRETOS:
+        return lambda contexto: DIRETOS[metodo]
+    return lambda contexto: campo.to_representation
+
+
+def _escalar(indice, converter):
+    if converter is None:
+        return itemgetter(indice)
+
+    def montar(linha):
+        valor = linha[indice]
+        return None if valor is None else converter(valor)
+    return montar
+
+
+def _calculado(indices, funcao):
+    def montar(linha):
+        return funcao(*(linha[i] for i in indices))
+    return montar
+
+
+def _objeto(chaves, montadores):
+    def montar(linha):
+        return {chave: montador(linha) for chave, montador in zip(chaves, montadores)}
+    return montar
+
+
+def _aninhado(indice_chave, montar_objeto):
+    """
+    Objeto aninhado de uma chave estrangeira (None se for nula). Cada objeto
+    relacionado é montado uma vez por lista: o terapeuta de uma lista de
+    sessões, por exemplo, repete-se em todas as linhas.
+    """
+    montados = {}
+
+    def montar(linha):
+        chave = linha[indice_chave]
+        if chave is None:
+            return None
+        objeto = montados.get(chave)
+        if objeto is None:
+            objeto = montados[chave] = montar_objeto(linha)
+        return objeto
+    return montar
+
+
+def _compilar(serializer, modelo, prefixo, colunas):
+    """Lista de (chave, fábrica de montador) dos campos de leitura do serializer."""
+    campos = []
+    for nome, campo in serializer.fields.items():
+        if campo.write_only:
+            continue
+        if campo.source == '*':
+            raise NaoSuportado(f"{type(serializer).__name__}.{nome}")
+
+        # Segue as relações do source (ex.: 'usuario.email') até ao último atributo
+        atual, caminho, ultimo = modelo, prefixo, campo.source_attrs[-1]
+        try:
+            for atributo in campo.source_attrs[:-1]:
+                relacao = atual._meta.get_field(atributo)
+                if not relacao.is_relation or relacao.many_to_many or relacao.one_to_many:
+                    raise NaoSuportado(f"{type(serializer).__name__}.{nome}")
+                atual, caminho = relacao.related_model, f'{caminho}{atributo}__'
+
+            if (atual, ultimo) in CALCULADOS:
+                dependencias, funcao = CALCULADOS[(atual, ultimo)]
+                indices = [colunas.indice(caminho + d) for d in dependencias]
+                campos.append((nome, lambda contexto, indices=indices, funcao=funcao: _calculado(indices, funcao)))
+                continue
+
+            campo_modelo = atual._meta.get_field(ultimo)
+        except FieldDoesNotExist:
+            raise NaoSuportado(f"{type(serializer).__name__}.{nome}")
+
+        if isinstance(campo, serializers.BaseSerializer):
+            if isinstance(campo, serializers.ListSerializer) or not campo_modelo.is_relation:
+                raise NaoSuportado(f"{type(serializer).__name__}.{nome}")
+            indice_chave = colunas.indice(caminho + ultimo)
+            aninhados = _compilar(campo, campo_modelo.related_model, f'{caminho}{ultimo}__', colunas)
+            campos.append((nome, lambda contexto, aninhados=aninhados, indice_chave=indice_chave: _aninhado(
+                indice_chave, _objeto([chave for chave, _ in aninhados], [fabrica(contexto) for _, fabrica in aninhados]),
+            )))
+            continue
+
+        if campo_modelo.is_relation and not campo_modelo.concrete:
+            raise NaoSuportado(f"{type(serializer).__name__}.{nome}")
+        indice = colunas.indice(caminho + ultimo)
+        fabrica = _conversor(campo, campo_modelo)
+        campos.append((nome, lambda contexto, indice=indice, fabrica=fabrica: _escalar(indice, fabrica(contexto))))
+    return campos
+
+
+class Plano:
+    """Colunas a ler e montagem das linhas de um serializer."""
+
+    def __init__(self, serializer):
+        colunas = _Colunas()
+        self.campos = _compilar(serializer, serializer.Meta.model, '', colunas)
+        self.colunas = colunas.caminhos
+        # Relações atravessadas pelas colunas ('paciente__usuario__email' -> 'paciente', 'paciente__usuario')
+        self.relacoes = sorted({
+            '__'.join(partes[:i]) for partes in (c.split('__') for c in self.colunas) for i in range(1, len(partes))
+        })
+
+    def consulta(self, queryset):
+        """O queryset (já filtrado e ordenado) como tuplas das colunas do plano."""
+        return queryset.values_list(*self.colunas)
+
+    def carregar(self, queryset):
+        """
+        O queryset a carregar só as colunas do plano, com um JOIN por relação
+        atravessada e nenhum para as outras, para serializar instâncias.
+        """
+        return queryset.select_related(None).select_related(*self.relacoes).only(*self.colunas)
+
+    def serializar(self, linhas, contexto):
+        """Representação das tuplas de consulta(), igual à do serializer com este contexto."""
+        montar = _objeto([chave for chave, _ in self.campos], [fabrica(contexto) for _, fabrica in self.campos])
+        return [montar(linha) for linha in linhas]
+
+
+@lru_cache(maxsize=256)
+def compilar(serializer_class, fields=None, exclude=None, expand=None):
+    """
+    Plano de leitura rápida de um serializer, com os campos escolhidos em
+    fields/exclude/expand (frozensets, ver core/serializers.py); os planos das
+    combinações mais usadas ficam em memória.
+    """
+    opcoes = {'fields': fields, 'exclude': exclude, 'expand': expand}
+    return Plano(serializer_class(**{k: v for k, v in opcoes.items() if v is not None}))
@@ -0,0 +1,124 @@
+"""
+Linha do tempo de um paciente: conversas com a IA, mensagens, sessões,
+relatórios e notificações num único feed, do mais recente para o mais antigo.
+
+Cada fonte é lida pela ordem de um índice (data desc, id desc), limitada a
+'limite + 1' linhas depois do cursor, e as fontes são juntas com heapq.merge.
+Um pedido lê no máximo (número de fontes) x (limite + 1) linhas, por mais
+antiga que seja a página.
+
+A ordem total é (data, tipo, id), decrescente em todos os campos, e o cursor é
+o trio da última entrada devolvida. Uma mensagem que o paciente enviou a si
+próprio vem nos fluxos das enviadas e das recebidas e aparece uma só vez.
+As conversas já arquivadas (ia/arquivo.py) não entram na linha do tempo.
+"""
+import base64
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from django.db.models import F, Q
+
+from ia.models import Conversa
+from .models import Sessao, Mensagem, Relatorio, Notificacao
+
+# Campos devolvidos com outro nome, para não colidirem com 'tipo', 'id' e 'data' da entrada
+RENOMEADOS = {'categoria': F('tipo')}
+
+# tipo: (modelo, campo da data, campos devolvidos, filtros do paciente — uma leitura por filtro)
+FONTES = {
+    'conversa': (
+        Conversa, 'data_conversa',
+        ('mensagem_usuario', 'resposta_ia', 'sentimento', 'intensidade_sentimento'),
+        lambda paciente_id: [Q(usuario_id=paciente_id)],
+    ),
+    # Enviadas e recebidas são lidas em separado, cada uma pelo seu índice
+    'mensagem': (
+        Mensagem, 'data_envio',
+        ('remetente_id', 'destinatario_id', 'assunto', 'conteudo', 'lida'),
+        lambda paciente_id: [Q(remetente_id=paciente_id), Q(destinatario_id=paciente_id)],
+    ),
+    'notificacao': (
+        Notificacao, 'data_criacao',
+        ('categoria', 'assunto', 'lida'),
+        lambda paciente_id: [Q(usuario_id=paciente_id)],
+    ),
+    'relatorio': (
+        Relatorio, 'data_criacao',
+        ('terapeuta_id', 'titulo', 'rascunho'),
+        lambda paciente_id: [Q(paciente_id=paciente_id)],
+    ),
+    'sessao': (
+        Sessao, 'data',
+        ('terapeuta_id', 'status', 'duracao', 'observacoes'),
+        lambda paciente_id: [Q(paciente_id=paciente_id)],
+    ),
+}
+
+
+def codificar_cursor(entrada):
+    """Cursor opaco (data, tipo, id) de uma entrada da linha do tempo."""
+    return base64.urlsafe_b64encode(f"{entrada['data'].isoformat()}|{entrada['tipo']}|{entrada['id']}".encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """Devolve (data, tipo, id) de um cursor (ValueError se for inválido)."""
+    try:
+        data, tipo, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(cursor)
+    if tipo not in FONTES:
+        raise ValueError(cursor)
+    return datetime.fromisoformat(data), tipo, int(id_)
+
+
+def _depois_do_cursor(tipo, campo_data, cursor):
+    """Filtro das linhas de 'tipo' que vêm depois do cursor na ordem (data, tipo, id) decrescente."""
+    data, tipo_cursor, id_cursor = cursor
+    if tipo < tipo_cursor:
+        return Q(**{f'{campo_data}__lte': data})
+    if tipo > tipo_cursor:
+        return Q(**{f'{campo_data}__lt': data})
+    return Q(**{f'{campo_data}__lt': data}) | Q(**{campo_data: data, 'id__lt': id_cursor})
+
+
+def _ler(tipo, queryset, campo_data, campos, limite):
+    colunas = [c for c in campos if c not in RENOMEADOS]
+    renomeadas = {c: RENOMEADOS[c] for c in campos if c in RENOMEADOS}
+    for linha in queryset.order_by(f'-{campo_data}', '-id').values('id', campo_data, *colunas, **renomeadas)[:limite]:
+        yield {'tipo': tipo, 'id': linha.pop('id'), 'data': linha.pop(campo_data), **linha}
+
+
+def _chave(entrada):
+    return entrada['data'], entrada['tipo'], entrada['id']
+
+
+def _sem_repetidas(entradas):
+    """Salta as entradas iguais à anterior (as fontes já vêm pela mesma ordem)."""
+    anterior = None
+    for entrada in entradas:
+        atual = _chave(entrada)
+        if atual != anterior:
+            yield entrada
+        anterior = atual
+
+
+def entradas(paciente_id, limite, cursor=None, tipos=None, incluir_rascunhos=True):
+    """
+    Até 'limite' entradas da linha do tempo depois do cursor e o cursor da
+    página seguinte (None na última página).
+    """
+    fluxos = []
+    for tipo in sorted(tipos or FONTES):
+        modelo, campo_data, campos, filtros = FONTES[tipo]
+        for filtro in filtros(paciente_id):
+            queryset = modelo.objects.filter(filtro)
+            if tipo == 'relatorio' and not incluir_rascunhos:
+                queryset = queryset.filter(rascunho=False)
+            if cursor:
+                queryset = queryset.filter(_depois_do_cursor(tipo, campo_data, cursor))
+            fluxos.append(_ler(tipo, queryset, campo_data, campos, limite + 1))
+
+    pagina = list(islice(_sem_repetidas(heapq.merge(*fluxos, key=_chave, reverse=True)), limite + 1))
+    proximo = codificar_cursor(pagina[limite - 1]) if len(pagina) > limite else None
+    return pagina[:limite], proximo
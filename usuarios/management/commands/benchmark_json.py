@@ -0,0 +1,104 @@
+import io
+import timeit
+import uuid
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import JSONRapidoParser
+from core.renderers import JSONRapidoRenderer
+from usuarios import linha_do_tempo, paineis, utilizacao
+from usuarios.models import Usuario, Paciente, Sessao, Relatorio, Notificacao
+from usuarios.serializers import PacienteSerializer, SessaoSerializer
+
+
+class _Desfazer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o JSONRenderer/JSONParser do DRF com os de core/renderers.py e core/parsers.py "
+        "sobre as respostas reais da API (painel do terapeuta, listas, linha do tempo, utilização). "
+        "Os dados de teste são criados numa transação desfeita no fim."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=50, help="Pacientes do terapeuta de teste.")
+        parser.add_argument('--sessoes', type=int, default=2000, help="Sessões do terapeuta de teste.")
+        parser.add_argument('--repeticoes', type=int, default=5, help="Séries de medições (conta a melhor).")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic(using=router.db_for_write(Sessao)):
+                terapeuta, paciente = self._criar_dados(options['pacientes'], options['sessoes'])
+                hoje = date.today()
+                respostas = (
+                    ('painel_terapeuta', paineis.painel_terapeuta(terapeuta, 1, paineis.PAINEL_LIMITE_MAXIMO)),
+                    ('pacientes', PacienteSerializer(Paciente.objects.filter(terapeuta=terapeuta), many=True).data),
+                    ('sessoes', SessaoSerializer(Sessao.objects.filter(terapeuta=terapeuta), many=True).data),
+                    ('linha_do_tempo', linha_do_tempo.entradas(paciente.pk, 200)[0]),
+                    ('utilizacao', utilizacao.calcular(hoje - timedelta(days=365), hoje)),
+                )
+                for nome, dados in respostas:
+                    self._medir(nome, dados, options['repeticoes'])
+                raise _Desfazer
+        except _Desfazer:
+            pass
+
+    def _criar_dados(self, n_pacientes, n_sessoes):
+        terapeuta = Usuario.objects.create_user(
+            email=f"bench-{uuid.uuid4().hex}@example.com", password=None, tipo='terapeuta',
+            first_name="Terapeuta", last_name="de Teste",
+        )
+        pacientes = []
+        for i in range(n_pacientes):
+            user = Usuario.objects.create_user(
+                email=f"bench-{uuid.uuid4().hex}@example.com", password=None, tipo='paciente',
+                first_name=f"Paciente {i}", data_nascimento=date(1990, 1, 1) + timedelta(days=i),
+            )
+            pacientes.append(Paciente.objects.create(
+                usuario=user, nome_completo=f"Paciente {i}", terapeuta=terapeuta,
+                historico_medico="Acompanhamento por ansiedade e insónia.",
+            ))
+        agora = timezone.now()
+        Sessao.objects.bulk_create(
+            [
+                Sessao(
+                    terapeuta=terapeuta, paciente=pacientes[i % n_pacientes], data=agora - timedelta(hours=i),
+                    duracao=timedelta(minutes=50), status='concluida', observacoes="Sessão de acompanhamento.",
+                )
+                for i in range(n_sessoes)
+            ],
+            batch_size=1000,
+        )
+        Relatorio.objects.bulk_create(
+            [Relatorio(terapeuta=terapeuta, paciente=pacientes[0], titulo=f"Relatório {i}", conteudo="...") for i in range(100)]
+        )
+        Notificacao.objects.bulk_create(
+            [Notificacao(usuario=pacientes[0].usuario, assunto=f"Aviso {i}", conteudo="...") for i in range(100)]
+        )
+        self.stdout.write(f"Terapeuta de teste: {n_pacientes} pacientes e {n_sessoes:,} sessões.")
+        return terapeuta, pacientes[0]
+
+    def _melhor(self, funcao, repeticoes):
+        cronometro = timeit.Timer(funcao)
+        numero, _ = cronometro.autorange()
+        return min(cronometro.repeat(repeticoes, numero)) / numero
+
+    def _medir(self, nome, dados, repeticoes):
+        corpo = JSONRenderer().render(dados)
+        if JSONRapidoRenderer().render(dados) != corpo:
+            self.stderr.write(f"{nome}: o JSON dos dois renderers é diferente!")
+        linhas = [f"{nome} ({len(corpo) / 1024:.1f} KiB):"]
+        for operacao, drf, rapido in (
+            ('render', lambda: JSONRenderer().render(dados), lambda: JSONRapidoRenderer().render(dados)),
+            ('parse', lambda: JSONParser().parse(io.BytesIO(corpo)), lambda: JSONRapidoParser().parse(io.BytesIO(corpo))),
+        ):
+            antes, depois = self._melhor(drf, repeticoes), self._melhor(rapido, repeticoes)
+            linhas.append(f"  {operacao}: DRF {antes * 1000:.3f} ms, orjson {depois * 1000:.3f} ms ({antes / depois:.1f}x)")
+        self.stdout.write('\n'.join(linhas))
@@ -0,0 +1,99 @@
+import statistics
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from usuarios import leitura_rapida
+from usuarios.models import Usuario, Paciente, Sessao, Relatorio
+from usuarios.serializers import SessaoSerializer, RelatorioSerializer
+
+
+class _Desfazer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede linhas por segundo das listas de sessões e relatórios com o serializer "
+        "e com a leitura rápida (usuarios/leitura_rapida.py), do pedido à base de dados "
+        "até ao JSON. Os dados de teste são criados numa transação desfeita no fim."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=10000, help="Sessões e relatórios do terapeuta de teste.")
+        parser.add_argument('--pacientes', type=int, default=50, help="Pacientes por onde as linhas são distribuídas.")
+        parser.add_argument('--repeticoes', type=int, default=3, help="Execuções de cada variante.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic(using=router.db_for_write(Sessao)):
+                terapeuta = self._criar_dados(options['linhas'], options['pacientes'])
+                listas = (
+                    ('sessoes', SessaoSerializer, Sessao.objects.filter(terapeuta=terapeuta).select_related(
+                        'terapeuta', 'paciente__usuario', 'paciente__terapeuta').order_by('-data')),
+                    ('relatorios', RelatorioSerializer, Relatorio.objects.filter(terapeuta=terapeuta).select_related(
+                        'terapeuta', 'paciente__usuario', 'paciente__terapeuta').order_by('-data_criacao')),
+                )
+                for nome, serializer_class, queryset in listas:
+                    plano = leitura_rapida.compilar(serializer_class)
+                    variantes = (
+                        ('serializer', lambda: serializer_class(queryset.all(), many=True).data),
+                        ('leitura rápida', lambda: plano.serializar(plano.consulta(queryset.all()), {})),
+                    )
+                    corpos = {}
+                    for variante, construir in variantes:
+                        corpos[variante] = self._medir(f"{nome} / {variante}", construir, options['linhas'], options['repeticoes'])
+                    if len(set(corpos.values())) != 1:
+                        self.stderr.write(f"{nome}: o JSON das duas variantes é diferente!")
+                raise _Desfazer
+        except _Desfazer:
+            pass
+
+    def _criar_dados(self, n_linhas, n_pacientes):
+        terapeuta = Usuario.objects.create_user(
+            email=f"bench-{uuid.uuid4().hex}@example.com", password=None, tipo='terapeuta',
+            first_name="Terapeuta", last_name="de Teste",
+        )
+        pacientes = []
+        for i in range(n_pacientes):
+            user = Usuario.objects.create_user(email=f"bench-{uuid.uuid4().hex}@example.com", password=None, tipo='paciente')
+            pacientes.append(Paciente.objects.create(usuario=user, nome_completo=f"Paciente {i}", terapeuta=terapeuta))
+        agora = timezone.now()
+        Sessao.objects.bulk_create(
+            [
+                Sessao(
+                    terapeuta=terapeuta, paciente=pacientes[i % n_pacientes], data=agora - timedelta(hours=i),
+                    duracao=timedelta(minutes=50), status='concluida', observacoes="Sessão de acompanhamento.",
+                )
+                for i in range(n_linhas)
+            ],
+            batch_size=1000,
+        )
+        Relatorio.objects.bulk_create(
+            [
+                Relatorio(
+                    terapeuta=terapeuta, paciente=pacientes[i % n_pacientes], titulo=f"Relatório {i}",
+                    conteudo="Evolução estável, sem alterações a registar. " * 5,
+                )
+                for i in range(n_linhas)
+            ],
+            batch_size=1000,
+        )
+        self.stdout.write(f"Terapeuta de teste: {n_linhas:,} sessões e {n_linhas:,} relatórios de {n_pacientes} pacientes.")
+        return terapeuta
+
+    def _medir(self, nome, construir, n_linhas, repeticoes):
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            corpo = JSONRenderer().render(construir())
+            tempos.append(time.perf_counter() - inicio)
+        mediana = statistics.median(tempos)
+        self.stdout.write(f"{nome}: {mediana * 1000:.0f} ms (mediana), {n_linhas / mediana:,.0f} linhas/s")
+        return corpo
@@ -0,0 +1,91 @@
+import gzip
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ia.models import Conversa
+from usuarios.models import Usuario, Paciente, Sessao, Relatorio, Mensagem
+
+
+class _Desfazer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o tamanho das respostas das listas no formato aninhado e com "
+        "?formato=normalizado (usuarios/normalizado.py), sem e com gzip, para um terapeuta "
+        "de teste. Os dados de teste são criados numa transação desfeita no fim."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=20, help="Pacientes do terapeuta de teste.")
+        parser.add_argument('--por-paciente', type=int, default=25, help="Sessões, relatórios, mensagens e conversas por paciente.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic(using=router.db_for_write(Sessao)):
+                with transaction.atomic(using=router.db_for_write(Conversa)):
+                    terapeuta, paciente = self._criar_dados(options['pacientes'], options['por_paciente'])
+                    for nome, user in (
+                        ('usuarios:paciente-list', terapeuta), ('usuarios:sessao-list', terapeuta),
+                        ('usuarios:relatorio-list', terapeuta), ('usuarios:mensagem-list', terapeuta),
+                        ('ia:historico_api', paciente),
+                    ):
+                        self._comparar(nome, user)
+                    raise _Desfazer
+        except _Desfazer:
+            pass
+
+    def _criar_dados(self, n_pacientes, por_paciente):
+        terapeuta = Usuario.objects.create_user(
+            email=f"bench-{uuid.uuid4().hex}@example.com", password=None, tipo='terapeuta',
+            first_name="Terapeuta", last_name="de Teste", especialidade="Psicologia clínica",
+        )
+        agora = timezone.now()
+        for i in range(n_pacientes):
+            user = Usuario.objects.create_user(
+                email=f"bench-{uuid.uuid4().hex}@example.com", password=None, tipo='paciente', first_name=f"Paciente {i}",
+            )
+            perfil = Paciente.objects.create(usuario=user, nome_completo=f"Paciente {i}", terapeuta=terapeuta)
+            Sessao.objects.bulk_create([
+                Sessao(terapeuta=terapeuta, paciente=perfil, data=agora - timedelta(days=j), duracao=timedelta(minutes=50))
+                for j in range(por_paciente)
+            ])
+            Relatorio.objects.bulk_create([
+                Relatorio(terapeuta=terapeuta, paciente=perfil, titulo=f"Relatório {j}", conteudo="Evolução estável.")
+                for j in range(por_paciente)
+            ])
+            Mensagem.objects.bulk_create([
+                Mensagem(remetente=user, destinatario=terapeuta, assunto="Olá", conteudo="Até à próxima sessão.")
+                for j in range(por_paciente)
+            ])
+            Conversa.objects.bulk_create([
+                Conversa(
+                    usuario=user, mensagem_usuario=f"Mensagem {j}", resposta_ia="Resposta",
+                    sentimento='Neutro', categoria_sentimento='Geral', intensidade_sentimento='Baixa',
+                )
+                for j in range(por_paciente)
+            ])
+        self.stdout.write(f"Terapeuta de teste: {n_pacientes} pacientes, {por_paciente} linhas de cada tipo por paciente.")
+        return terapeuta, user
+
+    def _comparar(self, nome, user):
+        url = reverse(nome)
+        tamanhos = []
+        for parametros in ({}, {'formato': 'normalizado'}):
+            request = APIRequestFactory().get(url, parametros)
+            force_authenticate(request, user=user)
+            response = resolve(url).func(request)
+            response.render()
+            tamanhos.append((len(response.content), len(gzip.compress(response.content))))
+        (aninhado, aninhado_gz), (normal, normal_gz) = tamanhos
+        self.stdout.write(
+            f"{nome}: {aninhado / 1024:.1f} KiB -> {normal / 1024:.1f} KiB ({normal / aninhado - 1:+.0%}); "
+            f"gzip {aninhado_gz / 1024:.1f} KiB -> {normal_gz / 1024:.1f} KiB ({normal_gz / aninhado_gz - 1:+.0%})"
+        )
@@ -0,0 +1,115 @@
+import json
+import statistics
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from ia.models import Conversa
+from usuarios import paineis
+from usuarios.models import Usuario, Paciente, Sessao
+from usuarios.serializers import PacienteSerializer, SessaoSerializer
+
+
+class _Desfazer(Exception):
+    pass
+
+
+def painel_antigo(user):
+    """O painel do paciente como era antes: todas as sessões e filtros __date."""
+    paciente_perfil = Paciente.objects.filter(usuario=user).first()
+    hoje = date.today()
+    inicio_semana = hoje - timedelta(days=hoje.weekday())
+    ultima = Conversa.objects.filter(usuario=user).only('sentimento').order_by('-data_conversa').first()
+    proxima = Sessao.objects.filter(paciente=paciente_perfil, data__date__gte=hoje).order_by('data').first()
+    return {
+        'paciente_perfil': PacienteSerializer(paciente_perfil).data,
+        'totalConversas': Conversa.objects.filter(usuario=user).count(),
+        'conversasEssaSemana': Conversa.objects.filter(
+            usuario=user, data_conversa__date__gte=inicio_semana, data_conversa__date__lte=hoje
+        ).count(),
+        'sentimentoMedio': ultima.sentimento if ultima else 'N/A',
+        'proximaSessao': proxima.data.isoformat() if proxima else None,
+        'sessoes': SessaoSerializer(Sessao.objects.filter(paciente=paciente_perfil).order_by('-data'), many=True).data,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o painel do paciente antigo (todas as sessões) com o atual, para um paciente "
+        "de teste com muitas sessões e conversas. Os dados de teste são criados numa transação "
+        "desfeita no fim."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessoes', type=int, default=3000, help="Sessões do paciente de teste.")
+        parser.add_argument('--conversas', type=int, default=5000, help="Conversas do paciente de teste.")
+        parser.add_argument('--repeticoes', type=int, default=5, help="Execuções de cada variante.")
+
+    def handle(self, *args, **options):
+        aliases = {router.db_for_write(Sessao), router.db_for_write(Conversa)}
+        try:
+            with ExitStack() as pilha:
+                for alias in aliases:
+                    pilha.enter_context(transaction.atomic(using=alias))
+                user = self._criar_dados(options['sessoes'], options['conversas'])
+                for nome, construir in (('antigo', painel_antigo), ('atual', paineis.painel_paciente)):
+                    self._medir(nome, lambda: construir(user), options['repeticoes'])
+                raise _Desfazer
+        except _Desfazer:
+            pass
+
+    def _criar_dados(self, n_sessoes, n_conversas):
+        terapeuta = Usuario.objects.create_user(email=f"bench-{uuid.uuid4().hex}@example.com", password=None, tipo='terapeuta')
+        user = Usuario.objects.create_user(email=f"bench-{uuid.uuid4().hex}@example.com", password=None, tipo='paciente')
+        paciente = Paciente.objects.create(usuario=user, nome_completo="Paciente de teste", terapeuta=terapeuta)
+        agora = timezone.now()
+        # Metade das sessões no passado e metade no futuro, uma por dia
+        Sessao.objects.bulk_create(
+            [
+                Sessao(
+                    terapeuta=terapeuta, paciente=paciente, data=agora + timedelta(days=i - n_sessoes // 2),
+                    duracao=timedelta(hours=1), status='concluida' if i < n_sessoes // 2 else 'agendada',
+                )
+                for i in range(n_sessoes)
+            ],
+            batch_size=1000,
+        )
+        Conversa.objects.bulk_create(
+            [
+                Conversa(
+                    usuario=user, mensagem_usuario=f"Mensagem {i}", resposta_ia="Resposta",
+                    sentimento='Neutro', categoria_sentimento='Geral', intensidade_sentimento='Baixa',
+                )
+                for i in range(n_conversas)
+            ],
+            batch_size=1000,
+        )
+        self.stdout.write(f"Paciente de teste: {n_sessoes:,} sessões e {n_conversas:,} conversas.")
+        return user
+
+    def _medir(self, nome, construir, repeticoes):
+        tempos, consultas = [], []
+
+        def contar(execute, sql, params, many, context):
+            consultas[-1] += 1
+            return execute(sql, params, many, context)
+
+        for _ in range(repeticoes):
+            consultas.append(0)
+            with ExitStack() as pilha:
+                for alias in connections:
+                    pilha.enter_context(connections[alias].execute_wrapper(contar))
+                inicio = time.perf_counter()
+                dados = construir()
+                corpo = json.dumps(dados, cls=DjangoJSONEncoder)
+                tempos.append(time.perf_counter() - inicio)
+        self.stdout.write(
+            f"{nome}: {statistics.median(tempos) * 1000:.1f} ms (mediana), "
+            f"{consultas[-1]} consultas, resposta com {len(corpo.encode('utf-8')) / 1024:.1f} KiB"
+        )
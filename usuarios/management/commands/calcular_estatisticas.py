@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from usuarios import estatisticas
+from usuarios.models import Paciente, EstatisticasPaciente
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula as estatísticas dos pacientes ativos nos últimos dias (conversas, sentimentos, "
+        "sessões e mensagens não lidas) e grava um instantâneo por paciente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=30, help="Dias incluídos em cada instantâneo.")
+        parser.add_argument('--lote', type=int, default=500, help="Pacientes calculados por lote.")
+        parser.add_argument('--manter-dias', type=int, default=90, help="Remove os instantâneos mais antigos do que isto.")
+
+    def handle(self, *args, **options):
+        fim = timezone.now()
+        inicio = fim - timedelta(days=options['dias'])
+
+        total = 0
+        ultimo_id = 0
+        while True:
+            lote = list(
+                Paciente.objects.ativos()
+                .filter(pk__gt=ultimo_id)
+                .order_by('pk')
+                .only('pk', 'terapeuta_id')[:options['lote']]
+            )
+            if not lote:
+                break
+            total += estatisticas.gravar_instantaneos(lote, inicio, fim)
+            ultimo_id = lote[-1].pk
+            self.stdout.write(f"{total} pacientes calculados...")
+
+        removidos, _ = EstatisticasPaciente.objects.filter(criado_em__lt=fim - timedelta(days=options['manter_dias'])).delete()
+        self.stdout.write(self.style.SUCCESS(f"Concluído: {total} instantâneos gravados, {removidos} antigos removidos."))
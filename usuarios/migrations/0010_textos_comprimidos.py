@@ -0,0 +1,51 @@
+# Compressão dos textos de Sessao, Mensagem e Relatorio (passo 1 de 2).
+#
+# Acrescenta colunas binárias *_comprimido e preenche-as em lotes de chaves
+# primárias, cada lote na sua própria transação (atomic = False). Pode ser
+# reexecutada: só copia as linhas com a coluna nova ainda nula. Alterações a
+# linhas já copiadas enquanto a migração corre não são levadas para a coluna
+# nova; execute-a num período de pouco tráfego.
+
+from django.db import migrations
+
+import core.fields
+from core.migracoes import copiar_coluna_em_lotes
+
+CAMPOS = (
+    ('Sessao', 'observacoes'),
+    ('Mensagem', 'conteudo'),
+    ('Relatorio', 'conteudo'),
+)
+
+
+def copiar(apps, schema_editor):
+    for modelo, campo in CAMPOS:
+        copiar_coluna_em_lotes(apps.get_model('usuarios', modelo), campo, f'{campo}_comprimido')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('usuarios', '0009_alter_notificacao_usuario_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessao',
+            name='observacoes_comprimido',
+            field=core.fields.CampoTextoComprimido(null=True),
+        ),
+        migrations.AddField(
+            model_name='mensagem',
+            name='conteudo_comprimido',
+            field=core.fields.CampoTextoComprimido(null=True),
+        ),
+        migrations.AddField(
+            model_name='relatorio',
+            name='conteudo_comprimido',
+            field=core.fields.CampoTextoComprimido(null=True),
+        ),
+        migrations.RunPython(copiar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Compressão dos textos de Sessao, Mensagem e Relatorio (passo 2 de 2).
+#
+# Copia as linhas criadas depois do passo 1, remove as colunas de texto e dá
+# às colunas comprimidas o nome original.
+
+from importlib import import_module
+
+from django.db import migrations
+
+import core.fields
+
+_passo1 = import_module('usuarios.migrations.0010_textos_comprimidos')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0010_textos_comprimidos'),
+    ]
+
+    operations = [
+        migrations.RunPython(_passo1.copiar, migrations.RunPython.noop),
+        migrations.RemoveField(model_name='sessao', name='observacoes'),
+        migrations.RemoveField(model_name='mensagem', name='conteudo'),
+        migrations.RemoveField(model_name='relatorio', name='conteudo'),
+        migrations.RenameField(model_name='sessao', old_name='observacoes_comprimido', new_name='observacoes'),
+        migrations.RenameField(model_name='mensagem', old_name='conteudo_comprimido', new_name='conteudo'),
+        migrations.RenameField(model_name='relatorio', old_name='conteudo_comprimido', new_name='conteudo'),
+        migrations.AlterField(
+            model_name='sessao',
+            name='observacoes',
+            field=core.fields.CampoTextoComprimido(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='mensagem',
+            name='conteudo',
+            field=core.fields.CampoTextoComprimido(),
+        ),
+        migrations.AlterField(
+            model_name='relatorio',
+            name='conteudo',
+            field=core.fields.CampoTextoComprimido(),
+        ),
+    ]
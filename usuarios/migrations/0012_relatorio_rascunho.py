@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-19 05:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0011_textos_comprimidos_troca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relatorio',
+            name='conversas_ate',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='relatorio',
+            name='rascunho',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-19 05:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0012_relatorio_rascunho'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticasPaciente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo_inicio', models.DateTimeField()),
+                ('periodo_fim', models.DateTimeField()),
+                ('dados', models.JSONField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estatisticas', to='usuarios.paciente')),
+            ],
+            options={
+                'verbose_name': 'Estatísticas do Paciente',
+                'verbose_name_plural': 'Estatísticas dos Pacientes',
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['paciente', '-criado_em'], name='estatisticas_paciente_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-19 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0013_estatisticaspaciente'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sessao',
+            index=models.Index(fields=['paciente', 'data'], name='sessao_paciente_data_idx'),
+        ),
+    ]
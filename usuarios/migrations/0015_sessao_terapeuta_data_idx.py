@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-19 05:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0014_sessao_paciente_data_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sessao',
+            index=models.Index(fields=['terapeuta', 'data'], name='sessao_terapeuta_data_idx'),
+        ),
+    ]
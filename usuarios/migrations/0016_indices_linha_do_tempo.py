@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-19 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0015_sessao_terapeuta_data_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mensagem',
+            index=models.Index(fields=['remetente', '-data_envio', '-id'], name='mensagem_remetente_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mensagem',
+            index=models.Index(fields=['destinatario', '-data_envio', '-id'], name='mensagem_destinat_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacao',
+            index=models.Index(fields=['usuario', '-data_criacao', '-id'], name='notif_usuario_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relatorio',
+            index=models.Index(fields=['paciente', '-data_criacao', '-id'], name='relatorio_paciente_data_idx'),
+        ),
+    ]
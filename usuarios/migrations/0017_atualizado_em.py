@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-19 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0016_indices_linha_do_tempo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mensagem',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='notificacao',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='relatorio',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
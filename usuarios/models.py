@@ -5,6 +5,8 @@ from datetime import date, timedelta
 from django.conf import settings
 from django.utils import timezone
 
+from core.fields import CampoTextoComprimido
+
 class UsuarioManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -89,6 +91,25 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
         return None
 
 
+class PacienteQuerySet(models.QuerySet):
+    def visiveis_para(self, user):
+        """
+        Pacientes que o utilizador pode consultar: os pacientes do terapeuta,
+        o próprio perfil de um paciente ou todos, para superutilizadores.
+        """
+        if user.tipo == 'terapeuta':
+            return self.filter(terapeuta=user)
+        elif user.tipo == 'paciente':
+            return self.filter(usuario=user)
+        elif user.is_superuser:
+            return self.all()
+        return self.none()
+
+    def ativos(self):
+        """Pacientes acompanhados: com terapeuta e com o utilizador ativo."""
+        return self.filter(terapeuta__isnull=False, usuario__is_active=True)
+
+
 class Paciente(models.Model):
     usuario = models.OneToOneField(
         Usuario,
@@ -126,6 +147,8 @@ class Paciente(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
+    objects = PacienteQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Paciente"
         verbose_name_plural = "Pacientes"
@@ -172,7 +195,7 @@ class Sessao(models.Model):
     data = models.DateTimeField()
     duracao = models.DurationField(help_text="Duração da sessão")
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='agendada')
-    observacoes = models.TextField(blank=True, default='')
+    observacoes = CampoTextoComprimido(blank=True, default='')
 
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
@@ -181,6 +204,12 @@ class Sessao(models.Model):
         verbose_name = "Sessão"
         verbose_name_plural = "Sessões"
         ordering = ['data']
+        indexes = [
+            # Próximas sessões e sessões recentes de um paciente (painel do paciente)
+            models.Index(fields=['paciente', 'data'], name='sessao_paciente_data_idx'),
+            # Utilização por terapeuta e semana (usuarios/utilizacao.py)
+            models.Index(fields=['terapeuta', 'data'], name='sessao_terapeuta_data_idx'),
+        ]
 
     @property
     def duracao_timedelta(self):
@@ -206,14 +235,20 @@ class Mensagem(models.Model):
         related_name='mensagens_recebidas'
     )
     assunto = models.CharField(max_length=255, blank=True)
-    conteudo = models.TextField()
+    conteudo = CampoTextoComprimido()
     data_envio = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
     lida = models.BooleanField(default=False)
 
     class Meta:
         verbose_name = "Mensagem"
         verbose_name_plural = "Mensagens"
         ordering = ['-data_envio']
+        indexes = [
+            # Mensagens enviadas e recebidas de um utilizador, das mais recentes (linha do tempo)
+            models.Index(fields=['remetente', '-data_envio', '-id'], name='mensagem_remetente_data_idx'),
+            models.Index(fields=['destinatario', '-data_envio', '-id'], name='mensagem_destinat_data_idx'),
+        ]
 
     def __str__(self):
         return f"De: {self.remetente.email} para: {self.destinatario.email} - Assunto: {self.assunto[:50]}"
@@ -232,13 +267,22 @@ class Relatorio(models.Model):
         related_name='relatorios_recebidos'
     )
     titulo = models.CharField(max_length=255)
-    conteudo = models.TextField()
+    conteudo = CampoTextoComprimido()
     data_criacao = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    # Os resumos gerados pelo comando resumir_conversas ficam em rascunho até o
+    # terapeuta os rever; os pacientes não veem rascunhos.
+    rascunho = models.BooleanField(default=False)
+    # Id da última Conversa incluída num resumo automático (ver ia/resumos.py)
+    conversas_ate = models.BigIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = "Relatório"
         verbose_name_plural = "Relatórios"
         ordering = ['-data_criacao']
+        indexes = [
+            models.Index(fields=['paciente', '-data_criacao', '-id'], name='relatorio_paciente_data_idx'),
+        ]
 
     def __str__(self):
         return f"Relatório de {self.terapeuta.get_full_name()} para {self.paciente.nome_completo} - {self.titulo}"
@@ -304,10 +348,52 @@ class Notificacao(models.Model):
         verbose_name='Data de Criação'
     )
 
+    # Data e hora da última alteração (por exemplo, ao ser marcada como lida)
+    atualizado_em = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Atualizado em'
+    )
+
     class Meta:
         verbose_name = 'Notificação'
         verbose_name_plural = 'Notificações'
         ordering = ['-data_criacao'] # Notificações mais recentes primeiro
+        indexes = [
+            # Contagem de alertas não lidos no painel do terapeuta
+            models.Index(fields=['usuario', 'tipo', 'lida'], name='notif_usuario_tipo_lida_idx'),
+            # Notificações de um utilizador, das mais recentes (linha do tempo do paciente)
+            models.Index(fields=['usuario', '-data_criacao', '-id'], name='notif_usuario_data_idx'),
+        ]
 
     def __str__(self):
         return f"[{self.get_tipo_display()}] {self.assunto} para {self.usuario.email}"
+
+
+class EstatisticasPaciente(models.Model):
+    """
+    Instantâneo das estatísticas de um paciente num período (conversas com a IA,
+    sessões e mensagens), calculado em lote pelo comando calcular_estatisticas
+    (ver usuarios/estatisticas.py) para não ler quatro tabelas a cada pedido.
+    """
+    paciente = models.ForeignKey(
+        Paciente,
+        on_delete=models.CASCADE,
+        related_name='estatisticas'
+    )
+    periodo_inicio = models.DateTimeField()
+    periodo_fim = models.DateTimeField()
+    # Estrutura descrita em usuarios/estatisticas.py, com as chaves já no formato da API
+    dados = models.JSONField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Estatísticas do Paciente"
+        verbose_name_plural = "Estatísticas dos Pacientes"
+        ordering = ['-criado_em']
+        indexes = [
+            # O instantâneo mais recente de um paciente é a primeira entrada deste índice
+            models.Index(fields=['paciente', '-criado_em'], name='estatisticas_paciente_idx'),
+        ]
+
+    def __str__(self):
+        return f"Estatísticas de {self.paciente_id} em {self.criado_em:%d/%m/%Y}"
@@ -0,0 +1,115 @@
+"""
+Formato normalizado das listas (?formato=normalizado): em cada linha, os
+utilizadores e pacientes aninhados dão lugar ao seu id, e cada objeto aparece
+uma só vez no mapa 'included', agrupado por tipo e indexado pelo id:
+
+    {
+        "results": [{"id": 7, "terapeuta": 3, "paciente": 12, ...}],
+        "included": {
+            "usuarios": {"3": {...}, "12": {...}},
+            "pacientes": {"12": {"id": 12, "usuario": 12, "terapeuta": 3, ...}}
+        }
+    }
+
+Os objetos incluídos também são normalizados (o paciente traz os ids do seu
+utilizador e do seu terapeuta). A transformação parte da estrutura do
+serializer, não dos dados, por isso serve para qualquer serializer que aninhe
+um serializer de Usuario ou de Paciente, também com ?fields=/?expand= (um
+objeto que já vem como id fica como está). Com ?fields=paciente.nome_completo
+ou ?exclude=paciente.id, o id dos objetos que vão para 'included' é pedido
+na mesma (com_ids), porque é a sua chave.
+"""
+from rest_framework import serializers
+
+from .models import Usuario, Paciente
+
+# Modelo dos objetos aninhados que passam para 'included', com o nome do grupo
+INCLUIDOS = {Usuario: 'usuarios', Paciente: 'pacientes'}
+
+FORMATOS = ('aninhado', 'normalizado')
+
+
+def estrutura(serializer):
+    """(campo, grupo em 'included' ou None, estrutura) dos objetos aninhados de um serializer."""
+    return tuple(
+        (nome, INCLUIDOS.get(campo.Meta.model) if hasattr(campo, 'Meta') else None, estrutura(campo))
+        for nome, campo in serializer.fields.items()
+        if isinstance(campo, serializers.Serializer) and not campo.write_only
+    )
+
+
+def _caminhos_incluidos(aninhados, prefixo=''):
+    """Caminhos ('paciente', 'paciente.usuario') dos objetos que vão para 'included'."""
+    for nome, grupo, sub_aninhados in aninhados:
+        caminho = f'{prefixo}{nome}'
+        if grupo is not None:
+            yield caminho
+        yield from _caminhos_incluidos(sub_aninhados, f'{caminho}.')
+
+
+def com_ids(campos, serializer_class):
+    """
+    fields/exclude pedidos (core/serializers.campos_pedidos) com o id de cada
+    objeto aninhado que vai para 'included': 'paciente.nome_completo' em fields
+    passa a levar também 'paciente.id', e 'paciente.id' sai de exclude.
+    """
+    if 'fields' not in campos and 'exclude' not in campos:
+        return campos
+    caminhos = list(_caminhos_incluidos(estrutura(serializer_class())))
+    campos = dict(campos)
+    if 'fields' in campos:
+        campos['fields'] = campos['fields'] | {
+            f'{caminho}.id' for caminho in caminhos
+            if any(campo.startswith(f'{caminho}.') for campo in campos['fields'])
+        }
+    if 'exclude' in campos:
+        campos['exclude'] = campos['exclude'] - {f'{caminho}.id' for caminho in caminhos}
+    return campos
+
+
+class _Normalizador:
+
+    def __init__(self):
+        self.incluidos = {}
+
+    def objeto(self, dados, aninhados):
+        saida = dict(dados)
+        for nome, grupo, sub_aninhados in aninhados:
+            valor = saida.get(nome)
+            if valor is None:
+                continue
+            if grupo is None:
+                saida[nome] = self.objeto(valor, sub_aninhados)
+                continue
+            saida[nome] = valor['id']
+            objetos = self.incluidos.setdefault(grupo, {})
+            chave = str(valor['id'])
+            if chave not in objetos:
+                objetos[chave] = self.objeto(valor, sub_aninhados)
+        return saida
+
+
+def normalizar(linhas, serializer):
+    """Linhas serializadas com serializer -> (linhas com ids, mapa 'included')."""
+    normalizador, aninhados = _Normalizador(), estrutura(serializer)
+    return [normalizador.objeto(linha, aninhados) for linha in linhas], normalizador.incluidos
+
+
+def formato_pedido(request):
+    """O formato pedido em ?formato= (ValueError se não for um de FORMATOS)."""
+    formato = request.query_params.get('formato', 'aninhado')
+    if formato not in FORMATOS:
+        raise ValueError(formato)
+    return formato
+
+
+def corpo(dados, serializer):
+    """
+    Corpo da resposta normalizada de uma lista: 'results' e 'included'; numa
+    lista paginada (dict com 'results') os restantes campos mantêm-se.
+    """
+    if isinstance(dados, dict):
+        resultados, incluidos = normalizar(dados['results'], serializer)
+        return {**dados, 'results': resultados, 'included': incluidos}
+    resultados, incluidos = normalizar(dados, serializer)
+    return {'results': resultados, 'included': incluidos}
@@ -0,0 +1,368 @@
+"""
+Dados dos painéis do terapeuta e do paciente, com cache por utilizador.
+
+Cada painel é guardado no cache junto com as versões de que depende: a versão
+do próprio utilizador e, para superutilizadores (que veem todos os pacientes),
+uma versão global. Os sinais de usuarios/signals.py trocam essas versões quando
+uma Conversa, Sessao, Paciente ou Notificacao do terapeuta ou do paciente muda,
+depois do commit. Uma leitura com as versões em dia custa um único get_many ao
+cache e nenhuma consulta à base de dados.
+
+Quando o painel tem de ser reconstruído, só um pedido de cada vez o faz (um
+bloqueio com cache.add); os restantes recebem a versão anterior, se existir, ou
+esperam pela reconstrução. Os acertos e falhas são contados em 'metricas'.
+"""
+import asyncio
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as hora, timedelta
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from ia.models import Conversa, EstadoRiscoPaciente
+from .models import Paciente, Sessao, Notificacao
+from .serializers import UsuarioSerializer, PacienteSerializer, SessaoResumoSerializer, NotificacaoSerializer
+
+PAINEL_LIMITE_PADRAO = 50
+PAINEL_LIMITE_MAXIMO = 200
+SESSOES_NO_PAINEL = 5           # Próximas sessões e sessões recentes no painel do paciente
+HISTORICO_SESSOES_LIMITE = 20   # Tamanho de página do link para o histórico de sessões
+
+CACHE_SEGUNDOS = 600        # Rede de segurança para alterações que não passam pelos sinais
+BLOQUEIO_SEGUNDOS = 30
+ESPERA_RECONSTRUCAO = 2.0   # Tempo máximo à espera de outro pedido que esteja a reconstruir
+CHAVE_VERSAO_GLOBAL = 'painel:versao:todos'
+
+
+# --- Construção dos painéis ---
+#
+# Cada painel é descrito por etapas e uma função 'montar'. Uma etapa recebe os
+# resultados das anteriores e devolve {nome: função sem argumentos}; as funções
+# de uma mesma etapa são consultas independentes. _executar corre-as uma a uma;
+# _aexecutar corre as de cada etapa em simultâneo, em threads com ligações
+# próprias à base de dados, e a latência passa a ser a da consulta mais lenta
+# de cada etapa em vez da soma de todas.
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, hora.min))
+
+
+def _etapas_terapeuta(user, pagina, limite):
+    hoje = timezone.localdate()
+    inicio_hoje, amanha = _inicio_do_dia(hoje), _inicio_do_dia(hoje + timedelta(days=1))
+    inicio = (pagina - 1) * limite
+
+    def pacientes(r):
+        sessoes = Sessao.objects.filter(data__gte=inicio_hoje, status='agendada')
+        if user.tipo == 'terapeuta':
+            sessoes = sessoes.filter(terapeuta=user)
+        return {
+            # Lista materializada: as conversas podem estar noutra base de dados (core/db_router.py)
+            'ids': lambda: list(Paciente.objects.visiveis_para(user).values_list('pk', flat=True)),
+            'sessoesPendentes': sessoes.count,
+            # Alertas gerados pelo detetor de risco (ia/risco.py) ainda não lidos pelo terapeuta
+            'alertasUrgentes': Notificacao.objects.filter(usuario=user, tipo='alerta', lida=False).count,
+            'alertas': lambda: NotificacaoSerializer(
+                Notificacao.objects.filter(usuario=user).select_related('usuario').order_by('-data_criacao')[:5], many=True
+            ).data,
+        }
+
+    def atividade(r):
+        # A página de pacientes ativos vem da última atividade mantida em EstadoRiscoPaciente
+        ativos = EstadoRiscoPaciente.objects.filter(usuario_id__in=r['ids'], ultima_conversa_em__isnull=False)
+        return {
+            'conversasHoje': Conversa.objects.filter(
+                usuario_id__in=r['ids'], data_conversa__gte=inicio_hoje, data_conversa__lt=amanha
+            ).count,
+            'totalAtivos': ativos.count,
+            'estados': lambda: list(
+                ativos.order_by('-ultima_conversa_em', 'usuario_id')
+                .values_list('usuario_id', 'ultima_conversa_em', 'ultimo_sentimento')[inicio:inicio + limite]
+            ),
+        }
+
+    def nomes(r):
+        return {
+            'nomes': lambda: dict(
+                Paciente.objects.filter(pk__in=[e[0] for e in r['estados']]).values_list('pk', 'nome_completo')
+            ),
+        }
+
+    def montar(r):
+        return {
+            'terapeuta': UsuarioSerializer(user).data,
+            'totalPacientes': len(r['ids']),
+            'conversasHoje': r['conversasHoje'],
+            'sessoesPendentes': r['sessoesPendentes'],
+            'alertasUrgentes': r['alertasUrgentes'],
+            'pacientesAtivos': [
+                {
+                    'id': usuario_id,
+                    'nome': r['nomes'].get(usuario_id, ''),
+                    'ultimaConversa': ultima_conversa_em.isoformat(),
+                    'sentimento': ultimo_sentimento,
+                }
+                for usuario_id, ultima_conversa_em, ultimo_sentimento in r['estados']
+            ],
+            'paginacao': {'pagina': pagina, 'limite': limite, 'total': r['totalAtivos']},
+            'alertas': r['alertas'],
+            'detail': 'Dados do painel do terapeuta retornados com sucesso.'
+        }
+
+    return [pacientes, atividade, nomes], montar
+
+
+def _etapas_paciente(user):
+    # Intervalos de datas com hora (em vez de __date), para usar os índices
+    # (usuario, -data_conversa) e (paciente, data)
+    hoje = timezone.localdate()
+    inicio_hoje = _inicio_do_dia(hoje)
+    inicio_semana = _inicio_do_dia(hoje - timedelta(days=hoje.weekday()))
+    amanha = _inicio_do_dia(hoje + timedelta(days=1))
+
+    def consultas(r):
+        perfil = Paciente.objects.select_related('usuario', 'terapeuta').filter(usuario=user)
+        conversas = Conversa.objects.filter(usuario=user)
+        # O id do paciente é o do utilizador: as sessões não precisam de esperar pelo perfil
+        sessoes = Sessao.objects.filter(paciente_id=user.pk)
+        return {
+            'perfil': lambda: next((PacienteSerializer(p).data for p in perfil[:1]), None),
+            'contagens': lambda: conversas.order_by().aggregate(
+                total=Count('id'),
+                semana=Count('id', filter=Q(data_conversa__gte=inicio_semana, data_conversa__lt=amanha)),
+            ),
+            'ultimoSentimento': conversas.order_by('-data_conversa', '-id').values_list('sentimento', flat=True).first,
+            'totalSessoes': sessoes.count,
+            'proximas': lambda: list(sessoes.filter(data__gte=inicio_hoje).order_by('data')[:SESSOES_NO_PAINEL]),
+            'recentes': lambda: list(sessoes.filter(data__lt=inicio_hoje).order_by('-data')[:SESSOES_NO_PAINEL]),
+        }
+
+    def montar(r):
+        if r['perfil'] is None:
+            return None
+        return {
+            'paciente_perfil': r['perfil'],
+            'totalConversas': r['contagens']['total'],
+            'conversasEssaSemana': r['contagens']['semana'],
+            'sentimentoMedio': r['ultimoSentimento'] or 'N/A',
+            'proximaSessao': r['proximas'][0].data.isoformat() if r['proximas'] else None,
+            'proximasSessoes': SessaoResumoSerializer(r['proximas'], many=True).data,
+            'sessoesRecentes': SessaoResumoSerializer(r['recentes'], many=True).data,
+            'totalSessoes': r['totalSessoes'],
+            'historicoSessoes': f"{reverse('usuarios:sessao-list')}?ordering=-data&pagina=1&limite={HISTORICO_SESSOES_LIMITE}",
+            'detail': 'Dados do painel do paciente retornados com sucesso.'
+        }
+
+    return [consultas], montar
+
+
+def _executar(etapas, montar):
+    resultados = {}
+    for etapa in etapas:
+        resultados.update({nome: consulta() for nome, consulta in etapa(resultados).items()})
+    return montar(resultados)
+
+
+_executor = ThreadPoolExecutor(max_workers=settings.PAINEL_THREADS, thread_name_prefix='painel')
+
+
+def _em_thread(consulta):
+    # Como num pedido: fecha as ligações expiradas (CONN_MAX_AGE) ou com erros desta thread
+    close_old_connections()
+    try:
+        return consulta()
+    finally:
+        close_old_connections()
+
+
+async def _aexecutar(etapas, montar):
+    # Limite por pedido, para que um painel não ocupe todas as threads e ligações
+    semaforo = asyncio.Semaphore(settings.PAINEL_CONSULTAS_CONCORRENTES)
+
+    async def correr(consulta):
+        async with semaforo:
+            return await sync_to_async(_em_thread, thread_sensitive=False, executor=_executor)(consulta)
+
+    resultados = {}
+    for etapa in etapas:
+        consultas = etapa(resultados)
+        valores = await asyncio.gather(*(correr(consulta) for consulta in consultas.values()))
+        resultados.update(zip(consultas, valores))
+    return await sync_to_async(montar, thread_sensitive=False, executor=_executor)(resultados)
+
+
+def painel_terapeuta(user, pagina, limite):
+    """
+    Dados do painel do terapeuta. A lista de pacientes ativos vem da última
+    atividade mantida em EstadoRiscoPaciente e é paginada.
+    """
+    return _executar(*_etapas_terapeuta(user, pagina, limite))
+
+
+async def apainel_terapeuta(user, pagina, limite):
+    """painel_terapeuta com as consultas independentes em simultâneo."""
+    return await _aexecutar(*_etapas_terapeuta(user, pagina, limite))
+
+
+def painel_paciente(user):
+    """
+    Dados do painel do paciente, ou None se o utilizador não tiver perfil de
+    paciente. Traz só as próximas sessões e as mais recentes (SESSOES_NO_PAINEL
+    de cada); o histórico completo fica no link paginado 'historicoSessoes'.
+    O número de consultas não depende do número de sessões nem de conversas.
+    """
+    return _executar(*_etapas_paciente(user))
+
+
+async def apainel_paciente(user):
+    """painel_paciente com as consultas em simultâneo."""
+    return await _aexecutar(*_etapas_paciente(user))
+
+
+# --- Métricas ---
+
+class _Metricas:
+    """
+    Acertos e falhas do cache dos painéis. Cada processo conta localmente e
+    soma aos contadores partilhados no cache de 'LOTE' em 'LOTE' eventos, para
+    que um acerto não custe uma escrita no cache.
+    """
+    LOTE = 50
+    EVENTOS = ('HIT', 'MISS', 'STALE')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pendentes = Counter()
+
+    def registar(self, evento):
+        with self._lock:
+            self._pendentes[evento] += 1
+            if sum(self._pendentes.values()) < self.LOTE:
+                return
+            pendentes, self._pendentes = self._pendentes, Counter()
+        self._somar(pendentes)
+
+    def _somar(self, pendentes):
+        for evento, n in pendentes.items():
+            chave = f'painel:metricas:{evento}'
+            try:
+                cache.incr(chave, n)
+            except ValueError:
+                cache.set(chave, n, None)
+
+    def totais(self):
+        """Totais partilhados mais os eventos ainda por somar neste processo."""
+        with self._lock:
+            pendentes = Counter(self._pendentes)
+        partilhados = cache.get_many([f'painel:metricas:{evento}' for evento in self.EVENTOS])
+        totais = {evento: partilhados.get(f'painel:metricas:{evento}', 0) + pendentes[evento] for evento in self.EVENTOS}
+        pedidos = sum(totais.values())
+        return {**totais, 'taxaAcerto': round(totais['HIT'] / pedidos, 4) if pedidos else None}
+
+
+metricas = _Metricas()
+
+
+# --- Cache e invalidação ---
+
+def _chave_versao(usuario_id):
+    return f'painel:versao:{usuario_id}'
+
+
+def invalidar(usuario_ids):
+    """Troca a versão dos painéis destes utilizadores (e dos superutilizadores)."""
+    versao = time.time_ns()
+    chaves = {_chave_versao(usuario_id): versao for usuario_id in usuario_ids if usuario_id}
+    chaves[CHAVE_VERSAO_GLOBAL] = versao
+    cache.set_many(chaves, None)
+
+
+def invalidar_apos_commit(using, *usuario_ids):
+    """Invalida depois do commit, para que uma reconstrução não leia dados ainda por confirmar."""
+    transaction.on_commit(partial(invalidar, usuario_ids), using=using)
+
+
+def versao(usuario_id=None):
+    """
+    Versão atual dos dados de um utilizador (ou de todos, sem usuario_id), trocada
+    pelos mesmos sinais que invalidam os painéis; serve para outras chaves de cache.
+    """
+    chave = _chave_versao(usuario_id) if usuario_id else CHAVE_VERSAO_GLOBAL
+    return _versoes_em_dia([chave], [cache.get(chave)])[0]
+
+
+def _chaves_versao(user):
+    return [_chave_versao(user.pk)] + ([CHAVE_VERSAO_GLOBAL] if user.is_superuser else [])
+
+
+def versoes(user):
+    """Versões atuais de que dependem os painéis do utilizador (ver em_cache)."""
+    chaves_versao = _chaves_versao(user)
+    valores = cache.get_many(chaves_versao)
+    return _versoes_em_dia(chaves_versao, [valores.get(c) for c in chaves_versao])
+
+
+def _versoes_em_dia(chaves_versao, versoes):
+    """Versões atuais, criando as que ainda não existem no cache."""
+    atuais = []
+    for chave, versao in zip(chaves_versao, versoes):
+        if versao is None:
+            versao = time.time_ns()
+            if not cache.add(chave, versao, None):
+                versao = cache.get(chave)
+        atuais.append(versao)
+    return tuple(atuais)
+
+
+def em_cache(user, nome, parametros, construir):
+    """
+    Devolve (dados, estado) do painel 'nome' do utilizador, com estado 'HIT',
+    'MISS' ou 'STALE' (versão anterior servida enquanto outro pedido reconstrói).
+    'construir' é chamado sem argumentos; se devolver None, nada é guardado.
+    """
+    chaves_versao = _chaves_versao(user)
+    chave = ':'.join(['painel', nome, str(user.pk), timezone.localdate().isoformat(), *map(str, parametros)])
+
+    valores = cache.get_many([chave, *chaves_versao])
+    versoes = tuple(valores.get(c) for c in chaves_versao)
+    guardado = valores.get(chave)
+    if guardado is not None and None not in versoes and guardado[0] == versoes:
+        metricas.registar('HIT')
+        return guardado[1], 'HIT'
+
+    chave_bloqueio = f'{chave}:bloqueio'
+    bloqueado = cache.add(chave_bloqueio, 1, BLOQUEIO_SEGUNDOS)
+    if not bloqueado:
+        if guardado is not None:
+            metricas.registar('STALE')
+            return guardado[1], 'STALE'
+        limite = time.monotonic() + ESPERA_RECONSTRUCAO
+        while time.monotonic() < limite:
+            time.sleep(0.05)
+            guardado = cache.get(chave)
+            if guardado is not None:
+                metricas.registar('HIT')
+                return guardado[1], 'HIT'
+        # O outro pedido demorou demasiado: reconstrói sem bloqueio
+
+    try:
+        # As versões são lidas antes da base de dados: uma alteração durante a
+        # reconstrução deixa este painel já desatualizado para o próximo pedido
+        versoes = _versoes_em_dia(chaves_versao, versoes)
+        dados = construir()
+        if dados is not None:
+            cache.set(chave, (versoes, dados), CACHE_SEGUNDOS)
+    finally:
+        if bloqueado:
+            cache.delete(chave_bloqueio)
+    metricas.registar('MISS')
+    return dados, 'MISS'
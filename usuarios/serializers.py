@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from core.serializers import CamposDinamicosMixin
 from .models import Usuario, Paciente, Sessao, Mensagem, Relatorio, Notificacao
 from ia.models import Conversa # Importação correta do modelo Conversa
 
-class UsuarioSerializer(serializers.ModelSerializer):
+class UsuarioSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Usuario.
     Inclui um campo de leitura 'idade' que é uma propriedade calculada no modelo.
@@ -42,7 +43,7 @@ class UsuarioSerializer(serializers.ModelSerializer):
         return instance
 
 
-class PacienteSerializer(serializers.ModelSerializer):
+class PacienteSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Paciente.
     Lida com a serialização e desserialização de perfis de pacientes.
@@ -102,7 +103,7 @@ class PacienteSerializer(serializers.ModelSerializer):
         ]
 
 
-class SessaoSerializer(serializers.ModelSerializer):
+class SessaoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Sessao.
     Lida com a serialização e desserialização de sessões.
@@ -136,7 +137,18 @@ class SessaoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'criado_em', 'atualizado_em', 'duracao_timedelta', 'terapeuta', 'paciente']
 
 
-class MensagemSerializer(serializers.ModelSerializer):
+class SessaoResumoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    """
+    Sessão sem os objetos aninhados de paciente e terapeuta, para listas em
+    que estes já são conhecidos (painel do paciente).
+    """
+    class Meta:
+        model = Sessao
+        fields = ['id', 'terapeuta_id', 'data', 'duracao', 'status', 'observacoes']
+        read_only_fields = fields
+
+
+class MensagemSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Mensagem.
     Lida com a serialização e desserialização de mensagens.
@@ -205,7 +217,7 @@ class MensagemSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class ConversaSerializer(serializers.ModelSerializer):
+class ConversaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Conversa (do app 'ia').
     Lida com a serialização e desserialização de conversas com a IA.
@@ -227,7 +239,7 @@ class ConversaSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'data_conversa', 'usuario']
 
 
-class RelatorioSerializer(serializers.ModelSerializer):
+class RelatorioSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Relatorio.
     Lida com a serialização e desserialização de relatórios.
@@ -253,12 +265,12 @@ class RelatorioSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'terapeuta', 'terapeuta_id',
             'paciente', 'paciente_id',
-            'titulo', 'conteudo', 'data_criacao'
+            'titulo', 'conteudo', 'data_criacao', 'rascunho'
         ]
         read_only_fields = ['id', 'data_criacao', 'terapeuta', 'paciente']
 
 
-class NotificacaoSerializer(serializers.ModelSerializer):
+class NotificacaoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Notificacao.
     Inclui o utilizador associado para leitura.
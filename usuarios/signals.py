@@ -0,0 +1,42 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from ia.models import Conversa
+from .models import Paciente, Sessao, Notificacao
+from . import paineis
+
+
+@receiver(post_save, sender=Conversa)
+@receiver(post_delete, sender=Conversa)
+def invalidar_paineis_apos_conversa(sender, instance, using, **kwargs):
+    terapeuta_id = Paciente.objects.filter(pk=instance.usuario_id).values_list('terapeuta_id', flat=True).first()
+    paineis.invalidar_apos_commit(using, instance.usuario_id, terapeuta_id)
+
+
+@receiver(post_save, sender=Sessao)
+@receiver(post_delete, sender=Sessao)
+def invalidar_paineis_apos_sessao(sender, instance, using, **kwargs):
+    paineis.invalidar_apos_commit(using, instance.paciente_id, instance.terapeuta_id)
+
+
+@receiver(pre_save, sender=Paciente)
+def guardar_terapeuta_anterior(sender, instance, raw=False, **kwargs):
+    """Um paciente que muda de terapeuta também sai do painel do terapeuta anterior."""
+    if instance.pk and not raw:
+        instance._terapeuta_anterior_id = (
+            Paciente.objects.filter(pk=instance.pk).values_list('terapeuta_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Paciente)
+@receiver(post_delete, sender=Paciente)
+def invalidar_paineis_apos_paciente(sender, instance, using, **kwargs):
+    paineis.invalidar_apos_commit(
+        using, instance.pk, instance.terapeuta_id, getattr(instance, '_terapeuta_anterior_id', None)
+    )
+
+
+@receiver(post_save, sender=Notificacao)
+@receiver(post_delete, sender=Notificacao)
+def invalidar_paineis_apos_notificacao(sender, instance, using, **kwargs):
+    paineis.invalidar_apos_commit(using, instance.usuario_id)
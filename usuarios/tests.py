@@ -1,9 +1,55 @@
+import asyncio
+import gzip
+import importlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from decimal import Decimal
+from functools import partial
+from io import BytesIO, StringIO
+from unittest import mock
+from uuid import UUID
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection, connections, models
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext, isolate_apps
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
-from usuarios.models import Usuario, Paciente
-from datetime import timedelta
+from usuarios import exportacao, normalizado, paineis
+from usuarios.models import Usuario, Paciente, Notificacao, Relatorio, Sessao, Mensagem
+from usuarios.views import UTILIZACAO_CACHE_SEGUNDOS
+from usuarios.serializers import (
+    UsuarioSerializer, PacienteSerializer, SessaoSerializer, MensagemSerializer, RelatorioSerializer, NotificacaoSerializer,
+)
+from core.db_router import RoteadorIA, alias_ia
+from core.migracoes import atualizar_em_lotes
+from core.parsers import JSONRapidoParser
+from core.renderers import JSONRapidoRenderer
+from ia import openrouter, resumos, vetores
+from ia.models import Conversa, EmbeddingConversa, EstadoRiscoPaciente, ArquivoConversas, SENTIMENTOS, CATEGORIAS_SENTIMENTO
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
 
 
 class AutenticacaoTests(APITestCase):
@@ -91,6 +137,8 @@ class FiltrosTests(APITestCase):
 
 
 class CasosDeBordaTests(APITestCase):
+    databases = '__all__'  # A app 'ia' pode ter base de dados própria (IA_DATABASE_URL)
+
     def setUp(self):
         self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
         self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
@@ -119,3 +167,1840 @@ class CasosDeBordaTests(APITestCase):
         response = self.client_terapeuta.post(url, data, format='json')
         # Se backend não valida campo vazio, pode retornar 201, ajuste se desejar
         self.assertIn(response.status_code, [status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST])
+
+
+class AlertasRiscoTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+
+    def _conversa(self, sentimento, intensidade):
+        return Conversa.objects.create(
+            usuario=self.paciente, mensagem_usuario="...", resposta_ia="...",
+            sentimento=sentimento, categoria_sentimento="Emocional", intensidade_sentimento=intensidade
+        )
+
+    def test_conversas_de_risco_geram_um_unico_alerta(self):
+        for _ in range(5):
+            self._conversa("Negativo", "Alta")
+
+        alertas = Notificacao.objects.filter(usuario=self.terapeuta, tipo='alerta')
+        self.assertEqual(alertas.count(), 1)
+
+        response = self.client_terapeuta.get(reverse('usuarios:painel_terapeuta'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['alertasUrgentes'], 1)
+
+    def test_conversas_neutras_nao_geram_alerta(self):
+        for _ in range(5):
+            self._conversa("Neutro", "Baixa")
+        self.assertFalse(Notificacao.objects.filter(usuario=self.terapeuta, tipo='alerta').exists())
+
+
+class BuscaTextoTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        self.outro = Usuario.objects.create_user(email="o@example.com", password="Senha123!", tipo="paciente")
+        Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+
+        for usuario in (self.paciente, self.outro):
+            Conversa.objects.create(
+                usuario=usuario, mensagem_usuario="Não consigo dormir, tenho insónia", resposta_ia="...",
+                sentimento="Negativo", categoria_sentimento="Emocional", intensidade_sentimento="Alta"
+            )
+
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+
+    def test_pesquisa_ignora_acentos_e_respeita_carteira(self):
+        response = self.client_terapeuta.get(reverse('ia:busca'), {'q': 'INSONIA'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['paciente_id'], self.paciente.pk)
+        self.assertIn('<mark>insónia</mark>', response.data[0]['trecho'])
+
+    def test_pesquisa_sem_texto_falha(self):
+        response = self.client_terapeuta.get(reverse('ia:busca'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConversasSemelhantesTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        # Índices novos em cada teste: os ids podem repetir-se entre testes
+        patcher = mock.patch.object(vetores, '_cache_indices', vetores._CacheIndices())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.outro = Usuario.objects.create_user(email="o@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        self.paciente_b = Usuario.objects.create_user(email="b@example.com", password="Senha123!", tipo="paciente")
+        self.de_outro = Usuario.objects.create_user(email="c@example.com", password="Senha123!", tipo="paciente")
+        Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+        Paciente.objects.create(usuario=self.paciente_b, nome_completo="Paciente B", terapeuta=self.terapeuta)
+        Paciente.objects.create(usuario=self.de_outro, nome_completo="Paciente C", terapeuta=self.outro)
+
+        self.insonia = self._conversa(self.paciente, "Tenho insónia e não consigo dormir à noite")
+        self.dormir = self._conversa(self.paciente_b, "Esta noite voltei a dormir mal")
+        self.futebol = self._conversa(self.paciente, "Gosto de ver futebol com o meu irmão")
+        self.alheia = self._conversa(self.de_outro, "Tenho insónia e não consigo dormir à noite")
+
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.url = reverse('ia:conversas_similares')
+
+    def _conversa(self, usuario, texto):
+        return Conversa.objects.create(
+            usuario=usuario, mensagem_usuario=texto, resposta_ia="...",
+            sentimento="Neutro", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+        )
+
+    def _ids(self, parametros):
+        response = self.client_terapeuta.get(self.url, parametros)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [c['id'] for c in response.data]
+
+    def test_ordenadas_por_semelhanca_na_carteira(self):
+        response = self.client_terapeuta.get(self.url, {'q': 'insónia, não consigo dormir à noite'})
+        ids = [c['id'] for c in response.data]
+        # A conversa igual de um paciente de outro terapeuta não aparece
+        self.assertEqual(ids, [self.insonia.pk, self.dormir.pk, self.futebol.pk])
+        similaridades = [c['similaridade'] for c in response.data]
+        self.assertEqual(similaridades, sorted(similaridades, reverse=True))
+        self.assertEqual(self._ids({'q': 'insónia', 'paciente': self.paciente_b.pk}), [self.dormir.pk])
+
+    def test_conversa_de_referencia_excluida(self):
+        ids = self._ids({'conversa': self.insonia.pk})
+        self.assertNotIn(self.insonia.pk, ids)
+        self.assertEqual(ids[0], self.dormir.pk)
+        response = self.client_terapeuta.get(self.url, {'conversa': self.alheia.pk})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_limites_de_k_e_parametros(self):
+        self.assertEqual(len(self._ids({'q': 'dormir', 'k': 1})), 1)
+        self.assertEqual(len(self._ids({'q': 'dormir', 'k': 0})), 1)
+        self.assertEqual(len(self._ids({'q': 'dormir', 'k': 500})), 3)
+        for parametros in ({'q': 'dormir', 'k': 'x'}, {}):
+            self.assertEqual(self.client_terapeuta.get(self.url, parametros).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client_terapeuta.get(self.url, {'q': 'dormir', 'paciente': self.de_outro.pk}).status_code, status.HTTP_404_NOT_FOUND)
+        cliente = APIClient()
+        cliente.force_authenticate(user=self.paciente)
+        self.assertEqual(cliente.get(self.url, {'q': 'dormir'}).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_conversas_apagadas_e_arquivadas_saem_do_indice(self):
+        self.assertEqual(len(self._ids({'q': 'dormir', 'k': 2})), 2)
+        self.insonia.delete()
+        # Continua a haver k resultados: a conversa apagada saiu do índice, não só da resposta
+        self.assertEqual(self._ids({'q': 'dormir', 'k': 2}), [self.dormir.pk, self.futebol.pk])
+        self.assertEqual(len(vetores.indice_para(f"terapeuta:{self.terapeuta.pk}", {self.paciente.pk, self.paciente_b.pk})), 2)
+
+        Conversa.objects.filter(pk=self.dormir.pk).update(data_conversa=timezone.now() - timedelta(days=800))
+        call_command('arquivar_conversas', stdout=StringIO())
+        self.assertEqual(self._ids({'q': 'dormir', 'k': 2}), [self.futebol.pk])
+
+    def test_embeddings_gravados_depois_para_conversas_antigas(self):
+        EmbeddingConversa.objects.filter(conversa_id=self.insonia.pk).delete()
+        self.assertNotIn(self.insonia.pk, self._ids({'q': 'insónia'}))
+
+        # indexar_embeddings a preencher uma conversa mais antiga que a última já no índice
+        vetores.indexar_conversa(self.insonia)
+        self.assertEqual(self._ids({'q': 'insónia, não consigo dormir à noite'})[0], self.insonia.pk)
+
+        # Uma remoção e um atraso ao mesmo tempo: o número de embeddings não muda
+        EmbeddingConversa.objects.filter(conversa_id=self.dormir.pk).delete()
+        EmbeddingConversa.objects.filter(conversa_id=self.insonia.pk).delete()
+        self._ids({'q': 'dormir'})
+        EmbeddingConversa.objects.filter(conversa_id=self.futebol.pk).delete()
+        vetores.indexar_conversa(self.dormir)
+        self.assertEqual(self._ids({'q': 'dormir', 'k': 10}), [self.dormir.pk])
+
+    def test_particoes_treinadas_fora_do_pedido(self):
+        gerador = np.random.default_rng(1)
+        lista = [vetores.quantizar(v / np.linalg.norm(v)) for v in gerador.normal(size=(60, vetores.DIMENSAO)).astype(np.float32)]
+        indice, lock = vetores.IndiceVetorial(), threading.Lock()
+        with mock.patch.object(vetores, 'LIMIAR_PARTICAO', 40):
+            indice.adicionar(np.arange(1, 61), np.stack([np.frombuffer(v, dtype=np.int8) for v, _ in lista]), [e for _, e in lista])
+            self.assertTrue(indice.precisa_de_treino())
+            # adicionar() não treina: a pesquisa continua por força bruta até o treino acabar
+            self.assertIsNone(indice.centroides)
+            esperado = indice.buscar(vetores.desquantizar(*lista[7]), k=3)
+            indice.treinar_em_segundo_plano(lock)
+            indice.aguardar_treino()
+            self.assertFalse(indice.precisa_de_treino())
+        self.assertEqual(len(indice.particao), 60)
+        self.assertEqual(indice.buscar(vetores.desquantizar(*lista[7]), k=3, sondas=len(indice.centroides)), esperado)
+        self.assertEqual(esperado[0][0], 8)
+        indice.remover([8])
+        self.assertEqual((len(indice), len(indice.particao)), (59, 59))
+        self.assertNotIn(8, [i for i, _ in indice.buscar(vetores.desquantizar(*lista[7]), k=3)])
+
+
+class TendenciaSentimentoTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.outro = Usuario.objects.create_user(email="o@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+
+        # Ao meio-dia no fuso da clínica, hoje (duas) e há dez dias (uma)
+        self.hoje = timezone.localdate()
+        for dias, sentimento, intensidade in ((0, "Positivo", "Alta"), (0, "Negativo", "Baixa"), (10, "Neutro", "Média")):
+            conversa = Conversa.objects.create(
+                usuario=self.paciente, mensagem_usuario="...", resposta_ia="...",
+                sentimento=sentimento, categoria_sentimento="Geral", intensidade_sentimento=intensidade
+            )
+            meio_dia = timezone.make_aware(datetime.combine(self.hoje - timedelta(days=dias), datetime.min.time())) + timedelta(hours=12)
+            Conversa.objects.filter(pk=conversa.pk).update(data_conversa=meio_dia)
+
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.url = reverse('ia:tendencia_sentimento', args=[self.paciente.pk])
+
+    def test_serie_por_dia_no_fuso_da_clinica(self):
+        response = self.client_terapeuta.get(self.url, {'granularidade': 'dia', 'pontos': 500})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['fim'], self.hoje.isoformat())
+        self.assertEqual(response.data['inicio'], (self.hoje - timedelta(days=89)).isoformat())
+        serie = response.data['serie']
+        self.assertEqual([(p['periodo'], p['total']) for p in serie], [
+            ((self.hoje - timedelta(days=10)).isoformat(), 1), (self.hoje.isoformat(), 2),
+        ])
+        self.assertEqual(serie[1]['contagens']['Positivo'], 1)
+        self.assertEqual(serie[1]['contagens']['Negativo'], 1)
+
+    def test_escolha_da_granularidade(self):
+        # 90 dias: 'auto' fica na mais fina que cabe no número de pontos
+        for parametros, esperada in (
+            ({}, 'semana'),
+            ({'pontos': 100}, 'dia'),
+            ({'granularidade': 'dia', 'pontos': 5}, 'mes'),
+            ({'granularidade': 'mes', 'pontos': 500}, 'mes'),
+            ({'inicio': self.hoje.isoformat()}, 'dia'),
+        ):
+            with self.subTest(parametros=parametros):
+                self.assertEqual(self.client_terapeuta.get(self.url, parametros).data['granularidade'], esperada)
+
+    def test_parametros_invalidos(self):
+        for parametros in (
+            {'pontos': 0}, {'pontos': 'muitos'}, {'granularidade': 'hora'}, {'inicio': 'ontem'},
+            {'inicio': self.hoje.isoformat(), 'fim': (self.hoje - timedelta(days=1)).isoformat()},
+        ):
+            with self.subTest(parametros=parametros):
+                self.assertEqual(self.client_terapeuta.get(self.url, parametros).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cache_invalidado_por_nova_conversa(self):
+        self.client_terapeuta.get(self.url)
+        # Só a verificação de acesso ao paciente: a série vem do cache
+        response, consultas = _get_contando_consultas(self.client_terapeuta, self.url)
+        self.assertEqual(consultas, 1)
+
+        with self.captureOnCommitCallbacks(using=alias_ia(), execute=True):
+            Conversa.objects.create(
+                usuario=self.paciente, mensagem_usuario="...", resposta_ia="...",
+                sentimento="Positivo", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+            )
+        response = self.client_terapeuta.get(self.url)
+        self.assertEqual(sum(p['total'] for p in response.data['serie']), 4)
+
+    def test_outro_terapeuta_nao_ve_o_paciente(self):
+        cliente = APIClient()
+        cliente.force_authenticate(user=self.outro)
+        self.assertEqual(cliente.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        cliente.force_authenticate(user=self.paciente)
+        self.assertEqual(cliente.get(self.url).status_code, status.HTTP_200_OK)
+
+
+class MapaCalorTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.outro = Usuario.objects.create_user(email="o@example.com", password="Senha123!", tipo="terapeuta")
+        self.pacientes = []
+        for nome, terapeuta in (("Ana", self.terapeuta), ("Bruno", self.terapeuta), ("Carla", self.outro)):
+            user = Usuario.objects.create_user(email=f"{nome}@example.com", password="Senha123!", tipo="paciente")
+            Paciente.objects.create(usuario=user, nome_completo=nome, terapeuta=terapeuta)
+            self.pacientes.append(user)
+
+        hoje = timezone.localdate()
+        self.segunda = hoje - timedelta(days=hoje.weekday())
+        ana, _, carla = self.pacientes
+        # Ana: esta semana, 2 Negativo e 1 Positivo; há duas semanas, empate Positivo/Medo; Carla é de outro terapeuta
+        for usuario, semanas_atras, sentimento, intensidade in (
+            (ana, 0, "Negativo", "Alta"), (ana, 0, "Negativo", "Alta"), (ana, 0, "Positivo", "Baixa"),
+            (ana, 2, "Positivo", "Média"), (ana, 2, "Medo", "Média"),
+            (carla, 0, "Raiva", "Alta"),
+        ):
+            conversa = Conversa.objects.create(
+                usuario=usuario, mensagem_usuario="...", resposta_ia="...",
+                sentimento=sentimento, categoria_sentimento="Geral", intensidade_sentimento=intensidade
+            )
+            dia = self.segunda - timedelta(weeks=semanas_atras)
+            meio_dia = timezone.make_aware(datetime.combine(dia, datetime.min.time())) + timedelta(hours=12)
+            Conversa.objects.filter(pk=conversa.pk).update(data_conversa=meio_dia)
+
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.url = reverse('ia:mapa_calor')
+
+    def test_sentimento_dominante_e_semanas_vazias(self):
+        response = self.client_terapeuta.get(self.url, {'semanas': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        dados = response.data
+        self.assertEqual(dados['semanas'][-1], self.segunda.isoformat())
+        self.assertEqual(len(dados['semanas']), 4)
+        sentimentos = dados['sentimentos']
+        # Ana: semanas[1] (há duas semanas), semanas[2] (vazia) e semanas[3] (a atual)
+        self.assertEqual(dados['dominante'][0], [-1, sentimentos.index("Medo"), -1, sentimentos.index("Negativo")])
+        self.assertEqual(dados['pesoIntensidade'][0], [None, 0.75, None, 0.83])
+        self.assertEqual(dados['total'][0], [0, 2, 0, 3])
+        # Bruno não tem conversas
+        self.assertEqual(dados['dominante'][1], [-1] * 4)
+        self.assertEqual(dados['pesoIntensidade'][1], [None] * 4)
+        self.assertEqual(dados['total'][1], [0] * 4)
+
+    def test_so_os_pacientes_do_terapeuta(self):
+        response = self.client_terapeuta.get(self.url)
+        self.assertEqual(response.data['pacientes'], [self.pacientes[0].pk, self.pacientes[1].pk])
+        self.assertEqual(response.data['nomes'], ["Ana", "Bruno"])
+        cliente = APIClient()
+        cliente.force_authenticate(user=self.outro)
+        response = cliente.get(self.url, {'semanas': 1})
+        self.assertEqual(response.data['pacientes'], [self.pacientes[2].pk])
+        self.assertEqual(response.data['dominante'], [[response.data['sentimentos'].index("Raiva")]])
+        cliente.force_authenticate(user=self.pacientes[0])
+        self.assertEqual(cliente.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client_terapeuta.get(self.url, {'semanas': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExportacaoTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        perfil = Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+
+        for _ in range(3):
+            Conversa.objects.create(
+                usuario=self.paciente, mensagem_usuario="Olá", resposta_ia="...",
+                sentimento="Neutro", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+            )
+        Relatorio.objects.create(terapeuta=self.terapeuta, paciente=perfil, titulo="Evolução", conteudo="...")
+
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+
+    def _linhas(self, response):
+        conteudo = b''.join(response.streaming_content)
+        return [json.loads(linha) for linha in conteudo.decode('utf-8').splitlines()]
+
+    def test_exportacao_ndjson_retoma_pelo_cursor(self):
+        response = self.client_terapeuta.get(reverse('usuarios:exportar'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        linhas = self._linhas(response)
+        self.assertEqual([l['tipo'] for l in linhas], ['conversa'] * 3 + ['relatorio'])
+
+        response = self.client_terapeuta.get(reverse('usuarios:exportar'), {'cursor': linhas[1]['cursor']})
+        self.assertEqual(self._linhas(response), linhas[2:])
+
+    def test_administrador_filtra_por_subconsulta(self):
+        outro = Usuario.objects.create_user(email="o@example.com", password="Senha123!", tipo="terapeuta")
+        paciente = Usuario.objects.create_user(email="q@example.com", password="Senha123!", tipo="paciente")
+        perfil = Paciente.objects.create(usuario=paciente, nome_completo="Paciente B", terapeuta=outro)
+        Relatorio.objects.create(terapeuta=outro, paciente=perfil, titulo="Outro", conteudo="...")
+        admin = APIClient()
+        admin.force_authenticate(user=Usuario.objects.create_superuser(email="admin@example.com", password="Senha123!"))
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = admin.get(reverse('usuarios:exportar'), {'tipos': 'sessao,relatorio'})
+            linhas = self._linhas(response)
+        self.assertEqual([l['titulo'] for l in linhas], ["Evolução", "Outro"])
+        # Os ids dos pacientes não passam pelo Python: nenhuma consulta lê a lista inteira
+        [relatorios] = [c['sql'] for c in consultas if 'FROM "usuarios_relatorio"' in c['sql']]
+        self.assertIn('IN (SELECT', relatorios)
+        self.assertFalse([c['sql'] for c in consultas if c['sql'].startswith('SELECT "usuarios_paciente"."usuario_id" FROM')])
+
+        response = admin.get(reverse('usuarios:exportar'), {'tipos': 'relatorio', 'paciente': paciente.pk})
+        self.assertEqual([l['titulo'] for l in self._linhas(response)], ["Outro"])
+        self.assertEqual(admin.get(reverse('usuarios:exportar'), {'paciente': 999999}).status_code, 404)
+
+    def test_exportacao_csv_com_gzip(self):
+        response = self.client_terapeuta.get(reverse('usuarios:exportar'), {'formato': 'csv', 'tipos': 'relatorio', 'gzip': '1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        conteudo = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        cabecalho, linha = conteudo.splitlines()
+        self.assertTrue(cabecalho.startswith('cursor,id,paciente_id'))
+        self.assertIn('Evolução', linha)
+
+
+class ExportacaoASGITests(TransactionTestCase):
+    # Os blocos são lidos na thread das consultas do servidor ASGI: os dados têm de estar confirmados
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        Paciente.objects.create(usuario=paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+        for _ in range(5):
+            Conversa.objects.create(
+                usuario=paciente, mensagem_usuario="Olá", resposta_ia="...",
+                sentimento="Neutro", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+            )
+
+    async def _pedido_asgi(self, query_string):
+        """Pedido pelo ASGIHandler; devolve as mensagens enviadas com as linhas já lidas em cada uma."""
+        await self.async_client.aforce_login(self.terapeuta)
+        sessao = self.async_client.cookies[settings.SESSION_COOKIE_NAME].value
+        caminho = reverse('usuarios:exportar')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': caminho, 'raw_path': caminho.encode(), 'query_string': query_string,
+            'root_path': '', 'client': ('127.0.0.1', 5000), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'), (b'cookie', f'{settings.SESSION_COOKIE_NAME}={sessao}'.encode())],
+        }
+        pedidos = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if pedidos:
+                return pedidos.pop()
+            await asyncio.Event().wait()  # O cliente não desliga
+
+        lidas = 0
+        ndjson = exportacao._ndjson
+
+        def _ndjson_contado(linhas):
+            nonlocal lidas
+            for linha in ndjson(linhas):
+                lidas += 1
+                yield linha
+
+        mensagens = []
+
+        async def send(mensagem):
+            mensagens.append((mensagem, lidas))
+
+        # Um envio por linha, para se ver quando cada uma sai
+        with mock.patch.object(exportacao, '_ndjson', _ndjson_contado), \
+                mock.patch.object(exportacao, '_agrupar', partial(exportacao._agrupar, tamanho=1)):
+            await ASGIHandler()(scope, receive, send)
+        return mensagens
+
+    async def test_linhas_enviadas_a_medida_que_sao_lidas(self):
+        mensagens = await self._pedido_asgi(b'tipos=conversa')
+        inicio, _ = mensagens[0]
+        self.assertEqual(inicio['status'], 200)
+        corpos = [(m['body'], lidas) for m, lidas in mensagens[1:] if m.get('body')]
+        self.assertEqual(len(corpos), 5)
+        # Cada linha é enviada antes de a seguinte ser lida, em vez de a exportação ser lida toda primeiro
+        self.assertEqual([lidas for _, lidas in corpos], [1, 2, 3, 4, 5])
+        linhas = [json.loads(corpo) for corpo, _ in corpos]
+        self.assertEqual([l['tipo'] for l in linhas], ['conversa'] * 5)
+
+    async def test_erros_de_validacao_sob_asgi(self):
+        mensagens = await self._pedido_asgi(b'formato=xml')
+        self.assertEqual(mensagens[0][0]['status'], 400)
+
+
+class HistoricoConversasTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        outro = Usuario.objects.create_user(email="o@example.com", password="Senha123!", tipo="paciente")
+        fuso = ZoneInfo('America/Sao_Paulo')
+        # Três conversas com a mesma data: o desempate do cursor é pelo id
+        datas_e_sentimentos = [
+            (datetime(2024, 3, 1, 9, 0, tzinfo=fuso), "Positivo"),
+            (datetime(2024, 3, 10, 23, 30, tzinfo=fuso), "Medo"),
+            (datetime(2024, 3, 10, 23, 30, tzinfo=fuso), "Negativo"),
+            (datetime(2024, 3, 10, 23, 30, tzinfo=fuso), "Neutro"),
+            (datetime(2024, 3, 20, 8, 0, tzinfo=fuso), "Negativo"),
+        ]
+        self.ids = []
+        for data, sentimento in datas_e_sentimentos:
+            conversa = Conversa.objects.create(
+                usuario=self.paciente, mensagem_usuario="Olá", resposta_ia="...",
+                sentimento=sentimento, categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+            )
+            Conversa.objects.filter(pk=conversa.pk).update(data_conversa=data)
+            self.ids.append(conversa.pk)
+        Conversa.objects.create(
+            usuario=outro, mensagem_usuario="Olá", resposta_ia="...",
+            sentimento="Medo", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+        )
+        # Do mais recente para o mais antigo; nos empates, do maior id para o menor
+        self.ordem = [self.ids[4], self.ids[3], self.ids[2], self.ids[1], self.ids[0]]
+
+        self.client_paciente = APIClient()
+        self.client_paciente.force_authenticate(user=self.paciente)
+
+    def _todas_as_paginas(self, parametros):
+        ids, paginas = [], 0
+        parametros = dict(parametros)
+        while True:
+            response = self.client_paciente.get(reverse('ia:historico_api'), parametros)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [c['id'] for c in response.data]
+            paginas += 1
+            if 'X-Proximo-Cursor' not in response:
+                self.assertNotIn('Link', response)
+                return ids, paginas
+            self.assertIn(f"cursor={response['X-Proximo-Cursor']}", response['Link'])
+            self.assertTrue(response['Link'].endswith('>; rel="next"'))
+            parametros['cursor'] = response['X-Proximo-Cursor']
+
+    def test_paginas_por_cursor_com_datas_empatadas(self):
+        response = self.client_paciente.get(reverse('ia:historico_api'))
+        self.assertEqual([c['id'] for c in response.data], self.ordem)
+        self.assertNotIn('X-Proximo-Cursor', response)
+
+        # Páginas de 2 cortam o grupo de datas iguais a meio, sem repetir nem saltar linhas
+        self.assertEqual(self._todas_as_paginas({'limite': 2}), (self.ordem, 3))
+        self.assertEqual(self._todas_as_paginas({'limite': 1}), (self.ordem, 5))
+
+    def test_filtros(self):
+        ids, _ = self._todas_as_paginas({'sentimento': 'Medo,Negativo', 'limite': 1})
+        self.assertEqual(ids, [self.ids[4], self.ids[2], self.ids[1]])
+
+        # Datas no fuso da clínica; 'fim' inclui o próprio dia
+        ids, _ = self._todas_as_paginas({'inicio': '2024-03-10', 'fim': '2024-03-10', 'limite': 2})
+        self.assertEqual(ids, [self.ids[3], self.ids[2], self.ids[1]])
+
+    def test_parametros_invalidos(self):
+        for parametros in (
+            {'cursor': 'nao-e-um-cursor'},
+            {'cursor': 'YWJj'},
+            {'sentimento': 'Medo,Tristeza'},
+            {'inicio': '2024-13-01'},
+            {'limite': 'muitos'},
+        ):
+            with self.subTest(parametros=parametros):
+                response = self.client_paciente.get(reverse('ia:historico_api'), parametros)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ArquivoConversasTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+
+        for _ in range(5):
+            Conversa.objects.create(
+                usuario=self.paciente, mensagem_usuario="Olá", resposta_ia="...",
+                sentimento="Neutro", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+            )
+        self.ids = list(Conversa.objects.order_by('pk').values_list('pk', flat=True))
+        Conversa.objects.filter(pk__in=self.ids[:3]).update(data_conversa=timezone.now() - timedelta(days=800))
+        call_command('arquivar_conversas', stdout=StringIO())
+
+        self.client_paciente = APIClient()
+        self.client_paciente.force_authenticate(user=self.paciente)
+
+    def test_conversas_antigas_saem_da_tabela(self):
+        self.assertEqual(Conversa.objects.count(), 2)
+        self.assertEqual(ArquivoConversas.objects.get().total, 3)
+
+    def test_historico_le_o_arquivo_quando_pedido(self):
+        response = self.client_paciente.get(reverse('ia:historico_api'), {'limite': 2})
+        self.assertEqual(len(response.data), 2)
+        self.assertNotIn('X-Proximo-Cursor', response)
+
+        ids = []
+        parametros = {'limite': 2, 'incluir_arquivo': 1}
+        while True:
+            response = self.client_paciente.get(reverse('ia:historico_api'), parametros)
+            ids += [c['id'] for c in response.data]
+            if 'X-Proximo-Cursor' not in response:
+                break
+            parametros['cursor'] = response['X-Proximo-Cursor']
+        self.assertEqual(ids, self.ids[::-1])
+
+    def test_filtros_aplicados_ao_arquivo(self):
+        Conversa.objects.filter(pk=self.ids[4]).update(sentimento="Negativo")
+        response = self.client_paciente.get(reverse('ia:historico_api'), {'incluir_arquivo': 1, 'sentimento': 'Negativo'})
+        self.assertEqual([c['id'] for c in response.data], [self.ids[4]])
+
+        inicio = (timezone.localdate() - timedelta(days=30)).isoformat()
+        response = self.client_paciente.get(reverse('ia:historico_api'), {'incluir_arquivo': 1, 'inicio': inicio})
+        self.assertEqual([c['id'] for c in response.data], self.ids[:2:-1])
+
+
+class TextoComprimidoTests(APITestCase):
+    databases = '__all__'
+
+    def test_conteudo_guardado_comprimido(self):
+        terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        perfil = Paciente.objects.create(usuario=paciente, nome_completo="Paciente A", terapeuta=terapeuta)
+        conteudo = "O paciente relata dificuldade para dormir e ansiedade no trabalho. " * 20
+
+        relatorio = Relatorio.objects.create(terapeuta=terapeuta, paciente=perfil, titulo="Evolução", conteudo=conteudo)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT conteudo FROM usuarios_relatorio WHERE id = %s", [relatorio.pk])
+            guardado = bytes(cursor.fetchone()[0])
+        self.assertLess(len(guardado), len(conteudo) // 4)
+        self.assertEqual(Relatorio.objects.get(pk=relatorio.pk).conteudo, conteudo)
+
+
+class CodigosSentimentoTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+
+    def _conversa(self, sentimento, categoria, intensidade):
+        return Conversa.objects.create(
+            usuario=self.paciente, mensagem_usuario="Olá", resposta_ia="...",
+            sentimento=sentimento, categoria_sentimento=categoria, intensidade_sentimento=intensidade
+        )
+
+    def test_codigos_ida_e_volta_pelo_orm(self):
+        conversa = self._conversa("Medo", "Insegurança", "Alta")
+        self._conversa("Negativo", "Emocional", "Média")
+        self._conversa("Negativo", "Geral", "Baixa")
+
+        with connections[alias_ia()].cursor() as cursor:
+            cursor.execute(
+                "SELECT sentimento, categoria_sentimento, intensidade_sentimento FROM ia_conversa WHERE id = %s",
+                [conversa.pk],
+            )
+            self.assertEqual(cursor.fetchone(), (SENTIMENTOS.index("Medo"), CATEGORIAS_SENTIMENTO.index("Insegurança"), 2))
+
+        lida = Conversa.objects.get(pk=conversa.pk)
+        self.assertEqual(
+            (lida.sentimento, lida.categoria_sentimento, lida.intensidade_sentimento), ("Medo", "Insegurança", "Alta")
+        )
+        self.assertEqual(Conversa.objects.filter(sentimento="Negativo").count(), 2)
+        self.assertEqual(Conversa.objects.filter(sentimento__in=["Medo", "Raiva"]).get().pk, conversa.pk)
+        self.assertEqual(
+            dict(Conversa.objects.values_list('sentimento').annotate(total=Count('pk')).order_by()),
+            {"Negativo": 2, "Medo": 1},
+        )
+
+        with self.assertRaises(ValueError):
+            Conversa.objects.filter(sentimento="Tristeza").exists()
+        with self.assertRaises(ValueError):
+            self._conversa("Tristeza", "Geral", "Baixa")
+
+    def test_migracao_converte_as_linhas_existentes_em_lotes(self):
+        migracao = importlib.import_module('ia.migrations.0007_conversa_codigos_sentimento')
+        tabela = 'teste_conversa_0007'
+        with connections[alias_ia()].cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {tabela} (id integer PRIMARY KEY, sentimento varchar(50) NOT NULL, "
+                "categoria_sentimento varchar(50) NOT NULL, intensidade_sentimento varchar(50) NOT NULL, "
+                "sentimento_codigo smallint NULL, categoria_sentimento_codigo smallint NULL, "
+                "intensidade_sentimento_codigo smallint NULL)"
+            )
+            # Ids espaçados para as linhas caírem em lotes diferentes
+            cursor.executemany(
+                f"INSERT INTO {tabela} (id, sentimento, categoria_sentimento, intensidade_sentimento) VALUES (%s, %s, %s, %s)",
+                [
+                    (1, "Positivo", "Bem-estar", "Baixa"),
+                    (2, "Raiva", "Conflito", "Alta"),
+                    (5, "Nojo", "Aversão", "Média"),
+                    (9, "Triste", "Outra", "Extrema"),
+                ],
+            )
+            # Linha já convertida por uma execução anterior interrompida
+            cursor.execute(
+                f"INSERT INTO {tabela} VALUES (10, 'Medo', 'Insegurança', 'Alta', 6, 6, 0)"
+            )
+
+        with isolate_apps('ia') as apps_da_migracao:
+            class Conversa(models.Model):
+                sentimento = models.CharField(max_length=50)
+                categoria_sentimento = models.CharField(max_length=50)
+                intensidade_sentimento = models.CharField(max_length=50)
+                sentimento_codigo = models.PositiveSmallIntegerField(null=True)
+                categoria_sentimento_codigo = models.PositiveSmallIntegerField(null=True)
+                intensidade_sentimento_codigo = models.PositiveSmallIntegerField(null=True)
+
+                class Meta:
+                    app_label = 'ia'
+                    db_table = tabela
+                    managed = False
+
+            lotes = []
+
+            def atualizar_em_lotes_de_2(modelo, **kwargs):
+                lotes.append(atualizar_em_lotes(modelo, lote=2, **kwargs))
+
+            with mock.patch.object(migracao, 'atualizar_em_lotes', atualizar_em_lotes_de_2):
+                migracao.converter(apps_da_migracao, None)
+                migracao.converter(apps_da_migracao, None)
+
+        self.assertEqual(lotes, [4, 0])
+        with connections[alias_ia()].cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, sentimento_codigo, categoria_sentimento_codigo, intensidade_sentimento_codigo "
+                f"FROM {tabela} ORDER BY id"
+            )
+            self.assertEqual(cursor.fetchall(), [(1, 1, 1, 0), (2, 3, 3, 2), (5, 6, 6, 1), (9, 0, 0, 0), (10, 6, 6, 0)])
+
+
+class BaseDadosIATests(APITestCase):
+    databases = '__all__'
+
+    def test_migracoes_encaminhadas_por_app(self):
+        roteador = RoteadorIA()
+        self.assertTrue(roteador.allow_migrate(alias_ia(), 'ia'))
+        self.assertTrue(roteador.allow_migrate('default', 'usuarios'))
+        self.assertEqual(roteador.allow_migrate('default', 'ia'), alias_ia() == 'default')
+        self.assertEqual(roteador.db_for_write(Conversa), alias_ia())
+
+    def test_tabelas_ia_sem_chave_estrangeira_para_usuarios(self):
+        conexao = connections[alias_ia()]
+        for modelo in (Conversa, EstadoRiscoPaciente):
+            with conexao.cursor() as cursor:
+                restricoes = conexao.introspection.get_constraints(cursor, modelo._meta.db_table)
+            self.assertFalse([nome for nome, restricao in restricoes.items() if restricao['foreign_key']])
+
+    def test_migrar_base_ia_vazia_sem_tabelas_de_usuarios(self):
+        # Uma base nova só para a app 'ia' (migrate --database=ia): as migrações não
+        # podem referir usuarios_usuario, que lá não existe (no PostgreSQL falhariam)
+        alias = 'ia_vazia'
+        with tempfile.TemporaryDirectory() as pasta:
+            connections.settings[alias] = {**connections.settings['default'], 'NAME': os.path.join(pasta, 'ia.sqlite3')}
+            self.addCleanup(connections.settings.pop, alias)
+            # Criada depois do arranque da classe: não está na lista de bases permitidas
+            self.addCleanup(mock.patch.stopall)
+            mock.patch.object(type(self), 'databases', {*self.databases, alias}).start()
+            conexao = connections[alias]
+            try:
+                with mock.patch('core.db_router.alias_ia', return_value=alias), CaptureQueriesContext(conexao) as consultas:
+                    executor = MigrationExecutor(conexao)
+                    executor.migrate(executor.loader.graph.leaf_nodes('ia'))
+                # Nenhum passo cria uma referência a uma tabela fora da app (o PostgreSQL recusá-la-ia)
+                self.assertFalse([c['sql'] for c in consultas if re.search(r'REFERENCES "(?!ia_)', c['sql'])])
+                tabelas = conexao.introspection.table_names()
+                self.assertIn('ia_conversa', tabelas)
+                self.assertNotIn('usuarios_usuario', tabelas)
+                with conexao.cursor() as cursor:
+                    for tabela in tabelas:
+                        restricoes = conexao.introspection.get_constraints(cursor, tabela)
+                        self.assertFalse(
+                            [r['foreign_key'] for r in restricoes.values() if r['foreign_key'] and not r['foreign_key'][0].startswith('ia_')],
+                            tabela,
+                        )
+                # Com as chaves estrangeiras ativas, uma referência a uma tabela inexistente falharia aqui
+                Conversa.objects.using(alias).bulk_create([Conversa(
+                    usuario_id=12345, mensagem_usuario="Olá", resposta_ia="...",
+                    sentimento="Neutro", categoria_sentimento="Geral", intensidade_sentimento="Baixa",
+                )])
+                self.assertEqual(Conversa.objects.using(alias).get().usuario_id, 12345)
+            finally:
+                conexao.close()
+                del connections[alias]
+
+    def test_apagar_usuario_remove_os_dados_ia(self):
+        paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        Conversa.objects.create(
+            usuario=paciente, mensagem_usuario="Olá", resposta_ia="...",
+            sentimento="Neutro", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+        )
+        self.assertTrue(EstadoRiscoPaciente.objects.filter(usuario_id=paciente.pk).exists())
+
+        usuario_id = paciente.pk
+        paciente.delete()
+        self.assertFalse(Conversa.objects.filter(usuario_id=usuario_id).exists())
+        self.assertFalse(EstadoRiscoPaciente.objects.filter(usuario_id=usuario_id).exists())
+
+
+class ResumosSemanaisTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        self.perfil = Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+        self._conversa()
+
+        self.chamadas = []
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(openrouter, 'API_KEY', 'chave-de-teste').start()
+        mock.patch.object(openrouter, 'chamar_openrouter', self._chamar_openrouter).start()
+
+    def _chamar_openrouter(self, mensagens, **opcoes):
+        self.chamadas.append(mensagens)
+        return "Resumo da semana.", {'prompt_tokens': 100, 'completion_tokens': 20}
+
+    def _conversa(self):
+        Conversa.objects.create(
+            usuario=self.paciente, mensagem_usuario="Dormi mal esta semana.", resposta_ia="...",
+            sentimento="Negativo", categoria_sentimento="Emocional", intensidade_sentimento="Média"
+        )
+
+    def test_resumo_guardado_como_rascunho_e_incremental(self):
+        call_command('resumir_conversas', stdout=StringIO())
+        rascunho = Relatorio.objects.get(paciente=self.perfil)
+        self.assertTrue(rascunho.rascunho)
+        self.assertEqual(rascunho.terapeuta, self.terapeuta)
+        self.assertEqual(rascunho.conteudo, "Resumo da semana.")
+        self.assertEqual(len(self.chamadas), 1)
+
+        # Sem conversas novas o paciente é ignorado
+        call_command('resumir_conversas', stdout=StringIO())
+        self.assertEqual(len(self.chamadas), 1)
+
+        # Com uma conversa nova, o rascunho por rever é atualizado em vez de duplicado
+        self._conversa()
+        call_command('resumir_conversas', stdout=StringIO())
+        self.assertEqual(len(self.chamadas), 2)
+        self.assertEqual(Relatorio.objects.filter(paciente=self.perfil).count(), 1)
+
+    def test_paciente_nao_ve_rascunhos(self):
+        call_command('resumir_conversas', stdout=StringIO())
+        cliente = APIClient()
+        cliente.force_authenticate(user=self.paciente)
+        response = cliente.get(reverse('usuarios:relatorio-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+    def test_historico_dividido_pelo_orcamento_de_tokens(self):
+        for _ in range(3):
+            Conversa.objects.create(
+                usuario=self.paciente, mensagem_usuario="Hoje foi um dia difícil. " * 120, resposta_ia="...",
+                sentimento="Negativo", categoria_sentimento="Emocional", intensidade_sentimento="Média"
+            )
+        call_command('resumir_conversas', orcamento_tokens=2000, stdout=StringIO())
+        # Dois blocos de conversas e um pedido final que combina os dois resumos parciais
+        self.assertEqual(len(self.chamadas), 3)
+        self.assertEqual(self.chamadas[2][0]['content'], resumos.PROMPT_COMBINAR)
+
+
+class ChamarOpenRouterTests(APITestCase):
+    def setUp(self):
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(openrouter, 'API_KEY', 'chave-de-teste').start()
+
+    def _resposta(self, status_code, corpo):
+        resposta = requests.Response()
+        resposta.status_code = status_code
+        resposta._content = corpo
+        return resposta
+
+    def _chamar(self, status_code, corpo):
+        with mock.patch.object(openrouter.requests, 'post', return_value=self._resposta(status_code, corpo)):
+            return openrouter.chamar_openrouter([{"role": "user", "content": "Olá"}])
+
+    def test_resposta_valida(self):
+        corpo = json.dumps({
+            "choices": [{"message": {"content": " Resumo. "}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+        }).encode()
+        self.assertEqual(self._chamar(200, corpo), ("Resumo.", {"prompt_tokens": 10, "completion_tokens": 2}))
+
+    def test_corpo_que_nao_e_json_e_temporario(self):
+        with self.assertRaises(openrouter.ErroOpenRouter) as contexto:
+            self._chamar(200, b"<html>Bad gateway</html>")
+        self.assertTrue(contexto.exception.temporario)
+        self.assertIn("não é JSON", str(contexto.exception))
+
+    def test_erros_http(self):
+        for status_code, temporario in ((429, True), (502, True), (400, False)):
+            with self.subTest(status_code=status_code):
+                with self.assertRaises(openrouter.ErroOpenRouter) as contexto:
+                    self._chamar(status_code, b"erro")
+                self.assertEqual(contexto.exception.temporario, temporario)
+
+
+class EstatisticasPacienteTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        self.perfil = Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+
+        for sentimento, intensidade in [("Negativo", "Alta"), ("Negativo", "Média"), ("Positivo", "Baixa")]:
+            Conversa.objects.create(
+                usuario=self.paciente, mensagem_usuario="...", resposta_ia="...",
+                sentimento=sentimento, categoria_sentimento="Emocional", intensidade_sentimento=intensidade
+            )
+        agora = timezone.now()
+        Sessao.objects.create(terapeuta=self.terapeuta, paciente=self.perfil, data=agora - timedelta(days=3), duracao=timedelta(hours=1), status='concluida')
+        Sessao.objects.create(terapeuta=self.terapeuta, paciente=self.perfil, data=agora - timedelta(days=2), duracao=timedelta(hours=1), status='cancelada')
+        Sessao.objects.create(terapeuta=self.terapeuta, paciente=self.perfil, data=agora + timedelta(days=2), duracao=timedelta(hours=1))
+        Mensagem.objects.create(remetente=self.paciente, destinatario=self.terapeuta, conteudo="Olá")
+
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.url = reverse('usuarios:paciente-estatisticas', args=[self.perfil.pk])
+
+    def test_instantaneo_calculado_em_lote(self):
+        self.assertEqual(self.client_terapeuta.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        call_command('calcular_estatisticas', stdout=StringIO())
+
+        with self.assertNumQueries(1):
+            response = self.client_terapeuta.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['totalConversas'], 3)
+        self.assertEqual(response.data['distribuicaoSentimentos']['Negativo'], 2)
+        self.assertEqual(response.data['sessoes'], {'concluidas': 1, 'canceladas': 1, 'agendadas': 0})
+        self.assertIsNotNone(response.data['proximaSessao'])
+        self.assertEqual(response.data['mensagensNaoLidas'], {'doPaciente': 1, 'doTerapeuta': 0})
+        self.assertEqual(sum(s['conversas'] for s in response.data['tendenciaIntensidade']), 3)
+
+    def test_outro_terapeuta_nao_ve_estatisticas(self):
+        call_command('calcular_estatisticas', stdout=StringIO())
+        outro = Usuario.objects.create_user(email="o@example.com", password="Senha123!", tipo="terapeuta")
+        cliente = APIClient()
+        cliente.force_authenticate(user=outro)
+        self.assertEqual(cliente.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+def _get_contando_consultas(cliente, url, parametros=None):
+    """GET e número de consultas em todas as bases de dados (a app 'ia' pode ter a sua)."""
+    with ExitStack() as pilha:
+        contextos = [pilha.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+        response = cliente.get(url, parametros)
+    return response, sum(len(c) for c in contextos)
+
+
+class PainelTerapeutaConsultasTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.n = 0
+
+    def _criar_pacientes(self, quantidade):
+        # As conversas podem estar noutra base de dados, com os seus próprios commits
+        with self.captureOnCommitCallbacks(execute=True), \
+                self.captureOnCommitCallbacks(using=alias_ia(), execute=True):
+            self._criar_pacientes_sem_commit(quantidade)
+
+    def _criar_pacientes_sem_commit(self, quantidade):
+        for _ in range(quantidade):
+            self.n += 1
+            usuario = Usuario.objects.create_user(email=f"p{self.n}@example.com", password="Senha123!", tipo="paciente")
+            Paciente.objects.create(usuario=usuario, nome_completo=f"Paciente {self.n}", terapeuta=self.terapeuta)
+            Conversa.objects.create(
+                usuario=usuario, mensagem_usuario="Olá", resposta_ia="...",
+                sentimento="Positivo", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+            )
+
+    def _painel(self, **parametros):
+        return _get_contando_consultas(self.client_terapeuta, reverse('usuarios:painel_terapeuta'), parametros)
+
+    def test_numero_de_consultas_nao_depende_dos_pacientes(self):
+        self._criar_pacientes(2)
+        response, consultas_com_2 = self._painel()
+        self.assertEqual(len(response.data['pacientesAtivos']), 2)
+
+        self._criar_pacientes(8)
+        response, consultas_com_10 = self._painel()
+        self.assertEqual(len(response.data['pacientesAtivos']), 10)
+        self.assertEqual(consultas_com_10, consultas_com_2)
+
+    def test_pacientes_ativos_paginados_por_ultima_conversa(self):
+        self._criar_pacientes(3)
+        response, _ = self._painel(limite=2)
+        self.assertEqual(response.data['paginacao'], {'pagina': 1, 'limite': 2, 'total': 3})
+        self.assertEqual([p['nome'] for p in response.data['pacientesAtivos']], ["Paciente 3", "Paciente 2"])
+        self.assertEqual(response.data['pacientesAtivos'][0]['sentimento'], "Positivo")
+
+        response, _ = self._painel(limite=2, pagina=2)
+        self.assertEqual([p['nome'] for p in response.data['pacientesAtivos']], ["Paciente 1"])
+
+
+class PainelCacheTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.outro_terapeuta = Usuario.objects.create_user(email="o@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.client_outro = APIClient()
+        self.client_outro.force_authenticate(user=self.outro_terapeuta)
+        self.client_paciente = APIClient()
+        self.client_paciente.force_authenticate(user=self.paciente)
+        self.url = reverse('usuarios:painel_terapeuta')
+
+    def test_leitura_repetida_sem_consultas(self):
+        self.assertEqual(self.client_terapeuta.get(self.url)['X-Cache'], 'MISS')
+        response, consultas = _get_contando_consultas(self.client_terapeuta, self.url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(consultas, 0)
+
+        response, consultas = _get_contando_consultas(self.client_paciente, reverse('usuarios:painel_paciente'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        response, consultas = _get_contando_consultas(self.client_paciente, reverse('usuarios:painel_paciente'))
+        self.assertEqual((response['X-Cache'], consultas), ('HIT', 0))
+
+    def test_cache_acaba_com_o_dia_da_clinica(self):
+        # 23h30 e 00h30 na clínica (America/Sao_Paulo): o mesmo dia em UTC, dias diferentes na clínica
+        for agora, esperado in (
+            (datetime(2024, 5, 11, 2, 30, tzinfo=dt_timezone.utc), 'MISS'),
+            (datetime(2024, 5, 11, 2, 45, tzinfo=dt_timezone.utc), 'HIT'),
+            (datetime(2024, 5, 11, 3, 30, tzinfo=dt_timezone.utc), 'MISS'),
+        ):
+            with self.subTest(agora=agora), mock.patch('django.utils.timezone.now', return_value=agora):
+                self.assertEqual(self.client_terapeuta.get(self.url)['X-Cache'], esperado)
+
+    def test_conversa_invalida_os_paineis_do_paciente_e_do_terapeuta(self):
+        self.client_terapeuta.get(self.url)
+        self.client_paciente.get(reverse('usuarios:painel_paciente'))
+        self.client_outro.get(self.url)
+
+        with self.captureOnCommitCallbacks(using=alias_ia(), execute=True):
+            Conversa.objects.create(
+                usuario=self.paciente, mensagem_usuario="Olá", resposta_ia="...",
+                sentimento="Positivo", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+            )
+
+        response = self.client_terapeuta.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['pacientesAtivos']), 1)
+        response = self.client_paciente.get(reverse('usuarios:painel_paciente'))
+        self.assertEqual((response['X-Cache'], response.data['totalConversas']), ('MISS', 1))
+        # O painel de outro terapeuta não depende desta conversa
+        self.assertEqual(self.client_outro.get(self.url)['X-Cache'], 'HIT')
+
+    def test_notificacao_invalida_o_painel_do_destinatario(self):
+        self.client_terapeuta.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Notificacao.objects.create(usuario=self.terapeuta, tipo='alerta', assunto="Alerta", conteudo="...")
+        response = self.client_terapeuta.get(self.url)
+        self.assertEqual((response['X-Cache'], response.data['alertasUrgentes']), ('MISS', 1))
+
+    def test_reconstrucao_concorrente_serve_a_versao_anterior(self):
+        self.client_terapeuta.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Notificacao.objects.create(usuario=self.terapeuta, assunto="Aviso", conteudo="...")
+        # Outro pedido está a reconstruir este painel
+        chave = f"painel:terapeuta:{self.terapeuta.pk}:{date.today().isoformat()}:1:50"
+        cache.add(f"{chave}:bloqueio", 1)
+        self.assertEqual(self.client_terapeuta.get(self.url)['X-Cache'], 'STALE')
+
+    def test_metricas(self):
+        superuser = Usuario.objects.create_superuser(email="admin@example.com", password="Senha123!")
+        cliente = APIClient()
+        cliente.force_authenticate(user=superuser)
+        antes = cliente.get(reverse('usuarios:painel_metricas')).data
+        self.client_terapeuta.get(self.url)
+        self.client_terapeuta.get(self.url)
+        depois = cliente.get(reverse('usuarios:painel_metricas')).data
+        self.assertEqual(depois['MISS'] - antes['MISS'], 1)
+        self.assertEqual(depois['HIT'] - antes['HIT'], 1)
+
+
+class PainelPacienteTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        self.perfil = Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+        self.client_paciente = APIClient()
+        self.client_paciente.force_authenticate(user=self.paciente)
+
+    def _criar_sessoes(self, passadas, futuras):
+        agora = timezone.now()
+        Sessao.objects.bulk_create(
+            [Sessao(terapeuta=self.terapeuta, paciente=self.perfil, data=agora - timedelta(days=d + 1),
+                    duracao=timedelta(hours=1), status='concluida') for d in range(passadas)]
+            + [Sessao(terapeuta=self.terapeuta, paciente=self.perfil, data=agora + timedelta(days=d + 1),
+                      duracao=timedelta(hours=1)) for d in range(futuras)]
+        )
+
+    def _painel(self):
+        cache.clear()
+        return _get_contando_consultas(self.client_paciente, reverse('usuarios:painel_paciente'))
+
+    def test_sessoes_limitadas_e_contadores(self):
+        self._criar_sessoes(passadas=8, futuras=7)
+        Conversa.objects.create(
+            usuario=self.paciente, mensagem_usuario="Olá", resposta_ia="...",
+            sentimento="Negativo", categoria_sentimento="Geral", intensidade_sentimento="Alta"
+        )
+        antiga = Conversa.objects.create(
+            usuario=self.paciente, mensagem_usuario="Antes", resposta_ia="...",
+            sentimento="Positivo", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+        )
+        Conversa.objects.filter(pk=antiga.pk).update(data_conversa=timezone.now() - timedelta(days=30))
+
+        response, _ = self._painel()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['proximasSessoes']), 5)
+        self.assertEqual(len(response.data['sessoesRecentes']), 5)
+        self.assertEqual(response.data['totalSessoes'], 15)
+        proxima = Sessao.objects.filter(data__gte=timezone.now()).order_by('data').first()
+        self.assertEqual(response.data['proximasSessoes'][0]['id'], proxima.pk)
+        self.assertEqual(response.data['proximaSessao'], proxima.data.isoformat())
+        self.assertEqual((response.data['totalConversas'], response.data['conversasEssaSemana']), (2, 1))
+        self.assertEqual(response.data['sentimentoMedio'], 'Negativo')
+
+        historico = self.client_paciente.get(response.data['historicoSessoes'])
+        self.assertEqual(historico.data['count'], 15)
+        self.assertEqual(len(historico.data['results']), 15)
+        self.assertIsNone(historico.data['next'])
+
+    def test_consultas_nao_dependem_do_numero_de_sessoes(self):
+        self._criar_sessoes(passadas=1, futuras=1)
+        _, com_2 = self._painel()
+        self._criar_sessoes(passadas=40, futuras=40)
+        _, com_82 = self._painel()
+        self.assertEqual(com_2, com_82)
+
+    def test_lista_de_sessoes_sem_limite_nao_e_paginada(self):
+        self._criar_sessoes(passadas=3, futuras=0)
+        response = self.client_paciente.get(reverse('usuarios:sessao-list'))
+        self.assertEqual(len(response.data), 3)
+        response = self.client_paciente.get(reverse('usuarios:sessao-list'), {'limite': 2, 'pagina': 2})
+        self.assertEqual((response.data['count'], len(response.data['results'])), (3, 1))
+
+
+class PainelAssincronoTests(TransactionTestCase):
+    # As consultas correm noutras threads, com ligações próprias: os dados têm de estar confirmados
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        perfil = Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+        Sessao.objects.create(terapeuta=self.terapeuta, paciente=perfil, data=timezone.now() + timedelta(days=2), duracao=timedelta(hours=1))
+        Conversa.objects.create(
+            usuario=self.paciente, mensagem_usuario="Olá", resposta_ia="...",
+            sentimento="Negativo", categoria_sentimento="Geral", intensidade_sentimento="Alta"
+        )
+        Notificacao.objects.create(usuario=self.terapeuta, tipo='alerta', assunto="Alerta", conteudo="...")
+
+    async def test_mesmos_dados_que_a_versao_sincrona(self):
+        for user, url, sincrono in (
+            (self.terapeuta, 'usuarios:painel_terapeuta_async', lambda: paineis.painel_terapeuta(self.terapeuta, 1, 50)),
+            (self.paciente, 'usuarios:painel_paciente_async', lambda: paineis.painel_paciente(self.paciente)),
+        ):
+            await self.async_client.aforce_login(user)
+            response = await self.async_client.get(reverse(url))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            esperado = json.loads(json.dumps(await sync_to_async(sincrono)(), cls=DjangoJSONEncoder))
+            self.assertEqual(response.json(), esperado)
+            self.assertEqual((await self.async_client.get(reverse(url)))['X-Cache'], 'HIT')
+
+    async def test_permissoes(self):
+        self.assertEqual((await self.async_client.get(reverse('usuarios:painel_terapeuta_async'))).status_code, 403)
+        await self.async_client.aforce_login(self.paciente)
+        self.assertEqual((await self.async_client.get(reverse('usuarios:painel_terapeuta_async'))).status_code, 403)
+        await self.async_client.aforce_login(self.terapeuta)
+        self.assertEqual((await self.async_client.get(reverse('usuarios:painel_paciente_async'))).status_code, 403)
+        response = await self.async_client.get(reverse('usuarios:painel_terapeuta_async'), {'limite': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_consultas_em_simultaneo_com_limite_por_pedido(self):
+        em_curso, maximo = 0, 0
+        trinco = threading.Lock()
+
+        def consulta():
+            nonlocal em_curso, maximo
+            with trinco:
+                em_curso += 1
+                maximo = max(maximo, em_curso)
+            time.sleep(0.05)
+            with trinco:
+                em_curso -= 1
+
+        etapas = [lambda r: {n: consulta for n in range(6)}]
+        with override_settings(PAINEL_CONSULTAS_CONCORRENTES=3):
+            await paineis._aexecutar(etapas, lambda r: r)
+        self.assertEqual(maximo, 3)
+        maximo = 0
+        with override_settings(PAINEL_CONSULTAS_CONCORRENTES=1):
+            await paineis._aexecutar(etapas, lambda r: r)
+        self.assertEqual(maximo, 1)
+
+
+class UtilizacaoTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta", first_name="Ana")
+        self.outro = Usuario.objects.create_user(email="o@example.com", password="Senha123!", tipo="terapeuta")
+        self.admin = Usuario.objects.create_superuser(email="admin@example.com", password="Senha123!")
+        paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        self.perfil = Paciente.objects.create(usuario=paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+
+        # Segunda-feira da semana passada, às 10h locais
+        hoje = timezone.localdate()
+        segunda = hoje - timedelta(days=hoje.weekday() + 7)
+        self.segunda = segunda
+        inicio = timezone.make_aware(datetime.combine(segunda, datetime.min.time())) + timedelta(hours=10)
+        for dia, estado, horas in ((0, 'concluida', 1), (1, 'concluida', 2), (2, 'cancelada', 1), (3, 'agendada', 1)):
+            Sessao.objects.create(terapeuta=self.terapeuta, paciente=self.perfil, data=inicio + timedelta(days=dia),
+                                  duracao=timedelta(hours=horas), status=estado)
+        Sessao.objects.create(terapeuta=self.outro, paciente=self.perfil, data=inicio, duracao=timedelta(minutes=30), status='concluida')
+
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.client_admin = APIClient()
+        self.client_admin.force_authenticate(user=self.admin)
+        self.url = reverse('usuarios:utilizacao')
+
+    def test_intervalo_que_acaba_hoje_na_clinica_nao_fica_um_dia_em_cache(self):
+        # 23h30 de 10/05 na clínica (America/Sao_Paulo), já 11/05 em UTC
+        agora = datetime(2024, 5, 11, 2, 30, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=agora), \
+                mock.patch.object(cache, 'set', wraps=cache.set) as guardar:
+            response = self.client_terapeuta.get(self.url, {'inicio': '2024-05-06', 'fim': '2024-05-10'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        [segundos] = [c.args[2] for c in guardar.call_args_list if c.args[0].startswith('usuarios:utilizacao:')]
+        self.assertEqual(segundos, UTILIZACAO_CACHE_SEGUNDOS)
+
+    def test_indicadores_do_terapeuta(self):
+        response = self.client_terapeuta.get(self.url, {'terapeuta': self.outro.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('clinica', response.data)
+        # Um terapeuta vê só a sua utilização, mesmo pedindo outro
+        [terapeuta] = response.data['terapeutas']
+        self.assertEqual((terapeuta['terapeuta'], terapeuta['nome']), (self.terapeuta.pk, 'Ana'))
+        self.assertEqual(terapeuta['totais'], {
+            'sessoes': 4, 'horasMarcadas': 4.0, 'horasRealizadas': 3.0,
+            'concluidas': 2, 'canceladas': 1, 'faltas': 1,
+            'taxaConclusao': 0.5, 'taxaCancelamento': 0.25, 'taxaFaltas': 0.25,
+        })
+        self.assertEqual([s['semana'] for s in terapeuta['semanas']], [self.segunda.isoformat()])
+
+    def test_clinica_para_administradores(self):
+        response = self.client_admin.get(self.url)
+        self.assertEqual(len(response.data['terapeutas']), 2)
+        self.assertEqual(response.data['clinica']['totais']['sessoes'], 5)
+        self.assertEqual(response.data['clinica']['totais']['horasRealizadas'], 3.5)
+
+        response = self.client_admin.get(self.url, {'terapeuta': self.outro.pk})
+        self.assertEqual([t['terapeuta'] for t in response.data['terapeutas']], [self.outro.pk])
+
+    def test_cache_invalidado_por_alteracao_de_sessao(self):
+        self.client_terapeuta.get(self.url)
+        with self.assertNumQueries(0):
+            self.client_terapeuta.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sessao = Sessao.objects.get(terapeuta=self.terapeuta, status='agendada')
+            sessao.status = 'concluida'
+            sessao.save()
+        response = self.client_terapeuta.get(self.url)
+        self.assertEqual(response.data['terapeutas'][0]['totais']['faltas'], 0)
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client_terapeuta.get(self.url, {'inicio': 'ontem'}).status_code, 400)
+        self.assertEqual(self.client_terapeuta.get(self.url, {'inicio': '2025-01-01', 'fim': '2024-01-01'}).status_code, 400)
+        paciente = APIClient()
+        paciente.force_authenticate(user=self.perfil.usuario)
+        self.assertEqual(paciente.get(self.url).status_code, 403)
+
+
+class LinhaDoTempoTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        self.perfil = Paciente.objects.create(usuario=self.paciente, nome_completo="Paciente A", terapeuta=self.terapeuta)
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.url = reverse('usuarios:paciente-linha-do-tempo', args=[self.paciente.pk])
+
+        # Uma entrada de cada tipo por hora, com duas na mesma hora para testar o desempate
+        base = timezone.now() - timedelta(days=1)
+        self.esperado = []
+        for hora in range(4):
+            quando = base + timedelta(hours=hora)
+            conversa = Conversa.objects.create(
+                usuario=self.paciente, mensagem_usuario=f"Olá {hora}", resposta_ia="...",
+                sentimento="Neutro", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+            )
+            Conversa.objects.filter(pk=conversa.pk).update(data_conversa=quando)
+            enviada = Mensagem.objects.create(remetente=self.paciente, destinatario=self.terapeuta, conteudo="Oi")
+            recebida = Mensagem.objects.create(remetente=self.terapeuta, destinatario=self.paciente, conteudo="Oi")
+            Mensagem.objects.filter(pk__in=[enviada.pk, recebida.pk]).update(data_envio=quando)
+            sessao = Sessao.objects.create(terapeuta=self.terapeuta, paciente=self.perfil, data=quando, duracao=timedelta(hours=1))
+            notificacao = Notificacao.objects.create(usuario=self.paciente, assunto="Aviso", conteudo="...", data_criacao=quando)
+            relatorio = Relatorio.objects.create(terapeuta=self.terapeuta, paciente=self.perfil, titulo="R", conteudo="...", rascunho=hora == 3)
+            Relatorio.objects.filter(pk=relatorio.pk).update(data_criacao=quando)
+            self.esperado += [
+                (quando, 'conversa', conversa.pk), (quando, 'mensagem', enviada.pk), (quando, 'mensagem', recebida.pk),
+                (quando, 'sessao', sessao.pk), (quando, 'notificacao', notificacao.pk), (quando, 'relatorio', relatorio.pk),
+            ]
+        self.esperado.sort(reverse=True)
+        # Outro paciente: não pode aparecer
+        outro = Usuario.objects.create_user(email="o@example.com", password="Senha123!", tipo="paciente")
+        Notificacao.objects.create(usuario=outro, assunto="Outro", conteudo="...")
+
+    def test_paginas_seguem_a_ordem_global_sem_repeticoes(self):
+        recebidas, parametros, paginas = [], {'limite': 5}, 0
+        while True:
+            response = self.client_terapeuta.get(self.url, parametros)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            recebidas += [(e['data'], e['tipo'], e['id']) for e in response.data]
+            paginas += 1
+            if 'X-Proximo-Cursor' not in response:
+                break
+            parametros['cursor'] = response['X-Proximo-Cursor']
+        self.assertEqual(recebidas, self.esperado)
+        self.assertEqual(paginas, 5)
+
+    def test_mensagem_para_si_proprio_aparece_uma_vez(self):
+        propria = Mensagem.objects.create(remetente=self.paciente, destinatario=self.paciente, conteudo="Lembrete")
+        Mensagem.objects.create(remetente=self.paciente, destinatario=self.terapeuta, conteudo="Depois")
+        response = self.client_terapeuta.get(self.url, {'tipos': 'mensagem', 'limite': 1})
+        self.assertEqual([e['id'] for e in response.data], [propria.pk + 1])
+        response = self.client_terapeuta.get(self.url, {'tipos': 'mensagem', 'limite': 1, 'cursor': response['X-Proximo-Cursor']})
+        self.assertEqual([e['id'] for e in response.data], [propria.pk])
+        response = self.client_terapeuta.get(self.url, {'tipos': 'mensagem', 'limite': 2, 'cursor': response['X-Proximo-Cursor']})
+        self.assertNotIn(propria.pk, [e['id'] for e in response.data])
+
+        ids = [e['id'] for e in self.client_terapeuta.get(self.url, {'tipos': 'mensagem', 'limite': 50}).data]
+        self.assertEqual(ids.count(propria.pk), 1)
+        self.assertEqual(len(ids), 10)
+
+    def test_consultas_limitadas_por_pagina(self):
+        # Uma consulta de visibilidade e uma por fluxo (mensagens: enviadas e recebidas)
+        primeira, consultas = _get_contando_consultas(self.client_terapeuta, self.url, {'limite': 3})
+        self.assertEqual(consultas, 7)
+        _, consultas = _get_contando_consultas(self.client_terapeuta, self.url, {'limite': 3, 'cursor': primeira['X-Proximo-Cursor']})
+        self.assertEqual(consultas, 7)
+
+    def test_tipos_e_rascunhos(self):
+        response = self.client_terapeuta.get(self.url, {'tipos': 'sessao,relatorio'})
+        self.assertEqual({e['tipo'] for e in response.data}, {'sessao', 'relatorio'})
+        self.assertEqual(len(response.data), 8)
+
+        cliente_paciente = APIClient()
+        cliente_paciente.force_authenticate(user=self.paciente)
+        response = cliente_paciente.get(self.url, {'tipos': 'relatorio'})
+        self.assertEqual(len(response.data), 3)
+
+        self.assertEqual(self.client_terapeuta.get(self.url, {'tipos': 'foto'}).status_code, 400)
+        self.assertEqual(self.client_terapeuta.get(self.url, {'cursor': 'x'}).status_code, 400)
+        outro_terapeuta = APIClient()
+        outro_terapeuta.force_authenticate(user=Usuario.objects.create_user(email="x@example.com", password="Senha123!", tipo="terapeuta"))
+        self.assertEqual(outro_terapeuta.get(self.url).status_code, 404)
+
+
+class ConsultasViewSetsTests(APITestCase):
+    """O número de consultas de cada lista e detalhe não depende do número de linhas."""
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.pacientes = 0
+        self._criar_pacientes(2)
+
+    def _criar_pacientes(self, quantidade):
+        """Pacientes do terapeuta, cada um com uma sessão, mensagens, um relatório e uma notificação."""
+        for _ in range(quantidade):
+            self.pacientes += 1
+            user = Usuario.objects.create_user(email=f"p{self.pacientes}@example.com", password="Senha123!", tipo="paciente")
+            perfil = Paciente.objects.create(usuario=user, nome_completo=f"Paciente {self.pacientes}", terapeuta=self.terapeuta)
+            Sessao.objects.create(terapeuta=self.terapeuta, paciente=perfil, data=timezone.now(), duracao=timedelta(hours=1))
+            Mensagem.objects.create(remetente=user, destinatario=self.terapeuta, conteudo="Oi")
+            Mensagem.objects.create(remetente=self.terapeuta, destinatario=user, conteudo="Olá")
+            Relatorio.objects.create(terapeuta=self.terapeuta, paciente=perfil, titulo="R", conteudo="...")
+            Notificacao.objects.create(usuario=self.terapeuta, assunto="Aviso", conteudo="...")
+        self.ultimo_paciente = user
+
+    def _urls(self):
+        # A consulta dos validadores do GET condicional (usuarios/condicionais.py) e a das linhas
+        yield reverse('usuarios:paciente-list'), 2
+        yield reverse('usuarios:sessao-list'), 2
+        yield reverse('usuarios:mensagem-list'), 2
+        yield reverse('usuarios:relatorio-list'), 2
+        yield reverse('usuarios:notificacao-list'), 2
+        yield reverse('usuarios:paciente-detail', args=[self.ultimo_paciente.pk]), 2
+        yield reverse('usuarios:sessao-detail', args=[Sessao.objects.latest('id').pk]), 2
+        yield reverse('usuarios:mensagem-detail', args=[Mensagem.objects.latest('id').pk]), 2
+        yield reverse('usuarios:relatorio-detail', args=[Relatorio.objects.latest('id').pk]), 2
+        yield reverse('usuarios:notificacao-detail', args=[Notificacao.objects.latest('id').pk]), 2
+
+    def test_consultas_do_terapeuta_fixas(self):
+        for crescer in (False, True):
+            if crescer:
+                self._criar_pacientes(10)
+            for url, esperadas in self._urls():
+                with self.subTest(url=url, linhas=self.pacientes):
+                    response, consultas = _get_contando_consultas(self.client_terapeuta, url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(consultas, esperadas)
+
+    def test_consultas_do_paciente_fixas(self):
+        cliente = APIClient()
+        cliente.force_authenticate(user=self.ultimo_paciente)
+        for url in ('paciente-list', 'sessao-list', 'mensagem-list', 'relatorio-list'):
+            with self.subTest(url=url):
+                response, consultas = _get_contando_consultas(cliente, reverse(f'usuarios:{url}'))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data), 2 if url == 'mensagem-list' else 1)
+                # Sem a consulta extra ao perfil de paciente (só a dos validadores e a das linhas)
+                self.assertEqual(consultas, 2)
+
+
+class LeituraRapidaTests(APITestCase):
+    """As listas pela leitura rápida devolvem o mesmo JSON, byte a byte, que os serializers."""
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(
+            email="t@example.com", password="Senha123!", tipo="terapeuta", first_name="João", last_name="Ávila",
+            data_nascimento=date(1980, 2, 29), foto_perfil="fotos_perfil/t.png", especialidade="TCC",
+        )
+        self.admin = Usuario.objects.create_superuser(email="a@example.com", password="Senha123!")
+        com_terapeuta = Usuario.objects.create_user(email="p1@example.com", password="Senha123!", tipo="paciente", data_nascimento=date(2001, 12, 31))
+        sem_terapeuta = Usuario.objects.create_user(email="p2@example.com", password="Senha123!", tipo="paciente", first_name="Só")
+        perfil = Paciente.objects.create(usuario=com_terapeuta, nome_completo="Paciente Ç", terapeuta=self.terapeuta, historico_medico="…")
+        Paciente.objects.create(usuario=sem_terapeuta, nome_completo="Sem terapeuta", data_nascimento=date(1999, 1, 1))
+        texto_longo = "Observação comprida, para ficar comprimida na coluna. " * 10
+        for dias in range(3):
+            Sessao.objects.create(
+                terapeuta=self.terapeuta, paciente=perfil,
+                data=timezone.now() + timedelta(days=dias, microseconds=123),
+                duracao=timedelta(days=dias, minutes=50, microseconds=7), observacoes=texto_longo if dias else "",
+            )
+            Relatorio.objects.create(terapeuta=self.terapeuta, paciente=perfil, titulo=f"R{dias}", conteudo=texto_longo, rascunho=dias == 2)
+        Mensagem.objects.create(remetente=com_terapeuta, destinatario=self.terapeuta, assunto="Olá", conteudo="“aspas”")
+        Notificacao.objects.create(usuario=self.terapeuta, assunto="Aviso", conteudo="...", link="/x")
+
+    def _comparar(self, usuario, nome, parametros=None):
+        cliente = APIClient()
+        cliente.force_authenticate(user=usuario)
+        url = reverse(f'usuarios:{nome}')
+        with override_settings(LEITURA_RAPIDA_LISTAS=False):
+            esperado = cliente.get(url, parametros)
+        with override_settings(LEITURA_RAPIDA_LISTAS=True):
+            rapido = cliente.get(url, parametros)
+        self.assertEqual(esperado.status_code, 200)
+        self.assertTrue(json.loads(esperado.content))
+        self.assertEqual(rapido.content, esperado.content)
+
+    def test_mesmo_json_que_os_serializers(self):
+        for usuario in (self.terapeuta, self.admin):
+            for nome in ('usuario-list', 'paciente-list', 'sessao-list', 'mensagem-list', 'relatorio-list', 'notificacao-list'):
+                with self.subTest(usuario=usuario.email, lista=nome):
+                    self._comparar(usuario, nome)
+
+    def test_mesmo_json_com_filtros_e_paginacao(self):
+        self._comparar(self.terapeuta, 'sessao-list', {'limite': 2, 'pagina': 2})
+        self._comparar(self.terapeuta, 'sessao-list', {'ordering': 'data'})
+        self._comparar(self.terapeuta, 'relatorio-list', {'search': 'R1'})
+        self._comparar(self.admin, 'usuario-list', {'search': 'João'})
+        with timezone.override('Asia/Kolkata'):
+            self._comparar(self.terapeuta, 'sessao-list')
+
+
+class JSONRapidoTests(APITestCase):
+    """O renderer e o parser com orjson dão o mesmo resultado que os do DRF."""
+    databases = '__all__'
+
+    def test_renderer_igual_ao_do_drf(self):
+        dados = {
+            'utc': datetime(2024, 1, 1, 12, 30, tzinfo=dt_timezone.utc),
+            'local': datetime(2024, 1, 1, 9, 30, 0, 4500, tzinfo=ZoneInfo('America/Sao_Paulo')),
+            'ingenua': datetime(2024, 1, 1), 'data': date(2024, 2, 29),
+            'duracao': timedelta(days=1, minutes=50, microseconds=7),
+            'decimal': Decimal('12.50'), 'uuid': UUID('12345678-1234-5678-1234-567812345678'),
+            'traduzivel': gettext_lazy('Sessão'), 'bytes': b'abc',
+            'texto': 'Ação “aspas”     </script>', 1: [None, True, 0.1, -3, 2 ** 63],
+            'aninhado': [{'a': (1, 2)}, []],
+        }
+        self.assertEqual(JSONRapidoRenderer().render(dados), JSONRenderer().render(dados))
+        # Inteiros com mais de 64 bits: o orjson recusa e o renderer do DRF responde
+        self.assertEqual(JSONRapidoRenderer().render({'n': 2 ** 70}), JSONRenderer().render({'n': 2 ** 70}))
+        self.assertEqual(
+            JSONRapidoRenderer().render(dados, 'application/json; indent=2'),
+            JSONRenderer().render(dados, 'application/json; indent=2'),
+        )
+        self.assertEqual(JSONRapidoRenderer().render(None), b'')
+
+    def test_parser_igual_ao_do_drf(self):
+        for corpo in ('{"a": [1, 2.5, null, "ção"]}', '[123456789012345678901234567890]', '[1e999]'):
+            with self.subTest(corpo=corpo):
+                self.assertEqual(
+                    JSONRapidoParser().parse(BytesIO(corpo.encode())), JSONParser().parse(BytesIO(corpo.encode())),
+                )
+        for corpo in (b'{"a": NaN}', b'{', b'', b'\xff'):
+            with self.subTest(corpo=corpo):
+                with self.assertRaises(ParseError) as rapido:
+                    JSONRapidoParser().parse(BytesIO(corpo))
+                with self.assertRaises(ParseError) as drf:
+                    JSONParser().parse(BytesIO(corpo))
+                self.assertEqual(str(rapido.exception), str(drf.exception))
+
+    def test_api_usa_o_renderer_e_o_parser(self):
+        terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        Paciente.objects.create(usuario=paciente, nome_completo="Paciente A", terapeuta=terapeuta)
+        cliente = APIClient()
+        cliente.force_authenticate(user=terapeuta)
+        response = cliente.post(
+            reverse('usuarios:sessao-list'),
+            json.dumps({'paciente_id': paciente.pk, 'data': '2030-01-01T10:00:00Z', 'duracao': '00:50:00'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.accepted_renderer.__class__.__name__, 'JSONRapidoRenderer')
+        self.assertEqual(response.data['duracao'], '00:50:00')
+
+
+def _desnormalizar(valor, incluidos, aninhados):
+    """Volta a aninhar os objetos de 'included' (inverso de normalizado.normalizar)."""
+    saida = dict(valor)
+    for nome, grupo, sub_aninhados in aninhados:
+        if saida.get(nome) is None:
+            continue
+        objeto = incluidos[grupo][str(saida[nome])] if grupo else saida[nome]
+        saida[nome] = _desnormalizar(objeto, incluidos, sub_aninhados)
+    return saida
+
+
+class FormatoNormalizadoTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.pacientes = []
+        for i in range(3):
+            user = Usuario.objects.create_user(email=f"p{i}@example.com", password="Senha123!", tipo="paciente")
+            perfil = Paciente.objects.create(usuario=user, nome_completo=f"Paciente {i}", terapeuta=self.terapeuta)
+            self.pacientes.append(perfil)
+            for dias in range(4):
+                Sessao.objects.create(terapeuta=self.terapeuta, paciente=perfil, data=timezone.now() + timedelta(days=dias), duracao=timedelta(hours=1))
+            Relatorio.objects.create(terapeuta=self.terapeuta, paciente=perfil, titulo="R", conteudo="...")
+            Mensagem.objects.create(remetente=user, destinatario=self.terapeuta, conteudo="Oi")
+            Notificacao.objects.create(usuario=self.terapeuta, assunto="Aviso", conteudo="...")
+
+    def test_mesmos_dados_que_o_formato_aninhado(self):
+        views = {
+            'usuario-list': UsuarioSerializer, 'paciente-list': PacienteSerializer, 'sessao-list': SessaoSerializer,
+            'mensagem-list': MensagemSerializer, 'relatorio-list': RelatorioSerializer, 'notificacao-list': NotificacaoSerializer,
+        }
+        for nome, serializer_class in views.items():
+            with self.subTest(lista=nome):
+                url = reverse(f'usuarios:{nome}')
+                aninhado = self.client_terapeuta.get(url)
+                normal = self.client_terapeuta.get(url, {'formato': 'normalizado'})
+                self.assertEqual(normal.status_code, 200)
+                corpo = json.loads(normal.content)
+                self.assertEqual(
+                    [_desnormalizar(linha, corpo['included'], normalizado.estrutura(serializer_class())) for linha in corpo['results']],
+                    json.loads(aninhado.content),
+                )
+                if nome != 'usuario-list':
+                    self.assertLess(len(normal.content), len(aninhado.content))
+
+    def test_campos_aninhados_escolhidos_mantem_o_id(self):
+        url = reverse('usuarios:sessao-list')
+        for leitura_rapida_ativa in (True, False):
+            with self.subTest(leitura_rapida=leitura_rapida_ativa), override_settings(LEITURA_RAPIDA_LISTAS=leitura_rapida_ativa):
+                response = self.client_terapeuta.get(url, {'formato': 'normalizado', 'fields': 'id,paciente.nome_completo,paciente.usuario.email'})
+                self.assertEqual(response.status_code, 200)
+                linha = response.data['results'][0]
+                self.assertEqual(set(linha), {'id', 'paciente'})
+                paciente = response.data['included']['pacientes'][str(linha['paciente'])]
+                self.assertEqual(set(paciente), {'id', 'nome_completo', 'usuario'})
+                self.assertEqual(set(response.data['included']['usuarios'][str(paciente['usuario'])]), {'id', 'email'})
+
+                response = self.client_terapeuta.get(url, {'formato': 'normalizado', 'exclude': 'paciente.id,terapeuta.id'})
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('id', response.data['included']['pacientes'][str(response.data['results'][0]['paciente'])])
+
+        # O formato aninhado continua a respeitar a seleção à letra
+        response = self.client_terapeuta.get(url, {'fields': 'id,paciente.nome_completo'})
+        self.assertEqual(set(response.data[0]['paciente']), {'nome_completo'})
+
+    def test_historico_normalizado_com_campos_do_utilizador(self):
+        paciente = self.pacientes[0].usuario
+        Conversa.objects.create(
+            usuario=paciente, mensagem_usuario="Olá", resposta_ia="...",
+            sentimento="Neutro", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+        )
+        cliente = APIClient()
+        cliente.force_authenticate(user=paciente)
+        response = cliente.get(reverse('ia:historico_api'), {'formato': 'normalizado', 'fields': 'id,usuario.email'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['usuario'], paciente.pk)
+        self.assertEqual(response.data['included']['usuarios'][str(paciente.pk)], {'id': paciente.pk, 'email': paciente.email})
+
+    def test_cada_objeto_incluido_uma_vez(self):
+        response = self.client_terapeuta.get(reverse('usuarios:sessao-list'), {'formato': 'normalizado'})
+        linha = response.data['results'][0]
+        self.assertEqual(linha['terapeuta'], self.terapeuta.pk)
+        incluidos = response.data['included']
+        self.assertEqual(set(incluidos['pacientes']), {str(p.pk) for p in self.pacientes})
+        self.assertEqual(set(incluidos['usuarios']), {str(self.terapeuta.pk)} | {str(p.pk) for p in self.pacientes})
+        paciente = incluidos['pacientes'][str(self.pacientes[0].pk)]
+        self.assertEqual((paciente['usuario'], paciente['terapeuta']), (self.pacientes[0].pk, self.terapeuta.pk))
+
+    def test_paginacao_e_formato_invalido(self):
+        response = self.client_terapeuta.get(reverse('usuarios:sessao-list'), {'formato': 'normalizado', 'limite': 5})
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIn('included', response.data)
+        self.assertEqual(self.client_terapeuta.get(reverse('usuarios:sessao-list'), {'formato': 'xml'}).status_code, 400)
+
+    def test_historico_da_ia(self):
+        paciente = self.pacientes[0].usuario
+        for i in range(3):
+            Conversa.objects.create(
+                usuario=paciente, mensagem_usuario=f"Olá {i}", resposta_ia="...",
+                sentimento="Neutro", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+            )
+        cliente = APIClient()
+        cliente.force_authenticate(user=paciente)
+        response = cliente.get(reverse('ia:historico_api'), {'formato': 'normalizado'})
+        self.assertEqual([c['usuario'] for c in response.data['results']], [paciente.pk] * 3)
+        self.assertEqual(list(response.data['included']['usuarios']), [str(paciente.pk)])
+        self.assertEqual(cliente.get(reverse('ia:historico_api'), {'formato': 'xml'}).status_code, 400)
+
+
+class CamposDinamicosTests(APITestCase):
+    """?fields=, ?exclude= e ?expand= nas listas e detalhes (core/serializers.py)."""
+    databases = '__all__'
+
+    def setUp(self):
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta", first_name="Ana")
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        for i in range(3):
+            user = Usuario.objects.create_user(email=f"p{i}@example.com", password="Senha123!", tipo="paciente")
+            perfil = Paciente.objects.create(usuario=user, nome_completo=f"Paciente {i}", terapeuta=self.terapeuta, historico_medico="Reservado")
+            Relatorio.objects.create(terapeuta=self.terapeuta, paciente=perfil, titulo=f"R{i}", conteudo="Conteúdo longo do relatório")
+            Sessao.objects.create(terapeuta=self.terapeuta, paciente=perfil, data=timezone.now(), duracao=timedelta(hours=1))
+        self.paciente = user
+
+    def _get(self, nome, parametros, *args):
+        return self.client_terapeuta.get(reverse(f'usuarios:{nome}', args=args), parametros)
+
+    def test_fields_com_campos_aninhados(self):
+        response = self._get('relatorio-list', {'fields': 'id,titulo,paciente.nome_completo'})
+        self.assertEqual(response.status_code, 200)
+        for linha in response.data:
+            self.assertEqual(set(linha), {'id', 'titulo', 'paciente'})
+            self.assertEqual(set(linha['paciente']), {'nome_completo'})
+
+    def test_exclude_e_expand(self):
+        response = self._get('relatorio-list', {'exclude': 'conteudo,paciente.historico_medico', 'expand': 'paciente'})
+        linha = response.data[0]
+        self.assertNotIn('conteudo', linha)
+        self.assertNotIn('historico_medico', linha['paciente'])
+        # O terapeuta não foi expandido: vem só o id, também dentro do paciente
+        self.assertEqual(linha['terapeuta'], self.terapeuta.pk)
+        self.assertEqual(linha['paciente']['terapeuta'], self.terapeuta.pk)
+        response = self._get('sessao-list', {'expand': 'paciente.terapeuta'})
+        self.assertEqual(response.data[0]['paciente']['terapeuta']['first_name'], "Ana")
+
+    def test_campo_desconhecido(self):
+        for parametros in ({'fields': 'id,inexistente'}, {'exclude': 'x.y'}, {'expand': 'nada'}):
+            with self.subTest(parametros=parametros):
+                self.assertEqual(self._get('relatorio-list', parametros).status_code, 400)
+
+    def test_colunas_lidas_so_as_pedidas(self):
+        url = reverse('usuarios:relatorio-list')
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client_terapeuta.get(url, {'fields': 'id,titulo', 'expand': ''})
+        self.assertEqual(response.status_code, 200)
+        # Os validadores do GET condicional e as linhas
+        self.assertEqual(len(consultas), 2)
+        for consulta in consultas:
+            self.assertNotIn('conteudo', consulta['sql'])
+            self.assertNotIn('historico_medico', consulta['sql'])
+            self.assertNotIn('JOIN', consulta['sql'])
+        _, contadas = _get_contando_consultas(self.client_terapeuta, url, {'exclude': 'conteudo'})
+        self.assertEqual(contadas, 2)
+
+    def test_mesmo_json_pela_leitura_rapida(self):
+        pedidos = (
+            ('relatorio-list', {'fields': 'id,titulo,paciente.nome_completo'}),
+            ('relatorio-list', {'exclude': 'conteudo', 'expand': 'paciente'}),
+            ('sessao-list', {'expand': 'paciente.terapeuta', 'ordering': 'data'}),
+            ('paciente-list', {'fields': 'id,idade,terapeuta.email'}),
+        )
+        for nome, parametros in pedidos:
+            with self.subTest(lista=nome, parametros=parametros):
+                with override_settings(LEITURA_RAPIDA_LISTAS=False):
+                    esperado = self._get(nome, parametros)
+                with override_settings(LEITURA_RAPIDA_LISTAS=True):
+                    rapido = self._get(nome, parametros)
+                self.assertEqual(esperado.status_code, 200)
+                self.assertEqual(rapido.content, esperado.content)
+
+    def test_detalhe_e_formato_normalizado(self):
+        response = self._get('paciente-detail', {'fields': 'id,nome_completo'}, self.paciente.pk)
+        self.assertEqual(response.data, {'id': self.paciente.pk, 'nome_completo': "Paciente 2"})
+        response = self._get('sessao-list', {'formato': 'normalizado', 'expand': 'paciente'})
+        self.assertEqual(response.data['results'][0]['terapeuta'], self.terapeuta.pk)
+        # Os utilizadores não expandidos já vêm como id e não entram em 'included'
+        self.assertEqual(set(response.data['included']), {'pacientes'})
+
+    def test_historico_da_ia(self):
+        Conversa.objects.create(
+            usuario=self.paciente, mensagem_usuario="Olá", resposta_ia="...",
+            sentimento="Neutro", categoria_sentimento="Geral", intensidade_sentimento="Baixa"
+        )
+        cliente = APIClient()
+        cliente.force_authenticate(user=self.paciente)
+        response = cliente.get(reverse('ia:historico_api'), {'fields': 'id,sentimento', 'limite': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data[0]), ['id', 'sentimento'])
+        self.assertEqual(cliente.get(reverse('ia:historico_api'), {'fields': 'nada'}).status_code, 400)
+
+
+class GetCondicionalTests(APITestCase):
+    """ETag e Last-Modified das leituras (usuarios/condicionais.py)."""
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.terapeuta = Usuario.objects.create_user(email="t@example.com", password="Senha123!", tipo="terapeuta")
+        self.client_terapeuta = APIClient()
+        self.client_terapeuta.force_authenticate(user=self.terapeuta)
+        self.user_paciente = Usuario.objects.create_user(email="p@example.com", password="Senha123!", tipo="paciente")
+        self.paciente = Paciente.objects.create(usuario=self.user_paciente, nome_completo="Paciente", terapeuta=self.terapeuta)
+        self.client_paciente = APIClient()
+        self.client_paciente.force_authenticate(user=self.user_paciente)
+        self.sessao = Sessao.objects.create(terapeuta=self.terapeuta, paciente=self.paciente, data=timezone.now(), duracao=timedelta(hours=1))
+        self.relatorio = Relatorio.objects.create(terapeuta=self.terapeuta, paciente=self.paciente, titulo="R", conteudo="...")
+
+    def _revalidar(self, cliente, url, anterior, parametros=None):
+        """GET condicional com a ETag da resposta anterior."""
+        return cliente.get(url, parametros, HTTP_IF_NONE_MATCH=anterior['ETag'])
+
+    def test_lista_sem_alteracoes_responde_304(self):
+        url = reverse('usuarios:sessao-list')
+        primeira = self.client_terapeuta.get(url)
+        self.assertEqual(primeira.status_code, 200)
+        self.assertTrue(primeira['ETag'].startswith('W/"'))
+        self.assertIn('private', primeira['Cache-Control'])
+        with ExitStack() as pilha:
+            contextos = [pilha.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            segunda = self._revalidar(self.client_terapeuta, url, primeira)
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda.content, b'')
+        self.assertEqual(segunda['ETag'], primeira['ETag'])
+        # Só a consulta dos validadores
+        self.assertEqual(sum(len(c) for c in contextos), 1)
+
+    def test_lista_sem_last_modified(self):
+        # Apagar uma sessão não faz avançar a data mais recente: a lista só é revalidada pela ETag
+        url = reverse('usuarios:sessao-list')
+        Sessao.objects.create(terapeuta=self.terapeuta, paciente=self.paciente, data=timezone.now(), duracao=timedelta(hours=1))
+        primeira = self.client_terapeuta.get(url)
+        self.assertNotIn('Last-Modified', primeira)
+        Sessao.objects.filter(pk=self.sessao.pk).delete()
+        response = self.client_terapeuta.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 3600))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        # O perfil continua com Last-Modified: o atualizado_em avança a cada alteração
+        perfil = self.client_paciente.get(reverse('usuarios:perfil'))
+        por_data = self.client_paciente.get(reverse('usuarios:perfil'), HTTP_IF_MODIFIED_SINCE=perfil['Last-Modified'])
+        self.assertEqual(por_data.status_code, 304)
+
+    def test_alteracoes_mudam_a_etag(self):
+        url = reverse('usuarios:sessao-list')
+        def alterar_paciente():
+            # Um objeto aninhado: o nome do paciente
+            self.paciente.nome_completo = "Outro"
+            self.paciente.save()
+
+        alteracoes = (
+            lambda: Sessao.objects.get(pk=self.sessao.pk).save(),
+            alterar_paciente,
+            lambda: Sessao.objects.create(terapeuta=self.terapeuta, paciente=self.paciente, data=timezone.now(), duracao=timedelta(hours=1)),
+            lambda: Sessao.objects.filter(pk=self.sessao.pk).delete(),
+        )
+        for alterar in alteracoes:
+            anterior = self.client_terapeuta.get(url)
+            alterar()
+            response = self._revalidar(self.client_terapeuta, url, anterior)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], anterior['ETag'])
+
+    def test_relatorio_editado_muda_a_etag(self):
+        url = reverse('usuarios:relatorio-detail', args=[self.relatorio.pk])
+        anterior = self.client_terapeuta.get(url)
+        self.relatorio.titulo = "Revisto"
+        self.relatorio.save()
+        response = self._revalidar(self.client_terapeuta, url, anterior)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['titulo'], "Revisto")
+
+    def test_etag_depende_dos_parametros_e_do_utilizador(self):
+        url = reverse('usuarios:sessao-list')
+        anterior = self.client_terapeuta.get(url)
+        self.assertEqual(self._revalidar(self.client_terapeuta, url, anterior, {'formato': 'normalizado'}).status_code, 200)
+        self.assertEqual(self._revalidar(self.client_paciente, url, anterior).status_code, 200)
+
+    def test_detalhe_inexistente_sem_validadores(self):
+        response = self.client_terapeuta.get(reverse('usuarios:sessao-detail', args=[999]), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+    def test_detalhe_com_id_mal_formado_responde_404(self):
+        for nome in ('usuarios:paciente-detail', 'usuarios:sessao-detail', 'usuarios:relatorio-detail'):
+            with self.subTest(url=nome):
+                response = self.client_terapeuta.get(reverse(nome, args=['abc']))
+                self.assertEqual(response.status_code, 404)
+                self.assertNotIn('ETag', response)
+
+    def test_perfil_e_meu_terapeuta(self):
+        for cliente, nome in ((self.client_paciente, 'usuarios:perfil'), (self.client_paciente, 'usuarios:meu_terapeuta')):
+            with self.subTest(url=nome):
+                anterior = cliente.get(reverse(nome))
+                self.assertEqual(anterior.status_code, 200)
+                self.assertEqual(self._revalidar(cliente, reverse(nome), anterior).status_code, 304)
+        anterior = self.client_paciente.get(reverse('usuarios:perfil'))
+        self.client_paciente.put(reverse('usuarios:perfil'), {'first_name': "Novo"}, format='json')
+        response = self._revalidar(self.client_paciente, reverse('usuarios:perfil'), anterior)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['first_name'], "Novo")
+        # O terapeuta mudou o seu perfil: o 'meu terapeuta' do paciente também muda
+        anterior = self.client_paciente.get(reverse('usuarios:meu_terapeuta'))
+        self.terapeuta.especialidade = "TCC"
+        self.terapeuta.save()
+        self.assertEqual(self._revalidar(self.client_paciente, reverse('usuarios:meu_terapeuta'), anterior).status_code, 200)
+
+    def test_painel_revalidado_pelas_versoes_do_cache(self):
+        url = reverse('usuarios:painel_terapeuta')
+        anterior = self.client_terapeuta.get(url)
+        self.assertEqual(anterior.status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._revalidar(self.client_terapeuta, url, anterior).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Sessao.objects.create(terapeuta=self.terapeuta, paciente=self.paciente, data=timezone.now(), duracao=timedelta(hours=1))
+        self.assertEqual(self._revalidar(self.client_terapeuta, url, anterior).status_code, 200)
+        # O painel de outro papel continua a ser recusado, mesmo com If-None-Match: *
+        self.assertEqual(self.client_paciente.get(url, HTTP_IF_NONE_MATCH='*').status_code, 403)
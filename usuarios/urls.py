@@ -5,7 +5,9 @@ from .views import (
     RelatorioViewSet, NotificacaoViewSet,
     csrf_token_view, login_api, logout_api, register_api,
     buscar_pacientes_api, meu_terapeuta,
-    PerfilAPIView, painel_terapeuta_api, painel_paciente_api, historico_api
+    PerfilAPIView, painel_terapeuta_api, painel_paciente_api, painel_metricas_api, historico_api,
+    painel_terapeuta_async, painel_paciente_async, utilizacao_api,
+    exportar_api
 )
 
 # Adicione esta linha para definir o app_name
@@ -33,7 +35,12 @@ urlpatterns = [
     path('meu-terapeuta/', meu_terapeuta, name='meu_terapeuta'),
     path('painel-terapeuta/', painel_terapeuta_api, name='painel_terapeuta'),
     path('painel-paciente/', painel_paciente_api, name='painel_paciente'),
+    path('painel-terapeuta-async/', painel_terapeuta_async, name='painel_terapeuta_async'),
+    path('painel-paciente-async/', painel_paciente_async, name='painel_paciente_async'),
+    path('painel-metricas/', painel_metricas_api, name='painel_metricas'),
     path('historico/', historico_api, name='historico'),
+    path('utilizacao/', utilizacao_api, name='utilizacao'),
+    path('exportar/', exportar_api, name='exportar'),
 
     # Inclui as rotas geradas pelo roteador por último
     # Isso criará URLs como /api/usuarios/usuarios/, /api/usuarios/pacientes/, etc.
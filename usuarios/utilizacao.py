@@ -0,0 +1,125 @@
+"""
+Utilização dos terapeutas por semana, para dimensionar a equipa.
+
+Tudo é agregado na base de dados: uma consulta agrupada por (terapeuta, semana)
+sobre Sessao, pelo índice (terapeuta, data), e os totais são somados a partir
+dessas linhas, sem carregar sessões para o Python.
+
+Por semana e no total do período:
+
+    sessoes            sessões marcadas (qualquer estado)
+    horasMarcadas      horas das sessões não canceladas
+    horasRealizadas    horas das sessões concluídas
+    concluidas, canceladas
+    faltas             sessões que já passaram e continuam 'agendada'
+    taxaConclusao      concluídas / sessões que já passaram
+    taxaCancelamento   canceladas / sessões
+    taxaFaltas         faltas / sessões que já passaram
+
+As taxas são None quando o denominador é zero.
+"""
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from .models import Sessao, Usuario
+
+CONTAGENS = ('sessoes', 'passadas', 'concluidas', 'canceladas', 'faltas')
+DURACOES = ('horasMarcadas', 'horasRealizadas')
+
+
+def _taxa(parte, total):
+    return round(parte / total, 4) if total else None
+
+
+def _indicadores(soma):
+    """Converte uma soma de contagens e durações nos indicadores publicados."""
+    return {
+        'sessoes': soma['sessoes'],
+        'horasMarcadas': round(soma['horasMarcadas'].total_seconds() / 3600, 2),
+        'horasRealizadas': round(soma['horasRealizadas'].total_seconds() / 3600, 2),
+        'concluidas': soma['concluidas'],
+        'canceladas': soma['canceladas'],
+        'faltas': soma['faltas'],
+        'taxaConclusao': _taxa(soma['concluidas'], soma['passadas']),
+        'taxaCancelamento': _taxa(soma['canceladas'], soma['sessoes']),
+        'taxaFaltas': _taxa(soma['faltas'], soma['passadas']),
+    }
+
+
+def _vazia():
+    return {**{c: 0 for c in CONTAGENS}, **{d: timedelta() for d in DURACOES}}
+
+
+def _somar(soma, linha):
+    for campo in CONTAGENS + DURACOES:
+        soma[campo] += linha[campo]
+
+
+def calcular(inicio, fim, terapeuta_id=None):
+    """
+    Utilização entre as datas inicio e fim (inclusive), de um terapeuta ou, sem
+    terapeuta_id, de todos, com o total da clínica em 'clinica'.
+    """
+    fuso = ZoneInfo(settings.TIME_ZONE)
+    agora = timezone.now()
+    sessoes = Sessao.objects.filter(
+        data__gte=datetime.combine(inicio, time.min, tzinfo=fuso),
+        data__lt=datetime.combine(fim + timedelta(days=1), time.min, tzinfo=fuso),
+    )
+    if terapeuta_id is not None:
+        sessoes = sessoes.filter(terapeuta_id=terapeuta_id)
+
+    linhas = (
+        sessoes
+        .order_by()
+        .annotate(semana=TruncWeek('data', tzinfo=fuso))
+        .values('terapeuta_id', 'semana')
+        .annotate(
+            sessoes=Count('id'),
+            passadas=Count('id', filter=Q(data__lt=agora)),
+            concluidas=Count('id', filter=Q(status='concluida')),
+            canceladas=Count('id', filter=Q(status='cancelada')),
+            faltas=Count('id', filter=Q(status='agendada', data__lt=agora)),
+            horasMarcadas=Sum('duracao', filter=~Q(status='cancelada'), default=timedelta()),
+            horasRealizadas=Sum('duracao', filter=Q(status='concluida'), default=timedelta()),
+        )
+        .order_by('terapeuta_id', 'semana')
+    )
+
+    por_terapeuta, clinica_semanas, clinica = {}, {}, _vazia()
+    for linha in linhas:
+        semana = linha['semana'].date().isoformat()
+        terapeuta = por_terapeuta.setdefault(linha['terapeuta_id'], {'semanas': [], 'soma': _vazia()})
+        terapeuta['semanas'].append({'semana': semana, **_indicadores(linha)})
+        _somar(terapeuta['soma'], linha)
+        _somar(clinica_semanas.setdefault(semana, _vazia()), linha)
+        _somar(clinica, linha)
+
+    nomes = {
+        u['id']: f"{u['first_name']} {u['last_name']}".strip() or u['email']
+        for u in Usuario.objects.filter(pk__in=list(por_terapeuta)).values('id', 'first_name', 'last_name', 'email')
+    }
+    dados = {
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'terapeutas': [
+            {
+                'terapeuta': terapeuta_id_,
+                'nome': nomes.get(terapeuta_id_, ''),
+                'totais': _indicadores(valores['soma']),
+                'semanas': valores['semanas'],
+            }
+            for terapeuta_id_, valores in por_terapeuta.items()
+        ],
+    }
+    if terapeuta_id is None:
+        dados['clinica'] = {
+            'totais': _indicadores(clinica),
+            'semanas': [{'semana': semana, **_indicadores(soma)} for semana, soma in sorted(clinica_semanas.items())],
+        }
+    return dados
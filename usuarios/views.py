@@ -1,16 +1,28 @@
 import json
 from datetime import date, timedelta
+from functools import partial
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
 from django.contrib.auth import login, logout, authenticate, get_user_model
 from django.views.decorators.csrf import ensure_csrf_cookie
-from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.db.models import Q, Count, Avg
 from rest_framework import viewsets, permissions, filters, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
 from rest_framework.exceptions import PermissionDenied, ValidationError
-from .models import Usuario, Paciente, Sessao, Mensagem, Relatorio, Notificacao
+from .models import Usuario, Paciente, Sessao, Mensagem, Relatorio, Notificacao, EstatisticasPaciente
+from . import condicionais, exportacao, leitura_rapida, linha_do_tempo, normalizado, paineis, utilizacao
+from core.renderers import JSONRapidoRenderer
+from core.serializers import campos_pedidos
 # Importa o modelo Conversa do app 'ia' para uso nos dashboards
 from ia.models import Conversa
 from django.utils import timezone
@@ -104,7 +116,107 @@ def logout_api(request):
 
 # --- ViewSets para Modelos ---
 
-class UsuarioViewSet(viewsets.ReadOnlyModelViewSet):
+class CamposPedidosMixin:
+    """
+    ?fields=, ?exclude= e ?expand= (separados por vírgulas) no list() e no
+    retrieve(): passam ao serializer (core/serializers.py) e ao queryset, que só
+    lê as colunas e só faz os JOINs de que esses campos precisam.
+    """
+    acoes_com_campos_pedidos = ('list', 'retrieve')
+
+    def campos_pedidos(self):
+        if self.action not in self.acoes_com_campos_pedidos:
+            return {}
+        return campos_pedidos(self.request.query_params)
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **self.campos_pedidos(), **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        campos = self.campos_pedidos()
+        if campos:
+            queryset = leitura_rapida.compilar(self.get_serializer_class(), **campos).carregar(queryset)
+        return queryset
+
+
+class ListaRapidaMixin(CamposPedidosMixin):
+    """
+    list() pela leitura rápida (usuarios/leitura_rapida.py) quando
+    settings.LEITURA_RAPIDA_LISTAS está ativo: as linhas vêm de .values_list()
+    e o JSON é o mesmo do serializer. Filtros, ordenação e paginação da view
+    aplicam-se como no list() do DRF.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.LEITURA_RAPIDA_LISTAS:
+            return super().list(request, *args, **kwargs)
+        plano = leitura_rapida.compilar(self.get_serializer_class(), **self.campos_pedidos())
+        linhas = plano.consulta(self.filter_queryset(self.get_queryset()))
+        pagina = self.paginate_queryset(linhas)
+        if pagina is not None:
+            return self.get_paginated_response(plano.serializar(pagina, self.get_serializer_context()))
+        return Response(plano.serializar(linhas, self.get_serializer_context()))
+
+
+class FormatoNormalizadoMixin:
+    """
+    list() com ?formato=normalizado: os utilizadores e pacientes aninhados passam
+    a ids nas linhas e vêm uma só vez em 'included' (ver usuarios/normalizado.py).
+    """
+
+    def campos_pedidos(self):
+        campos = super().campos_pedidos()
+        if campos and self.request.query_params.get('formato') == 'normalizado':
+            # Os objetos em 'included' são indexados pelo id, mesmo que ?fields= não o peça
+            campos = normalizado.com_ids(campos, self.get_serializer_class())
+        return campos
+
+    def list(self, request, *args, **kwargs):
+        try:
+            formato = normalizado.formato_pedido(request)
+        except ValueError:
+            return Response(
+                {'detail': f"formato deve ser um de: {', '.join(normalizado.FORMATOS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        response = super().list(request, *args, **kwargs)
+        if formato == 'normalizado' and response.status_code == status.HTTP_200_OK:
+            response.data = normalizado.corpo(response.data, self.get_serializer())
+        return response
+
+
+class GetCondicionalMixin:
+    """
+    list() e retrieve() com ETag e Last-Modified (usuarios/condicionais.py): os
+    validadores vêm de uma consulta de agregados sobre o queryset filtrado e as
+    relações que o serializer lê, e um pedido condicional que corresponda
+    recebe 304 sem ler nem serializar as linhas.
+    """
+
+    def _validadores(self, queryset):
+        plano = leitura_rapida.compilar(self.get_serializer_class(), **self.campos_pedidos())
+        return condicionais.validadores(queryset, plano.relacoes)
+
+    def list(self, request, *args, **kwargs):
+        validadores = self._validadores(self.filter_queryset(self.get_queryset()))
+        return condicionais.responder(request, validadores, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            validadores = self._validadores(queryset)
+        except (TypeError, ValueError, DjangoValidationError):
+            # Id mal formado ('abc' numa chave inteira): o mesmo 404 que o get_object() dá
+            validadores = None
+        if not validadores or not validadores[0][0]:
+            # Não encontrado: o 404 de sempre, sem validadores
+            return super().retrieve(request, *args, **kwargs)
+        return condicionais.responder(request, validadores, partial(super().retrieve, request, *args, **kwargs))
+
+
+class UsuarioViewSet(GetCondicionalMixin, FormatoNormalizadoMixin, ListaRapidaMixin, viewsets.ReadOnlyModelViewSet):
     """
     API para listar e recuperar detalhes de utilizadores.
     Apenas leitura, para proteger dados sensíveis.
@@ -116,7 +228,25 @@ class UsuarioViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['first_name', 'last_name', 'email', 'username']
 
 
-class PacienteViewSet(viewsets.ModelViewSet):
+# Colunas de Usuario que o UsuarioSerializer não publica; ficam fora dos JOINs
+COLUNAS_USUARIO_NAO_PUBLICADAS = ('password', 'last_login', 'is_superuser', 'is_staff', 'is_active')
+
+
+def _com_usuarios(queryset, *caminhos):
+    """
+    Junta à consulta os utilizadores que o serializer aninha (select_related),
+    sem as colunas que ele não publica, para a lista não fazer uma consulta por linha.
+    """
+    return queryset.select_related(*caminhos).defer(
+        *(f'{caminho}__{coluna}' for caminho in caminhos for coluna in COLUNAS_USUARIO_NAO_PUBLICADAS)
+    )
+
+
+LINHA_DO_TEMPO_LIMITE_PADRAO = 50
+LINHA_DO_TEMPO_LIMITE_MAXIMO = 200
+
+
+class PacienteViewSet(GetCondicionalMixin, FormatoNormalizadoMixin, ListaRapidaMixin, viewsets.ModelViewSet):
     """
     API para CRUD de pacientes.
     Permite que terapeutas criem/gerenciem os seus pacientes
@@ -130,15 +260,81 @@ class PacienteViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.tipo == 'terapeuta':
-            return Paciente.objects.filter(terapeuta=user)
+            pacientes = Paciente.objects.filter(terapeuta=user)
         elif user.tipo == 'paciente':
-            paciente_perfil = Paciente.objects.filter(usuario=user).first()
-            if paciente_perfil:
-                return Paciente.objects.filter(usuario=user)
-            return Paciente.objects.none()
+            pacientes = Paciente.objects.filter(usuario=user)
         elif user.is_superuser:
-            return Paciente.objects.all()
-        return Paciente.objects.none()
+            pacientes = Paciente.objects.all()
+        else:
+            return Paciente.objects.none()
+        return _com_usuarios(pacientes, 'usuario', 'terapeuta')
+
+    @action(detail=True, methods=['get'])
+    def estatisticas(self, request, pk=None):
+        """
+        Instantâneo mais recente das estatísticas do paciente (comando
+        calcular_estatisticas). Uma só consulta pelo índice (paciente, -criado_em),
+        com o filtro de visibilidade como subconsulta.
+        """
+        try:
+            paciente_id = int(pk)
+        except ValueError:
+            return Response({'detail': 'Paciente não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+        instantaneo = (
+            EstatisticasPaciente.objects
+            .filter(paciente_id=paciente_id, paciente__in=Paciente.objects.visiveis_para(request.user))
+            .order_by('-criado_em')
+            .first()
+        )
+        if instantaneo is None:
+            return Response({'detail': 'Ainda não há estatísticas calculadas para este paciente.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'paciente': instantaneo.paciente_id,
+            'periodoInicio': instantaneo.periodo_inicio,
+            'periodoFim': instantaneo.periodo_fim,
+            'calculadoEm': instantaneo.criado_em,
+            **instantaneo.dados,
+        })
+
+    @action(detail=True, methods=['get'], url_path='linha-do-tempo')
+    def linha_do_tempo(self, request, pk=None):
+        """
+        Conversas, mensagens, sessões, relatórios e notificações do paciente num
+        único feed, do mais recente para o mais antigo (ver usuarios/linha_do_tempo.py).
+        Parâmetros: limite (padrão 50, máximo 200), cursor (cabeçalho
+        X-Proximo-Cursor da página anterior) e tipos (ex.: "conversa,sessao").
+        """
+        try:
+            paciente_id = int(pk)
+            limite = max(1, min(int(request.GET.get('limite', LINHA_DO_TEMPO_LIMITE_PADRAO)), LINHA_DO_TEMPO_LIMITE_MAXIMO))
+        except ValueError:
+            return Response({'detail': 'Os parâmetros devem ser números inteiros.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not Paciente.objects.visiveis_para(request.user).filter(pk=paciente_id).exists():
+            return Response({'detail': 'Paciente não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+
+        tipos = [t for t in request.GET.get('tipos', '').split(',') if t]
+        invalidos = [t for t in tipos if t not in linha_do_tempo.FONTES]
+        if invalidos:
+            return Response({'detail': f"Tipos inválidos: {', '.join(invalidos)}. Valores permitidos: {', '.join(linha_do_tempo.FONTES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        cursor = None
+        if request.GET.get('cursor'):
+            try:
+                cursor = linha_do_tempo.decodificar_cursor(request.GET['cursor'])
+            except ValueError:
+                return Response({'detail': 'Cursor inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        pagina, proximo = linha_do_tempo.entradas(
+            paciente_id, limite, cursor=cursor, tipos=tipos or None,
+            # Os pacientes não veem os rascunhos de relatório
+            incluir_rascunhos=request.user.tipo != 'paciente',
+        )
+        response = Response(pagina)
+        if proximo:
+            parametros = request.GET.copy()
+            parametros['cursor'] = proximo
+            response['X-Proximo-Cursor'] = proximo
+            response['Link'] = f'<{request.build_absolute_uri(request.path)}?{parametros.urlencode()}>; rel="next"'
+        return response
 
     def perform_create(self, serializer):
         """
@@ -273,14 +469,27 @@ class PacienteViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Você não tem permissão para deletar este paciente.")
 
 
-class SessaoViewSet(viewsets.ModelViewSet):
+class PaginacaoOpcional(PageNumberPagination):
+    """
+    Paginação ativada apenas quando o pedido traz o parâmetro limite (máximo
+    200), com a página no parâmetro pagina; sem limite a lista vem completa.
+    """
+    page_size = None
+    page_size_query_param = 'limite'
+    page_query_param = 'pagina'
+    max_page_size = 200
+
+
+class SessaoViewSet(GetCondicionalMixin, FormatoNormalizadoMixin, ListaRapidaMixin, viewsets.ModelViewSet):
     """
     API para CRUD de sessões.
     Terapeutas gerenciam as suas sessões.
     Pacientes podem ver e deletar as suas próprias sessões.
+    A lista pode ser paginada com ?limite=N&pagina=P (ver PaginacaoOpcional).
     """
     serializer_class = SessaoSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PaginacaoOpcional
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['data']
     ordering = ['-data']
@@ -291,15 +500,15 @@ class SessaoViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if user.tipo == 'terapeuta':
-            return Sessao.objects.filter(terapeuta=user)
+            sessoes = Sessao.objects.filter(terapeuta=user)
         elif user.tipo == 'paciente':
-            paciente_perfil = Paciente.objects.filter(usuario=user).first()
-            if paciente_perfil:
-                return Sessao.objects.filter(paciente=paciente_perfil)
-            return Sessao.objects.none()
+            # O id do perfil de paciente é o id do utilizador
+            sessoes = Sessao.objects.filter(paciente_id=user.pk)
         elif user.is_superuser: # Superusuários podem ver todas as sessões
-            return Sessao.objects.all()
-        return Sessao.objects.none()
+            sessoes = Sessao.objects.all()
+        else:
+            return Sessao.objects.none()
+        return _com_usuarios(sessoes, 'terapeuta', 'paciente__usuario', 'paciente__terapeuta')
 
     def perform_create(self, serializer):
         """
@@ -449,7 +658,7 @@ class SessaoViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Não tem permissão para deletar esta sessão.")
 
 
-class MensagemViewSet(viewsets.ModelViewSet):
+class MensagemViewSet(GetCondicionalMixin, FormatoNormalizadoMixin, ListaRapidaMixin, viewsets.ModelViewSet):
     """
     API para CRUD de mensagens.
     Permite que utilizadores (terapeutas e pacientes) visualizem as suas mensagens.
@@ -466,8 +675,11 @@ class MensagemViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if user.is_superuser:
-            return Mensagem.objects.all()
-        return Mensagem.objects.filter(Q(remetente=user) | Q(destinatario=user)).distinct()
+            mensagens = Mensagem.objects.all()
+        else:
+            # Sem JOINs no filtro, cada mensagem aparece uma só vez: não é preciso DISTINCT
+            mensagens = Mensagem.objects.filter(Q(remetente=user) | Q(destinatario=user))
+        return _com_usuarios(mensagens, 'remetente', 'destinatario')
 
     def perform_create(self, serializer):
         print("Iniciando perform_create para Mensagem.")
@@ -518,7 +730,7 @@ class MensagemViewSet(viewsets.ModelViewSet):
         instance.delete()
 
 
-class RelatorioViewSet(viewsets.ModelViewSet):
+class RelatorioViewSet(GetCondicionalMixin, FormatoNormalizadoMixin, ListaRapidaMixin, viewsets.ModelViewSet):
     """
     API para CRUD de relatórios.
     Terapeutas gerenciam os seus relatórios.
@@ -529,7 +741,8 @@ class RelatorioViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.OrderingFilter, filters.SearchFilter]
     ordering_fields = ['data_criacao']
     ordering = ['-data_criacao']
-    search_fields = ['titulo', 'conteudo']
+    # O conteúdo é guardado comprimido; a pesquisa de texto integral está em /api/ia/busca/
+    search_fields = ['titulo']
 
     def get_queryset(self):
         """
@@ -538,15 +751,14 @@ class RelatorioViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if user.tipo == 'terapeuta':
-            return Relatorio.objects.filter(terapeuta=user)
+            relatorios = Relatorio.objects.filter(terapeuta=user)
         elif user.tipo == 'paciente':
-            paciente_perfil = Paciente.objects.filter(usuario=user).first()
-            if paciente_perfil:
-                return Relatorio.objects.filter(paciente=paciente_perfil)
-            return Relatorio.objects.none()
+            relatorios = Relatorio.objects.filter(paciente_id=user.pk, rascunho=False)
         elif user.is_superuser:
-            return Relatorio.objects.all()
-        return Relatorio.objects.none()
+            relatorios = Relatorio.objects.all()
+        else:
+            return Relatorio.objects.none()
+        return _com_usuarios(relatorios, 'terapeuta', 'paciente__usuario', 'paciente__terapeuta')
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -606,20 +818,67 @@ def buscar_pacientes_api(request):
     else:
         pacientes_queryset = Paciente.objects.none()
 
-    pacientes = pacientes_queryset.filter(
-        nome_completo__icontains=termo
-    ).values('pk', 'nome_completo', 'usuario__id', 'usuario__first_name', 'usuario__last_name')[:10]
-    
-    formatted_pacientes = []
-    for p in pacientes:
-        formatted_pacientes.append({
-            'id': p['pk'],
-            'nome_completo': p['nome_completo'],
-            'usuario_id': p['usuario__id'],
-            'usuario_nome_completo': f"{p['usuario__first_name']} {p['usuario__last_name']}".strip()
-        })
+    pacientes_queryset = pacientes_queryset.filter(nome_completo__icontains=termo)
 
-    return Response(formatted_pacientes)
+    def gerar():
+        pacientes = pacientes_queryset.values('pk', 'nome_completo', 'usuario__id', 'usuario__first_name', 'usuario__last_name')[:10]
+
+        formatted_pacientes = []
+        for p in pacientes:
+            formatted_pacientes.append({
+                'id': p['pk'],
+                'nome_completo': p['nome_completo'],
+                'usuario_id': p['usuario__id'],
+                'usuario_nome_completo': f"{p['usuario__first_name']} {p['usuario__last_name']}".strip()
+            })
+        return Response(formatted_pacientes)
+
+    return condicionais.responder(request, condicionais.validadores(pacientes_queryset, ('usuario',)), gerar)
+
+
+UTILIZACAO_SEMANAS_PADRAO = 12
+UTILIZACAO_DIAS_MAXIMO = 366
+UTILIZACAO_CACHE_SEGUNDOS = 300
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def utilizacao_api(request):
+    """
+    Utilização por terapeuta e semana: horas marcadas e realizadas, taxas de
+    conclusão, cancelamento e faltas (ver usuarios/utilizacao.py).
+    Parâmetros: inicio e fim (YYYY-MM-DD, padrão: as últimas 12 semanas) e,
+    para administradores, terapeuta (sem ele, todos os terapeutas e o total da
+    clínica). Um terapeuta vê apenas a sua própria utilização.
+    """
+    user = request.user
+    if user.tipo != 'terapeuta' and not user.is_superuser:
+        return Response({'detail': 'Acesso negado. Apenas terapeutas e administradores podem ver a utilização.'}, status=status.HTTP_403_FORBIDDEN)
+
+    hoje = timezone.localdate()
+    try:
+        fim = date.fromisoformat(request.GET['fim']) if request.GET.get('fim') else hoje
+        inicio = (
+            date.fromisoformat(request.GET['inicio']) if request.GET.get('inicio')
+            else fim - timedelta(days=fim.weekday(), weeks=UTILIZACAO_SEMANAS_PADRAO - 1)
+        )
+        terapeuta_id = int(request.GET['terapeuta']) if request.GET.get('terapeuta') else None
+    except ValueError:
+        return Response({'detail': 'Parâmetros inválidos. Use datas no formato YYYY-MM-DD e um terapeuta inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+    if inicio > fim or (fim - inicio).days >= UTILIZACAO_DIAS_MAXIMO:
+        return Response({'detail': f'Intervalo de datas inválido (máximo de {UTILIZACAO_DIAS_MAXIMO} dias).'}, status=status.HTTP_400_BAD_REQUEST)
+    if not user.is_superuser:
+        terapeuta_id = user.pk
+
+    # A versão muda com cada sessão guardada do terapeuta (ou de qualquer um, para 'todos'),
+    # pelos sinais de usuarios/signals.py; as faltas mudam também com a hora
+    versao = paineis.versao(terapeuta_id)
+    chave_cache = f"usuarios:utilizacao:{terapeuta_id or 'todos'}:{inicio.isoformat()}:{fim.isoformat()}:{versao}"
+    dados = cache.get(chave_cache)
+    if dados is None:
+        dados = utilizacao.calcular(inicio, fim, terapeuta_id)
+        cache.set(chave_cache, dados, UTILIZACAO_CACHE_SEGUNDOS if fim >= hoje else 24 * 3600)
+    return Response(dados)
 
 
 @api_view(['GET'])
@@ -633,25 +892,92 @@ def meu_terapeuta(request):
     if user.tipo != 'paciente' and not user.is_superuser:
         return Response({'detail': 'Acesso negado. Apenas pacientes podem buscar o seu terapeuta.'}, status=status.HTTP_403_FORBIDDEN)
 
-    paciente_perfil = Paciente.objects.filter(usuario=user).first()
-    if not paciente_perfil:
-        return Response({'detail': 'Perfil de paciente não encontrado para este utilizador.'}, status=status.HTTP_404_NOT_FOUND)
+    def gerar():
+        paciente_perfil = Paciente.objects.filter(usuario=user).select_related('terapeuta').first()
+        if not paciente_perfil:
+            return Response({'detail': 'Perfil de paciente não encontrado para este utilizador.'}, status=status.HTTP_404_NOT_FOUND)
 
-    if not paciente_perfil.terapeuta:
-        return Response({'detail': 'Nenhum terapeuta associado a este paciente.'}, status=status.HTTP_404_NOT_FOUND)
+        if not paciente_perfil.terapeuta:
+            return Response({'detail': 'Nenhum terapeuta associado a este paciente.'}, status=status.HTTP_404_NOT_FOUND)
 
-    terapeuta_data = UsuarioSerializer(paciente_perfil.terapeuta).data
-    return Response(terapeuta_data, status=status.HTTP_200_OK)
+        terapeuta_data = UsuarioSerializer(paciente_perfil.terapeuta).data
+        return Response(terapeuta_data, status=status.HTTP_200_OK)
+
+    validadores = condicionais.validadores(Paciente.objects.filter(usuario=user), ('terapeuta',))
+    return condicionais.responder(request, validadores, gerar)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRapidoRenderer, exportacao.RenderizadorDireto])
+def exportar_api(request):
+    """
+    Exportação em streaming (NDJSON ou CSV) de conversas, sessões e relatórios
+    de um paciente ou de toda a carteira do terapeuta.
+    Parâmetros: formato (ndjson|csv), tipos (ex.: "conversa,sessao"), paciente,
+    cursor (retoma após a linha com esse cursor), gzip=1 (comprime em gzip) e
+    incluir_arquivo=1 (inclui as conversas arquivadas, ver ia/arquivo.py).
+    """
+    user = request.user
+    if user.tipo != 'terapeuta' and not user.is_superuser:
+        return Response({'detail': 'Acesso negado. Apenas terapeutas e administradores podem exportar dados.'}, status=status.HTTP_403_FORBIDDEN)
+
+    formato = request.GET.get('formato', 'ndjson')
+    if formato not in exportacao.FORMATOS:
+        return Response({'detail': f"Formato inválido. Valores permitidos: {', '.join(exportacao.FORMATOS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+    pedidos = [t for t in request.GET.get('tipos', '').split(',') if t]
+    invalidos = [t for t in pedidos if t not in exportacao.FONTES]
+    if invalidos:
+        return Response({'detail': f"Tipos inválidos: {', '.join(invalidos)}. Valores permitidos: {', '.join(exportacao.FONTES)}."}, status=status.HTTP_400_BAD_REQUEST)
+    tipos = [t for t in exportacao.FONTES if not pedidos or t in pedidos]
+    if formato == 'csv' and len(tipos) != 1:
+        return Response({'detail': 'A exportação em CSV aceita um único tipo (parâmetro tipos).'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Subconsulta em vez de lista: a de um administrador teria todos os pacientes em cada bloco
+    pacientes = Paciente.objects.visiveis_para(user).values('pk')
+    if request.GET.get('paciente'):
+        try:
+            paciente_id = int(request.GET['paciente'])
+        except ValueError:
+            return Response({'detail': 'O parâmetro paciente deve ser um número inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not pacientes.filter(pk=paciente_id).exists():
+            return Response({'detail': 'Paciente não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+        pacientes = [paciente_id]
+
+    cursor = None
+    if request.GET.get('cursor'):
+        try:
+            cursor = exportacao.decodificar_cursor(request.GET['cursor'])
+        except ValueError:
+            cursor = None
+        if cursor is None or cursor[0] not in tipos:
+            return Response({'detail': 'Cursor inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    comprimir = request.GET.get('gzip') in ('1', 'true')
+    incluir_arquivo = request.GET.get('incluir_arquivo') in ('1', 'true')
+    # Sob ASGI, um iterador síncrono seria lido inteiro para a memória antes do envio
+    gerar = exportacao.gerar_exportacao_assincrona if isinstance(request._request, ASGIRequest) else exportacao.gerar_exportacao
+    response = StreamingHttpResponse(
+        gerar(tipos, pacientes, formato, cursor, comprimir, incluir_arquivo),
+        content_type='application/gzip' if comprimir else f"{exportacao.FORMATOS[formato]}; charset=utf-8",
+    )
+    nome = f"exportacao-{timezone.now():%Y%m%d-%H%M%S}.{formato}" + ('.gz' if comprimir else '')
+    response['Content-Disposition'] = f'attachment; filename="{nome}"'
+    return response
 
 
 class PerfilAPIView(APIView):
     """
     API para visualizar e atualizar o perfil do utilizador autenticado.
+    O GET responde com 304 a pedidos condicionais (usuarios/condicionais.py).
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        return Response(UsuarioSerializer(request.user).data)
+        # O utilizador já foi lido pela autenticação: os validadores não custam consultas
+        validadores = ((request.user.pk, request.user.atualizado_em), request.user.atualizado_em)
+        return condicionais.responder(request, validadores, lambda: Response(UsuarioSerializer(request.user).data))
 
     def put(self, request):
         serializer = UsuarioSerializer(request.user, data=request.data, partial=True)
@@ -668,76 +994,29 @@ def painel_terapeuta_api(request):
     API para obter dados do painel do terapeuta.
     Retorna os dados do terapeuta autenticado e uma lista dos seus pacientes.
     Apenas terapeutas e superutilizadores podem aceder.
+
+    A lista de pacientes ativos (com pelo menos uma conversa com a IA) vem da
+    última atividade mantida em EstadoRiscoPaciente, da mais recente para a
+    mais antiga, e é paginada: parâmetros pagina (padrão 1) e limite (padrão 50,
+    máximo 200). O painel é servido do cache enquanto nada mudar (ver
+    usuarios/paineis.py); o cabeçalho X-Cache indica HIT, MISS ou STALE. Um
+    pedido condicional com a versão em dia recebe 304 (usuarios/condicionais.py).
     """
     user = request.user
     if user.tipo != 'terapeuta' and not user.is_superuser:
         return Response({'detail': 'Acesso negado. Apenas terapeutas e administradores podem aceder a este painel.'}, status=status.HTTP_403_FORBIDDEN)
 
-    terapeuta_data = UsuarioSerializer(user).data
-    
-    if user.tipo == 'terapeuta':
-        total_pacientes = Paciente.objects.filter(terapeuta=user).count()
-        pacientes_do_terapeuta_usuario_ids = Paciente.objects.filter(terapeuta=user).values_list('usuario__id', flat=True)
-    elif user.is_superuser:
-        total_pacientes = Paciente.objects.all().count()
-        pacientes_do_terapeuta_usuario_ids = Paciente.objects.all().values_list('usuario__id', flat=True)
-    else:
-        total_pacientes = 0
-        pacientes_do_terapeuta_usuario_ids = []
-
-    hoje = date.today()
-    conversas_hoje = Conversa.objects.filter(
-        usuario__id__in=pacientes_do_terapeuta_usuario_ids,
-        data_conversa__date=hoje
-    ).count()
-
-    if user.tipo == 'terapeuta':
-        sessoes_pendentes = Sessao.objects.filter(
-            terapeuta=user,
-            data__date__gte=hoje,
-            status='agendada'
-        ).count()
-    elif user.is_superuser:
-        sessoes_pendentes = Sessao.objects.filter(
-            data__date__gte=hoje,
-            status='agendada'
-        ).count()
-    else:
-        sessoes_pendentes = 0
-
-    alertas_urgentes = 0 # Esta lógica pode ser expandida com base nas suas necessidades
+    try:
+        pagina = max(1, int(request.GET.get('pagina', 1)))
+        limite = max(1, min(int(request.GET.get('limite', paineis.PAINEL_LIMITE_PADRAO)), paineis.PAINEL_LIMITE_MAXIMO))
+    except ValueError:
+        return Response({'detail': 'Os parâmetros pagina e limite devem ser números inteiros.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    pacientes_ativos_data = []
-    if user.tipo == 'terapeuta':
-        pacientes_ativos_queryset = Paciente.objects.filter(terapeuta=user)
-    elif user.is_superuser:
-        pacientes_ativos_queryset = Paciente.objects.all()
-    else:
-        pacientes_ativos_queryset = Paciente.objects.none()
-
-    for paciente_perfil in pacientes_ativos_queryset:
-        ultima_conversa = Conversa.objects.filter(usuario=paciente_perfil.usuario).order_by('-data_conversa').first()
-        if ultima_conversa:
-            pacientes_ativos_data.append({
-                'id': paciente_perfil.pk,
-                'nome': paciente_perfil.nome_completo,
-                'ultimaConversa': ultima_conversa.data_conversa.isoformat(),
-                'sentimento': ultima_conversa.sentimento
-            })
-    
-    notificacoes_terapeuta = Notificacao.objects.filter(usuario=user).order_by('-data_criacao')[:5]
-    alertas_data = NotificacaoSerializer(notificacoes_terapeuta, many=True).data
+    def gerar():
+        dados, estado = paineis.em_cache(user, 'terapeuta', (pagina, limite), lambda: paineis.painel_terapeuta(user, pagina, limite))
+        return Response(dados, headers={'X-Cache': estado})
 
-    return Response({
-        'terapeuta': terapeuta_data,
-        'totalPacientes': total_pacientes,
-        'conversasHoje': conversas_hoje,
-        'sessoesPendentes': sessoes_pendentes,
-        'alertasUrgentes': alertas_urgentes,
-        'pacientesAtivos': pacientes_ativos_data,
-        'alertas': alertas_data,
-        'detail': 'Dados do painel do terapeuta retornados com sucesso.'
-    })
+    return condicionais.responder(request, condicionais.validadores_do_painel(user), gerar)
 
 
 @api_view(['GET'])
@@ -747,46 +1026,87 @@ def painel_paciente_api(request):
     API para obter dados do painel do paciente.
     Retorna os dados do paciente autenticado e as suas sessões.
     Apenas pacientes e superutilizadores podem aceder.
+    Servido do cache enquanto nada mudar, como o painel do terapeuta.
     """
     user = request.user
     if user.tipo != 'paciente' and not user.is_superuser:
         return Response({'detail': 'Acesso negado. Apenas pacientes e administradores podem aceder a este painel.'}, status=status.HTTP_403_FORBIDDEN)
 
-    paciente_perfil = Paciente.objects.filter(usuario=user).first()
-    if not paciente_perfil:
-        return Response({'detail': 'Perfil de paciente não encontrado para este utilizador.'}, status=status.HTTP_404_NOT_FOUND)
+    def gerar():
+        dados, estado = paineis.em_cache(user, 'paciente', (), lambda: paineis.painel_paciente(user))
+        if dados is None:
+            return Response({'detail': 'Perfil de paciente não encontrado para este utilizador.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(dados, headers={'X-Cache': estado})
 
-    paciente_data = PacienteSerializer(paciente_perfil).data
-    
-    sessoes = Sessao.objects.filter(paciente=paciente_perfil).order_by('-data')
-    sessoes_data = SessaoSerializer(sessoes, many=True).data
+    return condicionais.responder(request, condicionais.validadores_do_painel(user), gerar)
 
-    # --- LÓGICA PARA O DASHBOARD DO PACIENTE ---
-    total_conversas = Conversa.objects.filter(usuario=user).count()
-    
-    hoje = date.today()
-    inicio_semana = hoje - timedelta(days=hoje.weekday())
-    conversas_essa_semana = Conversa.objects.filter(
-        usuario=user,
-        data_conversa__date__gte=inicio_semana,
-        data_conversa__date__lte=hoje
-    ).count()
-
-    ultima_conversa_sentimento = Conversa.objects.filter(usuario=user).order_by('-data_conversa').first()
-    sentimento_medio = ultima_conversa_sentimento.sentimento if ultima_conversa_sentimento else 'N/A'
-    
-    proxima_sessao = Sessao.objects.filter(paciente=paciente_perfil, data__date__gte=hoje).order_by('data').first()
-    proxima_sessao_data = proxima_sessao.data.isoformat() if proxima_sessao else None
 
-    return Response({
-        'paciente_perfil': paciente_data,
-        'totalConversas': total_conversas,
-        'conversasEssaSemana': conversas_essa_semana,
-        'sentimentoMedio': sentimento_medio,
-        'proximaSessao': proxima_sessao_data,
-        'sessoes': sessoes_data,
-        'detail': 'Dados do painel do paciente retornados com sucesso.'
-    })
+# Versões assíncronas dos painéis, para o servidor ASGI (core/asgi.py). São views
+# Django e não do DRF (que não tem views assíncronas): a sessão é lida com
+# request.auser(). Com o cache em falha, as consultas independentes de cada painel
+# correm em simultâneo (paineis.apainel_terapeuta e paineis.apainel_paciente).
+async def _utilizador_autenticado(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None, JsonResponse({'detail': 'As credenciais de autenticação não foram fornecidas.'}, status=status.HTTP_403_FORBIDDEN)
+    return user, None
+
+
+def _painel_condicional(request, user, gerar):
+    return condicionais.responder(request, condicionais.validadores_do_painel(user), gerar, user=user)
+
+
+@require_GET
+async def painel_terapeuta_async(request):
+    """Como painel_terapeuta_api, com as consultas em simultâneo."""
+    user, erro = await _utilizador_autenticado(request)
+    if erro:
+        return erro
+    if user.tipo != 'terapeuta' and not user.is_superuser:
+        return JsonResponse({'detail': 'Acesso negado. Apenas terapeutas e administradores podem aceder a este painel.'}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        pagina = max(1, int(request.GET.get('pagina', 1)))
+        limite = max(1, min(int(request.GET.get('limite', paineis.PAINEL_LIMITE_PADRAO)), paineis.PAINEL_LIMITE_MAXIMO))
+    except ValueError:
+        return JsonResponse({'detail': 'Os parâmetros pagina e limite devem ser números inteiros.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    construir = async_to_sync(partial(paineis.apainel_terapeuta, user, pagina, limite))
+
+    def gerar():
+        dados, estado = paineis.em_cache(user, 'terapeuta', (pagina, limite), construir)
+        return JsonResponse(dados, headers={'X-Cache': estado})
+
+    return await sync_to_async(_painel_condicional)(request, user, gerar)
+
+
+@require_GET
+async def painel_paciente_async(request):
+    """Como painel_paciente_api, com as consultas em simultâneo."""
+    user, erro = await _utilizador_autenticado(request)
+    if erro:
+        return erro
+    if user.tipo != 'paciente' and not user.is_superuser:
+        return JsonResponse({'detail': 'Acesso negado. Apenas pacientes e administradores podem aceder a este painel.'}, status=status.HTTP_403_FORBIDDEN)
+
+    construir = async_to_sync(partial(paineis.apainel_paciente, user))
+
+    def gerar():
+        dados, estado = paineis.em_cache(user, 'paciente', (), construir)
+        if dados is None:
+            return JsonResponse({'detail': 'Perfil de paciente não encontrado para este utilizador.'}, status=status.HTTP_404_NOT_FOUND)
+        return JsonResponse(dados, headers={'X-Cache': estado})
+
+    return await sync_to_async(_painel_condicional)(request, user, gerar)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def painel_metricas_api(request):
+    """Acertos e falhas do cache dos painéis (apenas superutilizadores)."""
+    if not request.user.is_superuser:
+        return Response({'detail': 'Acesso negado.'}, status=status.HTTP_403_FORBIDDEN)
+    return Response(paineis.metricas.totais())
 
 
 @api_view(['GET'])
@@ -799,7 +1119,7 @@ def historico_api(request):
     return Response({'detail': 'Esta API de histórico está agora na app IA.'}, status=status.HTTP_404_NOT_FOUND)
 
 
-class NotificacaoViewSet(viewsets.ModelViewSet):
+class NotificacaoViewSet(GetCondicionalMixin, FormatoNormalizadoMixin, ListaRapidaMixin, viewsets.ModelViewSet):
     """
     API para CRUD de notificações.
     Permite que utilizadores (terapeutas e pacientes) visualizem e gerenciem as suas notificações.
@@ -818,8 +1138,10 @@ class NotificacaoViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if user.is_superuser:
-            return Notificacao.objects.all()
-        return Notificacao.objects.filter(usuario=user)
+            notificacoes = Notificacao.objects.all()
+        else:
+            notificacoes = Notificacao.objects.filter(usuario=user)
+        return _com_usuarios(notificacoes, 'usuario')
 
     def perform_create(self, serializer):
         """